@@ -0,0 +1,144 @@
+"""
+增量处理的记录（清单）：输出目录中的 .manifest-<脚本名>.json 记录每个输入的大小、修改时间、
+内容哈希及其生成的输出，再次运行时只处理新增或变化的输入。
+
+脚本版本取脚本及其直接导入的同目录模块（如 point_cloud_io、directory_runner）的源码哈希，
+所以修改这些共用模块中的任意一个，都会让导入它的每个脚本下次运行时全部重新处理；
+只想沿用已有输出时不要改动共用模块，或者先确认改动不影响输出。
+
+多个输入可能对应同一个输出（如 transfer_data 按文件名前 6 个字符命名输出），
+删除输出前会确认它没有被其他仍然存在的输入使用。
+"""
+import hashlib
+import inspect
+import json
+import os
+import sys
+
+import io_scheduler
+from point_cloud_cache import file_digest
+
+
+def _script_files(func):
+    """func 所在脚本及其直接导入的同目录模块的源文件"""
+    module = sys.modules[func.__module__]
+    script = os.path.abspath(module.__file__)
+    root = os.path.dirname(script)
+    files = {script}
+    for value in vars(module).values():
+        dep = value if inspect.ismodule(value) else sys.modules.get(getattr(value, '__module__', None))
+        path = getattr(dep, '__file__', None)
+        if path and os.path.dirname(os.path.abspath(path)) == root:
+            files.add(os.path.abspath(path))
+    return script, sorted(files)
+
+
+def code_version(func):
+    """返回 (脚本名, 源码哈希)。脚本或它导入的本仓库模块有任何改动，哈希都会变化"""
+    script, files = _script_files(func)
+    digest = hashlib.blake2b(digest_size=16)
+    for path in files:
+        with open(path, 'rb') as f:
+            digest.update(os.path.basename(path).encode() + b'\0' + f.read())
+    return os.path.splitext(os.path.basename(script))[0], digest.hexdigest()
+
+
+class Manifest:
+    """
+    记录输出目录中每个输入文件的 路径、大小、修改时间、内容哈希 及其生成的输出文件，
+    连同脚本版本和参数一起保存在 output_dir/.manifest-<脚本名>.json。
+    再次运行时只处理新增或变化的输入，并删除已不存在的输入对应的输出。
+    """
+
+    def __init__(self, output_dir, params=None, force=False):
+        self.output_dir = output_dir
+        self.params = params or {}
+        self.force = force
+        self.path = None
+        self.header = None
+        self.entries = {}
+
+    def select(self, func, tasks):
+        """返回需要重新处理的任务，tasks 为 [(输入文件路径, args, 输出文件列表)]"""
+        script, version = code_version(func)
+        self.path = os.path.join(self.output_dir, f".manifest-{script}.json")
+        self.header = {'script': script, 'version': version, 'params': self.params}
+        try:
+            with open(self.path) as f:
+                old = json.load(f)
+        except (OSError, ValueError):
+            old = {}
+        entries = old.get('entries', {})
+        # 脚本、参数改变或指定 --force 时全部重新处理，但已删除输入的清理照常进行
+        reuse = not self.force and old.get('header') == self.header
+
+        # 只清理输入文件已不存在的记录：多个输入目录共用一个输出目录时，
+        # 本次没有处理但仍然存在的输入（其他目录的文件）的输出保持不动
+        current = {os.path.abspath(task[0]) for task in tasks}
+        stale = [key for key in set(entries) - current if not os.path.exists(key)]
+        outputs = {path for key in stale for path in entries.pop(key)['outputs']}
+        if outputs:
+            # 多个输入对应同一个输出时，仍被其他输入使用的输出保留
+            claimed = {path for entry in entries.values() for path in entry['outputs']}
+            claimed.update(os.path.abspath(path) for task in tasks for path in task[2])
+            _remove_files(outputs - claimed)
+        removed = len(stale)
+        self.entries = entries
+
+        todo = [task for task in tasks
+                if not (reuse and self._unchanged(os.path.abspath(task[0])))]
+        print(f"增量处理：{len(tasks) - len(todo)} 个文件未变化已跳过，"
+              f"清理 {removed} 个已删除输入的输出")
+        return todo
+
+    def _unchanged(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        try:
+            st = os.stat(key)
+        except OSError:
+            return False
+        if st.st_size != entry['size'] or not all(os.path.exists(p) for p in entry['outputs']):
+            return False
+        if st.st_mtime_ns != entry['mtime_ns']:
+            # 只有修改时间变化（如被复制、touch）时再比较内容哈希
+            if file_digest(key) != entry['digest']:
+                return False
+            entry['mtime_ns'] = st.st_mtime_ns
+        return True
+
+    def record(self, input_path, outputs):
+        """记录处理成功的输入；上次生成而这次没有生成的输出一并删除"""
+        key = os.path.abspath(input_path)
+        outputs = [os.path.abspath(p) for p in outputs if os.path.exists(p)]
+        old = self.entries.get(key)
+        dropped = set(old['outputs']) - set(outputs) if old is not None else set()
+        if dropped:
+            _remove_files(dropped - {path for other, entry in self.entries.items() if other != key
+                                     for path in entry['outputs']})
+        st = os.stat(key)
+        # 预读时已经算过内容哈希的输入不必再读一遍
+        digest = io_scheduler.known_digest(key, st) or file_digest(key)
+        self.entries[key] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                             'digest': digest, 'outputs': outputs}
+
+    def forget(self, input_path):
+        """处理失败的输入不保留记录，下次运行重新处理"""
+        self.entries.pop(os.path.abspath(input_path), None)
+
+    def save(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'header': self.header, 'entries': self.entries}, f,
+                      ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
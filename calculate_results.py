@@ -1,13 +1,26 @@
+"""
+解析训练日志 run.log，输出最佳测试准确率所在轮次的汇总，并绘制损失和准确率曲线
+
+默认读取整个日志并显示曲线。训练进行中需要反复查看进度时使用 --follow：
+解析到的各轮结果和读到的字节位置保存在检查点文件中，之后只解析新追加的行，
+每隔 --interval 秒更新一次汇总和曲线图片。日志被截断或重新创建（内容与检查点
+记录的开头不同，或换了文件而旧文件已不在同一文件夹中）时从头重新解析；
+日志被改名轮转（旧文件仍在同一文件夹中）时先读完旧文件剩余的部分，再从新文件的开头继续。
+日志中缺少的轮次在曲线上留空，汇总只统计出现过的轮次。
+
+命令行：
+    python calculate_results.py [--log run.log] [--output curves.png | --no-plot]
+    python calculate_results.py --follow [--log run.log] [--interval 10] [--output curves.png]
+                                [--checkpoint run.log.progress.json]
+"""
+
+import argparse
+import hashlib
+import json
+import os
 import re
-import matplotlib.pyplot as plt
+import time
 
-# 初始化存储列表
-train_losses = []
-train_accs = []
-test_losses = []
-test_accs = []
-test_ious = []
-time_costs = []
 
 # 正则表达式模式
 train_pattern = re.compile(
@@ -17,79 +30,333 @@ test_pattern = re.compile(
     r'Test (\d+), loss: ([\d.]+), test acc: ([\d.]+), test avg acc: ([\d.]+), IoU: ([\d.]+), time: ([\d.]+) s'
 )
 
-# 读取日志文件
-with open('run.log', 'r') as f:
-    for line in f:
-        line = line.strip()
-        # 处理训练数据
-        train_match = train_pattern.match(line)
-        if train_match:
-            epoch = int(train_match.group(1))
-            loss = float(train_match.group(2))
-            acc = float(train_match.group(3))
-            # 动态扩展列表长度以适应epoch编号
-            if epoch >= len(train_losses):
-                train_losses.extend([None] * (epoch - len(train_losses) + 1))
-                train_accs.extend([None] * (epoch - len(train_accs) + 1))
-            train_losses[epoch] = loss
-            train_accs[epoch] = acc
-        # 处理测试数据
-        test_match = test_pattern.match(line)
-        if test_match:
-            epoch = int(test_match.group(1))
-            loss = float(test_match.group(2))
-            acc = float(test_match.group(3))
-            iou = float(test_match.group(5))
-            time = float(test_match.group(6))
-            # 动态扩展列表长度以适应epoch编号
-            if epoch >= len(test_losses):
-                test_losses.extend([None] * (epoch - len(test_losses) + 1))
-                test_accs.extend([None] * (epoch - len(test_accs) + 1))
-                test_ious.extend([None] * (epoch - len(test_ious) + 1))
-                time_costs.extend([None] * (epoch - len(time_costs) + 1))
-            test_losses[epoch] = loss
-            test_accs[epoch] = acc
-            test_ious[epoch] = iou
-            time_costs[epoch] = time
-
-# 计算总训练时间
-total_time = sum(time_costs)
-
-# 找到最佳测试准确率的epoch
-max_test_acc = max(test_accs)
-best_epoch = test_accs.index(max_test_acc)
-best_train_acc = train_accs[best_epoch]
-best_test_iou = test_ious[best_epoch]
-
-# 打印结果
-print(f"最佳测试准确率出现在轮次 {best_epoch}:")
-print(f"测试准确率: {max_test_acc:.4f}")
-print(f"训练准确率: {best_train_acc:.4f}")
-print(f"测试IoU: {best_test_iou:.4f}")
-print(f"总训练时长: {total_time:.2f} 秒")
-
-# 创建子图
-plt.figure(figsize=(18, 8))
-
-# 绘制损失曲线
-plt.subplot(1, 2, 1)
-plt.plot(train_losses, label='Train Loss', color='blue', linewidth=1)
-plt.plot(test_losses, label='Test Loss', color='red', linewidth=1)
-plt.xlabel('Epoch', fontsize=14)
-plt.ylabel('Loss', fontsize=14)
-plt.title('Loss Curve', fontsize=16)
-plt.legend()
-plt.grid(True, linestyle='--', alpha=0.7)
-
-# 绘制准确率曲线
-plt.subplot(1, 2, 2)
-plt.plot(train_accs, label='Train Accuracy', color='green', linewidth=1)
-plt.plot(test_accs, label='Test Accuracy', color='orange', linewidth=1)
-plt.xlabel('Epoch', fontsize=14)
-plt.ylabel('Accuracy', fontsize=14)
-plt.title('Accuracy Curve', fontsize=16)
-plt.legend()
-plt.grid(True, linestyle='--', alpha=0.7)
-
-plt.tight_layout()
-plt.show()
\ No newline at end of file
+# 检查点记录日志开头这么多字节的哈希，用来识别日志被截断后重新写入
+HEAD_SIZE = 1024
+CHECKPOINT_VERSION = 1
+
+
+class TrainingLog:
+    """
+    日志中解析出的各轮结果：train[轮次] = (loss, acc)，test[轮次] = (loss, acc, IoU, 耗时)。
+    同一轮次出现多次时以最后一次为准。
+    """
+
+    def __init__(self, train=None, test=None):
+        self.train = dict(train or {})
+        self.test = dict(test or {})
+
+    def feed(self, lines):
+        """解析若干行，返回匹配的行数"""
+        matched = 0
+        for line in lines:
+            line = line.strip()
+            # 处理训练数据
+            train_match = train_pattern.match(line)
+            if train_match:
+                epoch = int(train_match.group(1))
+                self.train[epoch] = (float(train_match.group(2)), float(train_match.group(3)))
+                matched += 1
+                continue
+            # 处理测试数据
+            test_match = test_pattern.match(line)
+            if test_match:
+                epoch = int(test_match.group(1))
+                self.test[epoch] = (float(test_match.group(2)), float(test_match.group(3)),
+                                    float(test_match.group(5)), float(test_match.group(6)))
+                matched += 1
+        return matched
+
+    def series(self):
+        """
+        按轮次编号展开的列表（与原来动态扩展的列表相同），缺少的轮次为 None：
+        {'train_losses', 'train_accs', 'test_losses', 'test_accs', 'test_ious', 'time_costs'}
+        """
+        def expand(records, index):
+            values = [None] * (max(records) + 1 if records else 0)
+            for epoch, record in records.items():
+                values[epoch] = record[index]
+            return values
+
+        return {
+            'train_losses': expand(self.train, 0),
+            'train_accs': expand(self.train, 1),
+            'test_losses': expand(self.test, 0),
+            'test_accs': expand(self.test, 1),
+            'test_ious': expand(self.test, 2),
+            'time_costs': expand(self.test, 3),
+        }
+
+    def to_dict(self):
+        # JSON 的键只能是字符串
+        return {'train': {str(k): v for k, v in self.train.items()},
+                'test': {str(k): v for k, v in self.test.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls({int(k): tuple(v) for k, v in data['train'].items()},
+                   {int(k): tuple(v) for k, v in data['test'].items()})
+
+
+def summarize(log):
+    """
+    汇总最佳测试准确率所在的轮次，返回字典；还没有测试结果时返回 None。
+    准确率相同时取最早的轮次；缺少的轮次不参与统计，并列在 'missing_epochs' 中。
+    """
+    if not log.test:
+        return None
+    best_epoch = min(log.test, key=lambda epoch: (-log.test[epoch][1], epoch))
+    last_epoch = max(max(log.test), max(log.train, default=0))
+    train = log.train.get(best_epoch)
+    return {
+        'best_epoch': best_epoch,
+        'test_acc': log.test[best_epoch][1],
+        'train_acc': None if train is None else train[1],
+        'test_iou': log.test[best_epoch][2],
+        'total_time': sum(record[3] for record in log.test.values()),
+        'epochs': len(log.test),
+        'missing_epochs': [epoch for epoch in range(last_epoch + 1) if epoch not in log.test],
+    }
+
+
+def _format_value(value, spec):
+    return "缺失" if value is None else format(value, spec)
+
+
+def print_summary(summary):
+    """打印结果"""
+    if summary is None:
+        print("日志中还没有测试结果")
+        return
+    print(f"最佳测试准确率出现在轮次 {summary['best_epoch']}:")
+    print(f"测试准确率: {summary['test_acc']:.4f}")
+    print(f"训练准确率: {_format_value(summary['train_acc'], '.4f')}")
+    print(f"测试IoU: {summary['test_iou']:.4f}")
+    print(f"总训练时长: {summary['total_time']:.2f} 秒")
+    missing = summary['missing_epochs']
+    if missing:
+        shown = ', '.join(str(epoch) for epoch in missing[:10])
+        if len(missing) > 10:
+            shown += ', ...'
+        print(f"日志中缺少 {len(missing)} 个轮次的测试结果: {shown}")
+
+
+def read_log(log_path):
+    """读取并解析整个日志文件"""
+    log = TrainingLog()
+    with open(log_path, 'r') as f:
+        log.feed(f)
+    return log
+
+
+def _nan(values):
+    # None 转为 NaN，曲线在缺少的轮次处断开
+    return [float('nan') if v is None else v for v in values]
+
+
+class CurvePlot:
+    """损失和准确率曲线。图和线条只创建一次，之后每次更新只替换数据。"""
+
+    def __init__(self):
+        # matplotlib 加载较慢，只在需要画图时导入
+        import matplotlib.pyplot as plt
+
+        # 创建子图
+        self.fig = plt.figure(figsize=(18, 8))
+
+        # 绘制损失曲线
+        self.loss_ax = plt.subplot(1, 2, 1)
+        self.train_loss, = plt.plot([], label='Train Loss', color='blue', linewidth=1)
+        self.test_loss, = plt.plot([], label='Test Loss', color='red', linewidth=1)
+        plt.xlabel('Epoch', fontsize=14)
+        plt.ylabel('Loss', fontsize=14)
+        plt.title('Loss Curve', fontsize=16)
+        plt.legend()
+        plt.grid(True, linestyle='--', alpha=0.7)
+
+        # 绘制准确率曲线
+        self.acc_ax = plt.subplot(1, 2, 2)
+        self.train_acc, = plt.plot([], label='Train Accuracy', color='green', linewidth=1)
+        self.test_acc, = plt.plot([], label='Test Accuracy', color='orange', linewidth=1)
+        plt.xlabel('Epoch', fontsize=14)
+        plt.ylabel('Accuracy', fontsize=14)
+        plt.title('Accuracy Curve', fontsize=16)
+        plt.legend()
+        plt.grid(True, linestyle='--', alpha=0.7)
+
+    def update(self, log):
+        series = log.series()
+        for line, key in ((self.train_loss, 'train_losses'), (self.test_loss, 'test_losses'),
+                          (self.train_acc, 'train_accs'), (self.test_acc, 'test_accs')):
+            values = _nan(series[key])
+            line.set_data(range(len(values)), values)
+        for ax in (self.loss_ax, self.acc_ax):
+            ax.relim()
+            ax.autoscale_view()
+        self.fig.tight_layout()
+
+    def save(self, output_path):
+        """先写临时文件再改名，查看图片的程序不会读到写了一半的文件"""
+        root, ext = os.path.splitext(output_path)
+        tmp = f"{root}.tmp-{os.getpid()}{ext}"
+        self.fig.savefig(tmp)
+        os.replace(tmp, output_path)
+
+    def show(self):
+        import matplotlib.pyplot as plt
+        plt.show()
+
+
+def _head_digest(f, size):
+    f.seek(0)
+    return hashlib.blake2b(f.read(size), digest_size=16).hexdigest()
+
+
+def _find_rotated(log_path, dev, ino):
+    """在日志所在的文件夹中查找改名后的旧日志（设备号和 inode 与检查点记录的相同）"""
+    folder = os.path.dirname(os.path.abspath(log_path))
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) == (dev, ino) and entry.is_file(follow_symlinks=False):
+                return entry.path
+    return None
+
+
+class LogFollower:
+    """
+    增量解析日志：检查点保存已解析到的字节位置、日志文件的标识（设备号、inode、开头的哈希）
+    和已解析的结果，每次 poll() 只读取新追加的完整行。
+    """
+
+    def __init__(self, log_path, checkpoint_path=None):
+        self.log_path = log_path
+        self.checkpoint_path = checkpoint_path or log_path + '.progress.json'
+        self.log = TrainingLog()
+        self.offset = 0
+        self.file_id = None  # (设备号, inode)
+        self.head = None     # (字节数, 哈希)：日志开头 min(已解析字节数, HEAD_SIZE) 字节
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != CHECKPOINT_VERSION:
+                return
+            self.log = TrainingLog.from_dict(data)
+            self.offset = data['offset']
+            self.file_id = tuple(data['file_id'])
+            self.head = tuple(data['head']) if data['head'] else None
+        except (OSError, ValueError, KeyError, TypeError):
+            self.log, self.offset, self.file_id, self.head = TrainingLog(), 0, None, None
+
+    def save(self):
+        data = {'version': CHECKPOINT_VERSION, 'log': os.path.abspath(self.log_path),
+                'offset': self.offset, 'file_id': self.file_id, 'head': self.head}
+        data.update(self.log.to_dict())
+        tmp = f"{self.checkpoint_path}.tmp-{os.getpid()}"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def _read_from(self, f, offset):
+        """从 offset 开始解析到最后一个换行符，返回 (新的字节位置, 匹配的行数)"""
+        f.seek(offset)
+        data = f.read()
+        end = data.rfind(b'\n') + 1  # 最后一行还没写完时留到下一次
+        matched = self.log.feed(data[:end].decode('utf-8', errors='replace').splitlines())
+        return offset + end, matched
+
+    def poll(self):
+        """读取新追加的内容，返回新匹配的行数；日志不存在时返回 0"""
+        try:
+            f = open(self.log_path, 'rb')
+        except FileNotFoundError:
+            return 0
+        matched = 0
+        with f:
+            st = os.fstat(f.fileno())
+            file_id = (st.st_dev, st.st_ino)
+            if self.file_id is not None and file_id != self.file_id:
+                # 日志被改名轮转：旧文件还在时先读完它剩余的部分，结果继续累积
+                rotated = _find_rotated(self.log_path, *self.file_id)
+                if rotated is not None:
+                    with open(rotated, 'rb') as old:
+                        _, matched = self._read_from(old, self.offset)
+                else:
+                    # 找不到旧文件：日志被删除后重新创建（新的一次训练），之前的结果作废
+                    print(f"日志 {self.log_path} 被重新创建，从头解析")
+                    self.log = TrainingLog()
+                self.offset, self.head = 0, None
+            elif self.head is not None and (
+                    st.st_size < self.offset
+                    or _head_digest(f, self.head[0]) != self.head[1]):
+                # 同一个文件被截断或重新写入：之前的结果作废，从头解析
+                print(f"日志 {self.log_path} 被截断或重新写入，从头解析")
+                self.log, self.offset = TrainingLog(), 0
+            self.file_id = file_id
+            offset, count = self._read_from(f, self.offset)
+            matched += count
+            if offset != self.offset or self.head is None:
+                self.offset = offset
+                size = min(offset, HEAD_SIZE)
+                self.head = (size, _head_digest(f, size))
+        return matched
+
+
+def follow(log_path, checkpoint_path=None, output_path=None, interval=10.0):
+    """持续跟踪日志，有新结果时更新检查点、汇总和曲线图片，Ctrl+C 结束"""
+    follower = LogFollower(log_path, checkpoint_path)
+    output_path = output_path or os.path.splitext(log_path)[0] + '_curves.png'
+    plot = CurvePlot()
+    first = True
+    try:
+        while True:
+            matched = follower.poll()
+            if matched or first:
+                follower.save()
+                plot.update(follower.log)
+                plot.save(output_path)
+                print(time.strftime('[%H:%M:%S]'), f"新增 {matched} 条记录，曲线已更新: {output_path}")
+                print_summary(summarize(follower.log))
+                first = False
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        follower.save()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="统计训练日志中的最佳结果并绘制曲线")
+    parser.add_argument('--log', default='run.log', help="训练日志路径（默认 run.log）")
+    parser.add_argument('--follow', action='store_true',
+                        help="持续跟踪日志，只解析新追加的行，定期更新汇总和曲线图片")
+    parser.add_argument('--interval', type=float, default=10.0, help="跟踪时检查日志的间隔（秒）")
+    parser.add_argument('--checkpoint', default=None,
+                        help="跟踪进度的检查点文件，默认为 日志路径.progress.json")
+    parser.add_argument('--output', default=None,
+                        help="曲线图片路径；跟踪时默认为 日志名_curves.png，否则直接显示")
+    parser.add_argument('--no-plot', action='store_true', help="只打印汇总，不画曲线")
+    args = parser.parse_args()
+
+    if args.follow:
+        follow(args.log, args.checkpoint, args.output, args.interval)
+        return
+
+    log = read_log(args.log)
+    print_summary(summarize(log))
+    if args.no_plot:
+        return
+    plot = CurvePlot()
+    plot.update(log)
+    if args.output:
+        plot.save(args.output)
+    else:
+        plot.show()
+
+
+if __name__ == "__main__":
+    main()
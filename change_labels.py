@@ -1,6 +1,16 @@
+import argparse
 import os
 from decimal import Decimal
 
+from build_manifest import Manifest
+from directory_runner import (add_chunk_rows_argument, add_force_argument, add_jobs_argument,
+                              run_tasks, walk_files)
+from label_remap import remap_numeric
+from point_cloud_io import XYZ_NORMAL_LABEL, canonical_decimal, merge_lines, transform_file
+
+# 标签映射表：1、2 -> 0；3 -> 1；其他保持不变
+LABEL_TABLE = {1: 0, 2: 0, 3: 1}
+
 def process_line(line):
     """处理每行数据，调整顺序：x/y/z 法向量 x/y/z 标签，
        并在映射标签后保留原有小数位数。"""
@@ -21,12 +31,7 @@ def process_line(line):
 
         # 标签映射：1、2 -> 0；3 -> 1；其他保持不变
         orig_int = int(label_dec)
-        if orig_int in (1, 2):
-            mapped = 0
-        elif orig_int == 3:
-            mapped = 1
-        else:
-            mapped = orig_int
+        mapped = LABEL_TABLE.get(orig_int, orig_int)
 
         # 按原标签的小数位数量化映射结果
         new_label = Decimal(mapped).quantize(label_dec)
@@ -42,25 +47,42 @@ def process_line(line):
         print("columns != 7:", line.strip())
         return line
 
-def process_file(file_path, output_file_path):
-    with open(file_path, 'r') as infile:
-        lines = infile.readlines()
-    new_lines = [process_line(l) for l in lines]
-    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
-    with open(output_file_path, 'w') as outfile:
-        outfile.writelines(new_lines)
+def remap_columns(columns, table=LABEL_TABLE):
+    """按 table 映射标签（向量化，结果与 process_line 一致），columns 为 {列名: token 数组}"""
+    result = {name: canonical_decimal(columns[name]) for name in XYZ_NORMAL_LABEL[:6]}
+    result['label'] = remap_numeric(columns['label'], table)
+    return result
 
-def process_directory(input_dir, output_dir):
-    for root, dirs, files in os.walk(input_dir):
-        for f in files:
-            if f.endswith('.txt'):
-                in_path  = os.path.join(root, f)
-                rel_path = os.path.relpath(in_path, input_dir)
-                out_path = os.path.join(output_dir, rel_path)
-                process_file(in_path, out_path)
+def transform(cloud):
+    """向量化处理一块数据，输出与逐行调用 process_line 完全一致"""
+    columns = remap_columns(cloud.token_columns())
+    return merge_lines(cloud, list(columns.values())), len(cloud)  # 列数不符的行原样保留
 
-if __name__ == "__main__":
-    input_directory  = "data/test_set"
-    output_directory = "data_output/test_set"
-    process_directory(input_directory, output_directory)
+def process_file(file_path, output_file_path, chunk_rows=None):
+    """chunk_rows 给定时按块流式处理，内存占用与文件大小无关"""
+    return transform_file(file_path, output_file_path, XYZ_NORMAL_LABEL, transform, chunk_rows)
+
+def process_directory(input_dir, output_dir, jobs=1, chunk_rows=None, force=False):
+    tasks = []
+    for in_path in walk_files(input_dir, '.txt'):
+        rel_path = os.path.relpath(in_path, input_dir)
+        out_path = os.path.join(output_dir, rel_path)
+        tasks.append((in_path, (in_path, out_path, chunk_rows), [out_path]))
+    return run_tasks(process_file, tasks, jobs, Manifest(output_dir, force=force),
+                     prefetch=chunk_rows is None)
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="标签映射：1、2 -> 0；3 -> 1")
+    parser.add_argument('input_dir', nargs='?', default="data/test_set", help="输入文件夹路径")
+    parser.add_argument('output_dir', nargs='?', default="data_output/test_set", help="输出文件夹路径")
+    add_jobs_argument(parser)
+    add_chunk_rows_argument(parser)
+    add_force_argument(parser)
+    args = parser.parse_args()
+    process_directory(args.input_dir, args.output_dir, args.jobs, args.chunk_rows, args.force)
     print("处理完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+统一的命令行入口
+
+    python cli.py <子命令> [参数...]
+    python cli.py <子命令> --help
+
+子命令对应各个脚本的 main()，参数与直接运行脚本时相同。本文件只导入标准库，
+子命令的模块在选中之后才导入，matplotlib、numpy 等只在用到它们的子命令中加载；
+--help 和 verify、dedup、log-stats --no-plot 等轻量子命令的启动时间见 startup-bench。
+"""
+
+import os
+import sys
+from importlib import import_module
+
+
+# 子命令 -> (模块, 说明)
+COMMANDS = {
+    'combine-labels': ('combine_labels', "按标签2选择标签并调整列顺序"),
+    'change-labels': ('change_labels', "标签映射：1、2 -> 0；3 -> 1"),
+    'normalize': ('transfer_data', "调整列顺序为 x/y/z 法向量 标签，并归一化法向量"),
+    'normalize-normals': ('transfer_data2', "去除法向量为 NaN/Inf 的点并归一化法向量"),
+    'strip-labels': ('transfer_training_data', "去掉标签列，生成训练输入"),
+    'split-classes': ('process_point_clouds', "交换标签1和标签2，并按标签拆分点云"),
+    'extract-mesh': ('extract_points_from_mesh', "从 STL 网格提取顶点及顶点法向量"),
+    'transfer-labels': ('label_transfer', "把带标签点云的标签按最近点迁移到网格提取的点上"),
+    'visualize': ('visualize_results', "预处理点云并生成三视图投影图片"),
+    'downsample': ('downsample', "体素网格或最远点降采样"),
+    'pipeline': ('pipeline', "按配置文件单遍执行多个预处理步骤"),
+    'log-stats': ('calculate_results', "统计训练日志中的最佳结果并绘制曲线"),
+    'runs': ('run_metrics', "汇总多次训练的日志并按运行比较结果"),
+    'dedup': ('find_duplicate_files', "查找两个文件夹中重复的文件名或内容"),
+    'near-dedup': ('point_cloud_fingerprint', "按几何内容查找近似重复的点云"),
+    'verify': ('verification', "按相对路径比较两个文件夹的内容"),
+    'cache': ('point_cloud_cache', "查看和清理点云解析缓存"),
+    'number-format': ('number_format', "批量数值格式化的 golden 检查与基准测试"),
+}
+
+# startup-bench 测量的调用；前几项应当远低于 LIGHT_LIMIT_MS
+STARTUP_CASES = [
+    ('--help', ['--help'], True),
+    ('verify --help', ['verify', '--help'], True),
+    ('dedup --help', ['dedup', '--help'], True),
+    ('log-stats --help', ['log-stats', '--help'], True),
+    ('normalize --help', ['normalize', '--help'], False),
+    ('visualize --help', ['visualize', '--help'], False),
+]
+LIGHT_LIMIT_MS = 100
+
+
+def print_usage():
+    prog = os.path.basename(sys.argv[0])
+    print(f"用法: {prog} <子命令> [参数...]\n")
+    print("子命令:")
+    width = max(len(name) for name in COMMANDS)
+    for name, (_, help_text) in COMMANDS.items():
+        print(f"  {name:<{width}}  {help_text}")
+    print(f"  {'startup-bench':<{width}}  测量 --help 和各子命令的启动时间")
+    print(f"\n各子命令的参数见 {prog} <子命令> --help")
+
+
+def _time_invocation(args, repeat):
+    """运行 args 共 repeat 次，返回每次的耗时（毫秒）"""
+    import subprocess
+    import time
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def startup_bench(repeat=10, limit_ms=LIGHT_LIMIT_MS):
+    """
+    测量各调用从启动到退出的时间（中位数和最小值），并与空的 Python 解释器比较。
+    轻量调用的中位数超过 limit_ms 时返回 False。
+    """
+    from statistics import median as _median
+
+    script = os.path.abspath(__file__)
+    base = _median(_time_invocation([sys.executable, '-c', 'pass'], repeat))
+    print(f"空的 Python 解释器: {base:.1f} ms（以下“额外”为减去这部分之后的时间）")
+    print(f"{'调用':<22}{'中位数':>10}{'最小':>10}{'额外':>10}")
+    ok = True
+    for title, args, light in STARTUP_CASES:
+        times = _time_invocation([sys.executable, script] + args, repeat)
+        median = _median(times)
+        mark = ''
+        if light and median > limit_ms:
+            mark = f'  超过 {limit_ms} ms'
+            ok = False
+        print(f"{title:<22}{median:>9.1f}ms{min(times):>8.1f}ms{median - base:>8.1f}ms{mark}")
+    return ok
+
+
+def main(argv=None):
+    """主函数"""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print_usage()
+        return 0
+    command, rest = argv[0], argv[1:]
+    if command == 'startup-bench':
+        repeat = int(rest[rest.index('--repeat') + 1]) if '--repeat' in rest else 10
+        return 0 if startup_bench(repeat) else 1
+    if command not in COMMANDS:
+        print(f"未知的子命令: {command}\n")
+        print_usage()
+        return 2
+    module = import_module(COMMANDS[command][0])
+    # 子命令的 main() 从 sys.argv 读取参数，帮助信息中显示为 "cli.py 子命令"
+    sys.argv = [f"{os.path.basename(sys.argv[0])} {command}"] + rest
+    return module.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,18 @@
+import argparse
 import os
 from decimal import Decimal
+from functools import partial
+
+import numpy as np
+
+from build_manifest import Manifest
+from directory_runner import (add_chunk_rows_argument, add_force_argument, add_jobs_argument,
+                              run_tasks, walk_files)
+from label_remap import select_labels
+from point_cloud_io import XYZ_LABELS_NORMAL, canonical_decimal, merge_lines, transform_file
+
+# 按标签2的取值决定使用哪一列标签（0：标签1，1：标签2），未列出的默认使用标签1
+LABEL2_RULES = {"-1.000000": 0, "4.000000": 1}
 
 
 def process_line(line):
@@ -10,10 +23,8 @@ def process_line(line):
         x, y, z, label1, label2, nx, ny, nz = columns
 
         # 根据要求调整标签
-        if label2 == "-1.000000":
-            label = label1  # 取标签1
-        elif label2 == "4.000000":
-            label = label2  # 取标签2
+        if label2 in LABEL2_RULES:
+            label = (label1, label2)[LABEL2_RULES[label2]]
         else:
             print(f"未识别的标签2值: {label2}, 使用标签1: {label1}")
             label = label1  # 默认使用标签1
@@ -26,40 +37,76 @@ def process_line(line):
         return line
 
 
-def process_file(file_path, output_file_path):
-    """处理单个文件，调整数据顺序并保存到新的文件中"""
-    with open(file_path, 'r') as infile:
-        lines = infile.readlines()
+def combine_columns(columns, rules=LABEL2_RULES, unknown=None):
+    """
+    按标签2选择标签，输出列 x y z nx ny nz label（向量化，结果与 process_line 一致）。
+    columns 为 {列名: token 数组}，返回同样形式的新列。
+    未识别的标签2值使用标签1，给定 unknown 时按取值把行数累加进去，由调用方按文件汇总提示。
+    """
+    label1, label2 = columns['label1'], columns['label2']
+    labels, rows = select_labels(label1, label2, rules)
+    if unknown is not None and len(rows):
+        values, counts = np.unique(label2[rows], return_counts=True)
+        for value, n in zip(values, counts):
+            unknown[value.decode()] = unknown.get(value.decode(), 0) + int(n)
+    result = {name: canonical_decimal(columns[name]) for name in ('x', 'y', 'z', 'nx', 'ny', 'nz')}
+    result['label'] = canonical_decimal(labels)
+    return result
+
+
+def report_unknown_label2(file_path, unknown):
+    """每个文件只输出一条未识别标签2值的汇总提示"""
+    total = sum(unknown.values())
+    if total == 0:
+        return
+    detail = '，'.join(f"{value} {n}" for value, n in sorted(unknown.items()))
+    print(f"{file_path}: {total} 个点的标签2值未识别，使用标签1（{detail}）")
 
-    # 调整每行的顺序
-    new_lines = [process_line(line) for line in lines]
 
-    # 创建输出文件夹，如果不存在
-    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+def transform(cloud, unknown=None):
+    """调整一块数据的顺序"""
+    columns = combine_columns(cloud.token_columns(), unknown=unknown)
+    return merge_lines(cloud, list(columns.values())), len(cloud)  # 列数不符的行原样保留
 
-    # 将调整后的数据保存到新文件
-    with open(output_file_path, 'w') as outfile:
-        outfile.writelines(new_lines)
 
+def process_file(file_path, output_file_path, chunk_rows=None):
+    """处理单个文件并保存到新的文件中，chunk_rows 给定时按块流式处理"""
+    unknown = {}
+    points = transform_file(file_path, output_file_path, XYZ_LABELS_NORMAL,
+                            partial(transform, unknown=unknown), chunk_rows)
+    report_unknown_label2(file_path, unknown)
+    return points
 
-def process_directory(input_dir, output_dir):
+
+def process_directory(input_dir, output_dir, jobs=1, chunk_rows=None, force=False):
     """递归遍历输入文件夹并处理所有txt文件"""
-    for root, dirs, files in os.walk(input_dir):
-        for file in files:
-            if file.endswith('.txt'):
-                input_file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(input_file_path, input_dir)
-                output_file_path = os.path.join(output_dir, relative_path)
+    tasks = []
+    for input_file_path in walk_files(input_dir, '.txt'):
+        relative_path = os.path.relpath(input_file_path, input_dir)
+        output_file_path = os.path.join(output_dir, relative_path)
+        tasks.append((input_file_path, (input_file_path, output_file_path, chunk_rows),
+                      [output_file_path]))
 
-                # 处理每个文件
-                process_file(input_file_path, output_file_path)
+    # 处理每个文件
+    return run_tasks(process_file, tasks, jobs, Manifest(output_dir, force=force),
+                     prefetch=chunk_rows is None)
 
 
-if __name__ == "__main__":
-    input_directory = "data/val_set"  # 输入文件夹路径
-    output_directory = "data_output/val_set"  # 输出文件夹路径
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="按标签2选择标签并调整列顺序")
+    parser.add_argument('input_dir', nargs='?', default="data/val_set", help="输入文件夹路径")
+    parser.add_argument('output_dir', nargs='?', default="data_output/val_set", help="输出文件夹路径")
+    add_jobs_argument(parser)
+    add_chunk_rows_argument(parser)
+    add_force_argument(parser)
+    args = parser.parse_args()
 
     # 处理文件夹
-    process_directory(input_directory, output_directory)
+    process_directory(args.input_dir, args.output_dir, args.jobs, args.chunk_rows, args.force)
+
+    print("处理完成！")
 
-    print("处理完成！")
\ No newline at end of file
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import instrumentation
+import io_scheduler
+
+
+def walk_files(input_dir, suffix):
+    """递归遍历 input_dir，返回所有以 suffix 结尾的文件路径（按 os.walk 顺序）"""
+    paths = []
+    for root, dirs, files in os.walk(input_dir):
+        for file in files:
+            if file.endswith(suffix):
+                paths.append(os.path.join(root, file))
+    return paths
+
+
+def add_jobs_argument(parser):
+    """为脚本的命令行添加 --jobs 参数"""
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="并行进程数，0 表示使用全部 CPU 核心（默认 1，串行）")
+
+
+def add_force_argument(parser):
+    """为脚本的命令行添加 --force 参数"""
+    parser.add_argument('--force', action='store_true',
+                        help="忽略输出目录中的处理记录，重新处理全部输入文件")
+
+
+def add_chunk_rows_argument(parser):
+    """为脚本的命令行添加 --chunk-rows 参数"""
+    parser.add_argument('--chunk-rows', type=int, default=None,
+                        help="按块流式处理，每块的行数（如 1000000），内存占用与文件大小无关；"
+                             "默认整文件读入内存")
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _run_one(func, args, input_path, outputs):
+    """
+    执行单个文件的处理，异常记录为该文件的失败而不中断整个任务。
+    返回 (点数, 错误信息, 指标记录)，未启用 instrumentation 时指标记录为 None。
+    """
+    try:
+        points, record = instrumentation.run_file(func, args, input_path, outputs)
+        return points, None, record
+    except Exception:
+        return None, traceback.format_exc(), None
+
+
+def run_tasks(func, tasks, jobs=1, manifest=None, prefetch=True):
+    """
+    对每个任务调用 func(*args)，tasks 为 [(输入文件路径, args, 输出文件列表)]。
+    func 返回处理的点数（或 None）。jobs > 1 时使用进程池，按输入文件从大到小调度，
+    使大文件尽早开始；每个文件写各自的输出，因此结果与串行运行一致。
+    给定 manifest（build_manifest.Manifest）时跳过输入未变化的任务。
+    启用 instrumentation 时把每个文件的分阶段指标写入指标文件，并打印汇总表。
+    串行运行时可由 io_scheduler 预读输入、异步写出输出，与计算重叠；
+    任务不整个读入输入（按块流式处理）时传入 prefetch=False，只异步写出，不预读。
+    返回汇总字典并打印汇总信息。
+    """
+    total = len(tasks)
+    if manifest is not None:
+        tasks = manifest.select(func, tasks)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    results = [None] * len(tasks)
+    if jobs <= 1 or len(tasks) <= 1:
+        scheduler = io_scheduler.start([path for path, _, _ in tasks] if prefetch else [])
+        try:
+            for i, (path, args, outputs) in enumerate(tasks):
+                if scheduler is not None:
+                    scheduler.begin(path)
+                results[i] = _run_one(func, args, path, outputs)
+        finally:
+            write_errors = io_scheduler.stop(scheduler)
+        for i, (path, _, outputs) in enumerate(tasks):
+            error = write_errors.get(os.path.abspath(path))
+            if error is not None and results[i][1] is None:
+                results[i] = None, error, None
+            elif scheduler is not None and results[i][2] is not None:
+                # 异步写出时输出在任务返回之后才写完
+                results[i][2]['bytes_written'] = sum(_file_size(p) for p in outputs)
+    else:
+        order = sorted(range(len(tasks)), key=lambda i: _file_size(tasks[i][0]), reverse=True)
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(_run_one, func, tasks[i][1], tasks[i][0], tasks[i][2]): i
+                       for i in order}
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:  # 子进程异常退出等
+                    results[futures[future]] = None, f"{type(e).__name__}: {e}", None
+
+    summary = {'files': 0, 'points': 0, 'failed': [], 'skipped': total - len(tasks)}
+    records = []
+    for (path, _, outputs), (points, error, record) in zip(tasks, results):
+        if record is not None:
+            records.append(record)
+        if error is not None:
+            summary['failed'].append((path, error))
+            if manifest is not None:
+                manifest.forget(path)
+            continue
+        summary['files'] += 1
+        summary['points'] += points or 0
+        if manifest is not None:
+            manifest.record(path, outputs)
+    if manifest is not None:
+        manifest.save()
+    print_summary(summary, len(tasks))
+    if instrumentation.metrics_path() is not None:
+        instrumentation.write_records(func, records,
+                                      [path for path, _ in summary['failed']])
+        instrumentation.print_table(records)
+    return summary
+
+
+def print_summary(summary, total):
+    print(f"共 {total} 个文件：成功 {summary['files']} 个，"
+          f"点数 {summary['points']}，失败 {len(summary['failed'])} 个")
+    for path, error in sorted(summary['failed']):
+        print(f"  失败: {path}")
+        print(f"    {error.strip().splitlines()[-1]}")
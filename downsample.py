@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+点云降采样
+
+    voxel  体素网格滤波：按 voxel_size 把点划入体素，每个体素保留离体素重心最近的一个点
+           （坐标和法向量原样保留），标签取体素内出现次数最多的标签
+    fps    最远点采样：返回恰好 n_points 个点，起点由 seed 决定，结果可复现。点数超过 max_candidates
+           （默认 FPS_CANDIDATE_FACTOR * n_points）时先用体素网格缩减候选点，结果是近似的；
+           max_candidates 为 0 时在全部点上精确采样
+
+输出的每一行都是输入中的原始行（只有 voxel 的标签可能被替换为多数标签），数值文本保持不变。
+也可以作为 pipeline.py 的 downsample 阶段使用。
+
+命令行：
+    python downsample.py voxel input_dir output_dir --voxel-size S [--no-label] [--jobs N] [--force]
+    python downsample.py fps   input_dir output_dir --points N [--seed S] [--max-candidates M]
+                               [--no-label] [--jobs N] [--force]
+    python downsample.py bench [--sizes 100000 1000000 10000000] [--points 4096] [--voxel-size S]
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from build_manifest import Manifest
+from directory_runner import add_force_argument, add_jobs_argument, run_tasks, walk_files
+from point_cloud_io import (XYZ_NORMAL, XYZ_NORMAL_LABEL, join_columns, read_point_cloud,
+                            report_bad_rows, unique_tokens, write_bytes)
+
+
+METHODS = ('voxel', 'fps')
+# 点数超过 n_points 的这么多倍时，最远点采样先用体素网格把候选点减少到约这个数量
+FPS_CANDIDATE_FACTOR = 32
+# 拟合体素大小时最多缩小这么多次，仍达不到目标点数（不同位置的点不够）就放弃
+FIT_MAX_SHRINKS = 20
+
+
+def voxel_keys(points, voxel_size):
+    """每个点所在体素的线性编号（体素坐标按网格尺寸展开为一个 int64）"""
+    ijk = np.floor((points - points.min(axis=0)) / voxel_size).astype(np.int64)
+    dims = ijk.max(axis=0) + 1
+    if np.prod(dims.astype(np.float64)) >= 2 ** 62:
+        raise ValueError(f"voxel_size={voxel_size} 过小，体素个数超出范围")
+    return (ijk[:, 0] * dims[1] + ijk[:, 1]) * dims[2] + ijk[:, 2]
+
+
+def voxel_downsample(points, voxel_size, labels=None):
+    """
+    体素网格滤波。返回 (保留点的下标（升序，即保持原始顺序）, 每个保留点所在体素的多数标签)。
+    labels 为任意可比较的一维数组（如标签 token）；为 None 时第二个返回值也为 None。
+    多数标签票数相同时取排序最小的标签。
+    """
+    n = len(points)
+    if n == 0:
+        return np.zeros(0, dtype=np.intp), None if labels is None else labels[:0]
+    # 按体素编号排序一次：同一体素的点连续排列，之后都是对连续分段的归约
+    keys = voxel_keys(points, voxel_size)
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+    counts = np.diff(np.append(starts, n))
+    n_voxels = len(starts)
+
+    # 体素重心，以及每个点到所在体素重心的距离
+    sorted_points = points[order]
+    centroid = np.add.reduceat(sorted_points, starts, axis=0) / counts[:, None]
+    dist = ((sorted_points - np.repeat(centroid, counts, axis=0)) ** 2).sum(axis=1)
+
+    # 每个体素内距离最小的点，有并列时取原始顺序靠前的（排序不稳定，按原下标取最小）
+    nearest = dist == np.repeat(np.minimum.reduceat(dist, starts), counts)
+    chosen = np.minimum.reduceat(np.where(nearest, order, n), starts)
+    by_position = np.argsort(chosen)
+    keep = chosen[by_position]
+    if labels is None:
+        return keep, None
+
+    values, codes = unique_tokens(labels)
+    voxel = np.repeat(np.arange(n_voxels), counts)
+    votes = np.bincount(voxel * len(values) + codes[order], minlength=n_voxels * len(values))
+    majority = votes.reshape(n_voxels, len(values)).argmax(axis=1)
+    return keep, values[majority[by_position]]
+
+
+def _fit_voxel_size(points, target, seed=0):
+    """
+    找一个体素大小，使体素网格滤波后的点数约为 target（不少于 target）。
+    点数很多时在 8 * target 个随机点上估计：平均每个体素有约 8 个样本点，
+    空出来的体素极少，而每次试算的代价与总点数无关。
+    不同位置的点不足 target 个等原因无法达到时返回 None。
+    """
+    if len(points) > 8 * target:
+        rng = np.random.default_rng(seed)
+        points = points[rng.choice(len(points), 8 * target, replace=False)]
+    extent = float((points.max(axis=0) - points.min(axis=0)).max()) or 1.0
+    # 点云多为曲面，点数约与体素大小的平方成反比，从包围盒按面积估计初值再迭代修正
+    size = extent / np.sqrt(target)
+    count = 0
+    try:
+        for _ in range(10):
+            count = len(np.unique(voxel_keys(points, size)))
+            if target <= count <= 1.5 * target:
+                break
+            size *= np.sqrt(count / (1.2 * target))
+        for _ in range(FIT_MAX_SHRINKS):
+            if count >= target:
+                return size
+            size /= 1.5
+            count = len(np.unique(voxel_keys(points, size)))
+    except ValueError:
+        pass  # 体素过小，体素个数超出范围
+    return size if count >= target else None
+
+
+def farthest_point_sample(points, n_points, seed=0, max_candidates=None):
+    """
+    最远点采样，返回恰好 n_points 个下标（按采样顺序）。
+    每一步只在整列上做一次距离更新和一次 argmax，共 O(N·n_points)；
+    N 超过 max_candidates（默认 FPS_CANDIDATE_FACTOR 倍的 n_points）时先用体素网格
+    把候选点减少到约 max_candidates 个再采样，候选点在空间上均匀，采样结果与全量采样相近；
+    max_candidates 为 0 时不缩减，在全部点上精确采样。
+    不同位置的点太少、体素网格无法缩减到 max_candidates 时，在不重复的点上精确采样
+    （重复的点距离为 0，不会被选中，结果与在全部点上采样相同）。
+    点数（或不同位置的点数）不足 n_points 时全部保留，再用 seed 随机重复一部分点补足。
+    """
+    n = len(points)
+    rng = np.random.default_rng(seed)
+    if n == 0:
+        raise ValueError("点云为空，无法采样")
+    if n <= n_points:
+        return np.concatenate([np.arange(n), rng.integers(0, n, n_points - n)])
+
+    candidates = np.arange(n)
+    if max_candidates is None:
+        max_candidates = FPS_CANDIDATE_FACTOR * n_points
+    if max_candidates and n > max_candidates:
+        voxel_size = _fit_voxel_size(points, max_candidates, seed)
+        try:
+            if voxel_size is not None:
+                candidates, _ = voxel_downsample(points, voxel_size)
+        except ValueError:
+            voxel_size = None  # 全部点的范围比估计用的随机点大得多，体素个数超出范围
+        if voxel_size is None or len(candidates) < n_points:
+            _, first = np.unique(points, axis=0, return_index=True)
+            candidates = np.sort(first)
+            if len(candidates) <= n_points:
+                return np.concatenate([candidates,
+                                       rng.integers(0, n, n_points - len(candidates))])
+
+    # 三个坐标分量各自连续存放，距离更新只在 float32 缓冲区上原地计算
+    xyz = [np.ascontiguousarray(points[candidates, j], dtype=np.float32) for j in range(3)]
+    dist = np.full(len(candidates), np.inf, dtype=np.float32)
+    d = np.empty_like(dist)
+    tmp = np.empty_like(dist)
+    selected = np.empty(n_points, dtype=np.intp)
+    current = int(rng.integers(len(candidates)))
+    for i in range(n_points):
+        selected[i] = current
+        np.subtract(xyz[0], xyz[0][current], out=d)
+        np.multiply(d, d, out=d)
+        for axis in xyz[1:]:
+            np.subtract(axis, axis[current], out=tmp)
+            np.multiply(tmp, tmp, out=tmp)
+            np.add(d, tmp, out=d)
+        np.minimum(dist, d, out=dist)
+        current = int(dist.argmax())
+    return candidates[selected]
+
+
+def downsample_columns(columns, method='voxel', voxel_size=None, n_points=None, seed=0,
+                       max_candidates=None):
+    """
+    对 {列名: token 数组} 降采样，返回同样形式的新列，各列都是原 token（不重新格式化）。
+    method='voxel' 需要 voxel_size，有 label 列时替换为体素内的多数标签；
+    method='fps' 需要 n_points，max_candidates 见 farthest_point_sample（0 为精确采样）。
+    """
+    points = np.column_stack([columns[name].astype(np.float64) for name in ('x', 'y', 'z')])
+    if method == 'voxel':
+        if voxel_size is None:
+            raise ValueError("voxel 降采样需要 voxel_size")
+        keep, labels = voxel_downsample(points, voxel_size, columns.get('label'))
+        result = {name: tokens[keep] for name, tokens in columns.items()}
+        if labels is not None:
+            result['label'] = labels
+        return result
+    if method == 'fps':
+        if n_points is None:
+            raise ValueError("fps 降采样需要 n_points")
+        index = farthest_point_sample(points, n_points, seed, max_candidates)
+        return {name: tokens[index] for name, tokens in columns.items()}
+    raise ValueError(f"未知的降采样方法: {method}（可用: {', '.join(METHODS)}）")
+
+
+def process_file(file_path, output_file_path, schema, method, voxel_size=None, n_points=None,
+                 seed=0, max_candidates=None):
+    """降采样单个文件，列数不符的行直接丢弃，返回写出的点数"""
+    cloud = read_point_cloud(file_path, schema)
+    report_bad_rows(file_path, cloud)
+    if len(cloud) == 0:
+        print(f"{file_path}: 没有有效的点，跳过")
+        return 0
+    columns = downsample_columns(cloud.token_columns(), method, voxel_size, n_points, seed,
+                                 max_candidates)
+    write_bytes(output_file_path, join_columns(list(columns.values())))
+    return len(columns['x'])
+
+
+def process_directory(input_dir, output_dir, method, voxel_size=None, n_points=None, seed=0,
+                      has_label=True, jobs=1, force=False, max_candidates=None):
+    """递归处理 input_dir 下所有 txt 文件，输出保持相对路径"""
+    schema = XYZ_NORMAL_LABEL if has_label else XYZ_NORMAL
+    tasks = []
+    for input_file_path in walk_files(input_dir, '.txt'):
+        relative_path = os.path.relpath(input_file_path, input_dir)
+        output_file_path = os.path.join(output_dir, relative_path)
+        tasks.append((input_file_path, (input_file_path, output_file_path, schema, method,
+                                        voxel_size, n_points, seed, max_candidates),
+                      [output_file_path]))
+    params = {'method': method, 'voxel_size': voxel_size, 'n_points': n_points, 'seed': seed,
+              'max_candidates': max_candidates, 'schema': list(schema)}
+    return run_tasks(process_file, tasks, jobs, Manifest(output_dir, params, force))
+
+
+def synthetic_cloud(n, seed=0):
+    """基准测试用的点云：带噪声的球面和平面，坐标范围约 ±100"""
+    rng = np.random.default_rng(seed)
+    m = n // 2
+    v = rng.normal(size=(m, 3))
+    sphere = v / np.linalg.norm(v, axis=1, keepdims=True) * 60 + rng.normal(0, 0.5, (m, 3))
+    plane = np.column_stack([rng.uniform(-100, 100, n - m), rng.uniform(-100, 100, n - m),
+                             rng.normal(-70, 0.5, n - m)])
+    return np.concatenate([sphere, plane])
+
+
+def bench(sizes=(100000, 1000000, 10000000), n_points=4096, voxel_size=1.0, probe=64):
+    """
+    各点数下体素网格滤波和最远点采样的耗时。不预先缩减候选点的逐点 FPS 只运行 probe 步，
+    按步数线性外推到 n_points 步，以显示 O(N·n_points) 的代价。
+    """
+    for n in sizes:
+        points = synthetic_cloud(n)
+        labels = np.random.default_rng(1).integers(0, 4, n)
+
+        start = time.perf_counter()
+        keep, _ = voxel_downsample(points, voxel_size, labels)
+        t_voxel = time.perf_counter() - start
+
+        start = time.perf_counter()
+        farthest_point_sample(points, n_points)
+        t_fps = time.perf_counter() - start
+
+        start = time.perf_counter()
+        farthest_point_sample(points, probe, max_candidates=n)
+        t_full = (time.perf_counter() - start) * n_points / probe
+
+        print(f"{n:>10} 点: voxel({voxel_size}) {t_voxel:7.2f} 秒 -> {len(keep)} 点；"
+              f"fps({n_points}) {t_fps:7.2f} 秒；全量逐点 fps 约 {t_full:8.1f} 秒")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="点云降采样（体素网格滤波 / 最远点采样）")
+    sub = parser.add_subparsers(dest='command', required=True)
+    for method in METHODS:
+        p = sub.add_parser(method, help="体素网格滤波" if method == 'voxel' else "最远点采样")
+        p.add_argument('input_dir', help="输入文件夹路径")
+        p.add_argument('output_dir', help="输出文件夹路径")
+        if method == 'voxel':
+            p.add_argument('--voxel-size', type=float, required=True, help="体素边长")
+        else:
+            p.add_argument('--points', type=int, required=True, help="每个文件采样的点数")
+            p.add_argument('--seed', type=int, default=0, help="随机起点的种子")
+            p.add_argument('--max-candidates', type=int, default=None,
+                           help="点数超过它时先用体素网格缩减候选点（近似采样），"
+                                "默认为 --points 的 32 倍；0 表示在全部点上精确采样")
+        p.add_argument('--no-label', action='store_true',
+                       help="输入为 x y z nx ny nz 六列（如 transfer_training_data.py 的输出）")
+        add_jobs_argument(p)
+        add_force_argument(p)
+    p = sub.add_parser('bench', help="降采样基准测试")
+    p.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000, 10000000])
+    p.add_argument('--points', type=int, default=4096)
+    p.add_argument('--voxel-size', type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        bench(args.sizes, args.points, args.voxel_size)
+        return
+    process_directory(args.input_dir, args.output_dir, args.command,
+                      getattr(args, 'voxel_size', None), getattr(args, 'points', None),
+                      getattr(args, 'seed', 0), not args.no_label, args.jobs, args.force,
+                      getattr(args, 'max_candidates', None))
+    print("处理完成！")
+
+
+if __name__ == "__main__":
+    main()
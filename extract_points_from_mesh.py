@@ -1,93 +1,292 @@
+import argparse
 import os
-from decimal import Decimal, ROUND_HALF_UP
 import numpy as np
-from stl import mesh
 
+import instrumentation
+from build_manifest import Manifest
+from directory_runner import add_force_argument, add_jobs_argument, run_tasks, walk_files
+from number_format import format_rows
+from point_cloud_io import write_bytes
+from stl_reader import face_normals, iter_stl, read_stl
 
-def normalize_vector(vec):
-    """归一化法向量"""
-    norm = np.linalg.norm(vec)
-    if norm == 0:
-        return vec  # 如果法向量为零向量，直接返回原值
-    return vec / norm
 
+# 顶点法向量的加权方式，见 vertex_normals
+WEIGHTINGS = ('none', 'uniform', 'area', 'angle')
 
-def process_stl_file(file_path, output_file_path):
-    """处理单个STL文件，提取点云数据和法向量，保存为TXT格式"""
-    # 读取STL文件
-    stl_mesh = mesh.Mesh.from_file(file_path)
 
-    # 提取点云数据和法向量
-    vertices = stl_mesh.vectors  # 三角形的顶点坐标
-    normals = stl_mesh.normals  # 面法向量
+def _sort_key(values):
+    """把 float32 映射为保持大小顺序的 uint32（-0.0 与 0.0 视为相同）"""
+    bits = np.where(values == 0, 0, values).astype(np.float32).view(np.uint32)
+    return np.where(bits >> 31, ~bits, bits | np.uint32(1 << 31))
 
-    # 创建一个字典，存储每个顶点的法向量
-    vertex_normals = {tuple(v): [] for v in np.unique(vertices.reshape(-1, 3), axis=0)}  # 存储顶点法向量
 
-    # 准备输出数据
-    output_data = []
+def unique_rows(points):
+    """
+    与 np.unique(points, axis=0, return_inverse=True) 结果相同（按 x、y、z 字典序），
+    但把坐标映射为整数键后用两次一维排序代替按行比较的排序，大网格上快数倍。
+    """
+    kx, ky, kz = (_sort_key(points[:, j]) for j in range(3))
+    # 先按 (x, y) 排序，再按 (所在 (x, y) 组的序号, z) 排序
+    xy = (kx.astype(np.uint64) << np.uint64(32)) | ky
+    order = np.argsort(xy)
+    xy = xy[order]
+    group = np.concatenate(([0], np.cumsum(xy[1:] != xy[:-1]))).astype(np.uint64)
+    key = (group << np.uint64(32)) | kz[order]
+    sub = np.argsort(key)
+    order, key = order[sub], key[sub]
 
-    # 遍历每个三角形，计算法向量，并更新每个顶点的法向量
-    for i in range(len(vertices)):
-        # 计算每个三角形的面法向量
-        face_normal = normals[i]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = key[1:] != key[:-1]
+    inverse = np.empty(len(order), dtype=np.intp)
+    inverse[order] = np.cumsum(first) - 1
+    return points[order[first]], inverse
 
-        # 获取该三角形的三个顶点
-        for j in range(3):
-            x, y, z = vertices[i][j]
-            nx, ny, nz = face_normal
 
-            # 将当前面法向量添加到该顶点的法向量列表
-            vertex_normals[tuple(vertices[i][j])].append(face_normal)
+def _cell_packing(cells, margin=0):
+    """
+    把整数坐标打包为一个 int64 的参数 (最小值, 各轴位数)，按打包后的键排序即按行字典序排序；
+    各轴范围（两侧各放宽 margin）合计超过 63 位时返回 None。
+    """
+    low = cells.min(axis=0) - margin
+    bits = [int(span).bit_length() for span in cells.max(axis=0) + margin - low]
+    return (low, bits) if sum(bits) <= 63 else None
 
-    # 计算顶点法向量：对每个顶点的所有相邻面法向量进行平均
-    for vertex, normal_list in vertex_normals.items():
-        if normal_list:
-            # 对所有法向量进行加权平均
-            averaged_normal = np.mean(normal_list, axis=0)
-            normalized_normal = normalize_vector(averaged_normal)
 
-            x, y, z = vertex
-            nx, ny, nz = normalized_normal
+def _pack(cells, packing):
+    low, bits = packing
+    shifted = cells - low
+    return (shifted[:, 0] << (bits[1] + bits[2])) | (shifted[:, 1] << bits[2]) | shifted[:, 2]
 
-            # 转换为 float 再转换为 Decimal 来避免 TypeError
-            x = Decimal(float(x)).quantize(Decimal('0.000001'), rounding=ROUND_HALF_UP)
-            y = Decimal(float(y)).quantize(Decimal('0.000001'), rounding=ROUND_HALF_UP)
-            z = Decimal(float(z)).quantize(Decimal('0.000001'), rounding=ROUND_HALF_UP)
-            nx = Decimal(float(nx)).quantize(Decimal('0.000001'), rounding=ROUND_HALF_UP)
-            ny = Decimal(float(ny)).quantize(Decimal('0.000001'), rounding=ROUND_HALF_UP)
-            nz = Decimal(float(nz)).quantize(Decimal('0.000001'), rounding=ROUND_HALF_UP)
 
-            output_data.append(f"{x} {y} {z} {nx} {ny} {nz}\n")
+def unique_cells(cells):
+    """
+    与 np.unique(cells, axis=0, return_inverse=True) 结果相同（cells 为整数 (N, 3) 数组）。
+    各轴的取值范围合计不超过 63 位时打包为一个 int64 键，只做一次一维排序。
+    """
+    if len(cells) == 0:
+        return cells, np.zeros(0, dtype=np.intp)
+    packing = _cell_packing(cells)
+    if packing is None:
+        unique, inverse = np.unique(cells, axis=0, return_inverse=True)
+        return unique, inverse.ravel()
+    (low, bits), key = packing, _pack(cells, packing)
+    unique_key, inverse = np.unique(key, return_inverse=True)
+    unique = np.stack([unique_key >> (bits[1] + bits[2]),
+                       (unique_key >> bits[2]) & ((1 << bits[1]) - 1),
+                       unique_key & ((1 << bits[2]) - 1)], axis=1) + low
+    return unique, inverse
 
-    # 创建输出文件夹，如果不存在
-    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
 
-    # 将提取的数据保存到TXT文件
-    with open(output_file_path, 'w') as outfile:
-        outfile.writelines(output_data)
+# 字典序小于自身的相邻网格点的偏移：cells 按字典序排列，这些网格点的编号也更小
+_LOWER_NEIGHBOURS = np.array([o for o in np.ndindex(3, 3, 3) if o < (1, 1, 1)]) - 1
 
 
-def process_directory(input_dir, output_dir):
-    """递归遍历输入文件夹并处理所有STL文件，将数据输出为TXT文件"""
-    for root, dirs, files in os.walk(input_dir):
-        for file in files:
-            if file.endswith('.stl'):
-                input_file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(input_file_path, input_dir)
-                output_file_path = os.path.join(output_dir, relative_path.replace('.stl', '.txt'))
+def weld_groups(vertices, tol):
+    """
+    焊接分组：坐标按 tol 取整到网格点，每个网格点上顶点的平均坐标作为代表点。
+    每个顶点归入自身及相邻网格点的代表点中、各分量相差不超过 tol 且字典序最小的一个，
+    跨越取整边界的相近顶点也能合并。代表点在归组前一次确定，不会沿相邻网格点连锁合并，
+    每组顶点各分量的跨度不超过 2·tol。
+    返回 (每个顶点的组号, 组数)，组按代表点所在网格点的字典序编号。
+    """
+    vertices = vertices.astype(np.float64)
+    cells, inverse = unique_cells(np.floor(vertices / tol + 0.5).astype(np.int64))
+    n = len(cells)
+    counts = np.bincount(inverse, minlength=n)
+    means = _sum_rows(inverse, vertices, n) / np.maximum(counts, 1)[:, None]
 
-                # 处理每个STL文件，并保存为TXT
-                process_stl_file(input_file_path, output_file_path)
+    # 查找相邻格：cells 已按字典序排列，打包后的键有序；范围过大无法打包时按行的字节比较
+    packing = _cell_packing(cells, margin=1) if n else None
+    if packing is not None:
+        def key(rows):
+            return _pack(rows, packing)
+        order = np.arange(n)
+    else:
+        row = np.dtype((np.void, cells.dtype.itemsize * 3))
 
+        def key(rows):
+            return np.ascontiguousarray(rows).view(row).ravel()
+        order = np.argsort(key(cells))
+    keys = key(cells)[order]
+    group = inverse.copy()  # 自身网格点的代表点总在范围内
+    for offset in _LOWER_NEIGHBOURS if n else ():
+        neighbour = key(cells + offset)
+        pos = np.minimum(np.searchsorted(keys, neighbour), n - 1)
+        found = keys[pos] == neighbour
+        nearby = np.full(n, -1)
+        nearby[found] = order[pos[found]]
+        candidate = nearby[inverse]
+        v = np.flatnonzero(candidate >= 0)
+        c = candidate[v]
+        close = np.abs(vertices[v] - means[c]).max(axis=1) <= tol
+        v, c = v[close], c[close]
+        group[v] = np.minimum(group[v], c)
+    _, inverse = np.unique(group, return_inverse=True)
+    return inverse, int(inverse.max()) + 1 if len(inverse) else 0
 
 
+def weld_vertices(vertices, sums, tol):
+    """
+    按 weld_groups 焊接顶点：坐标取合并前各顶点的平均值，法向量累加和相加。
+    返回 (顶点, 法向量累加和, 合并掉的顶点数)。
+    """
+    vertices = vertices.astype(np.float64)
+    inverse, m = weld_groups(vertices, tol)
+    counts = np.bincount(inverse, minlength=m)
+    positions = _sum_rows(inverse, vertices, m) / counts[:, None]
+    return positions, _sum_rows(inverse, sums, m), len(vertices) - m
+
+
+def _corner_normals(vectors, normals, weighting):
+    """每个三角形每个角上要累加到顶点的法向量，形状 (3 * 三角形数, 3)"""
+    if weighting == 'none':
+        return np.repeat(normals.astype(np.float64), 3, axis=0)
+    v = vectors.astype(np.float64)
+    cross = np.cross(v[:, 1] - v[:, 0], v[:, 2] - v[:, 0])  # 模长为面积的 2 倍
+    length = np.linalg.norm(cross, axis=1, keepdims=True)
+    unit = np.divide(cross, length, out=np.zeros_like(cross), where=length > 0)
+    if weighting == 'uniform':
+        weights = np.ones((len(v), 3))
+    elif weighting == 'area':
+        weights = np.repeat(length / 2, 3, axis=1)
+    elif weighting == 'angle':
+        # 每个角的两条边：指向下一个顶点和下下个顶点
+        e1 = np.roll(v, -1, axis=1) - v
+        e2 = np.roll(v, -2, axis=1) - v
+        weights = np.arctan2(np.linalg.norm(np.cross(e1, e2), axis=2), (e1 * e2).sum(axis=2))
+    else:
+        raise ValueError(f"未知的加权方式: {weighting}")
+    return (unit[:, None, :] * weights[:, :, None]).reshape(-1, 3)
+
+
+def _sum_rows(inverse, values, n):
+    """把 (N, 3) 的 values 按 inverse 指定的组累加，返回 (n, 3)"""
+    return np.stack([np.bincount(inverse, weights=values[:, k], minlength=n)
+                     for k in range(3)], axis=1)
+
+
+def _accumulate(points, values):
+    """合并坐标相同的点，并把各点的 values 按点累加"""
+    unique, inverse = unique_rows(points)
+    return unique, _sum_rows(inverse, values, len(unique))
+
+
+def _normalize(sums):
+    norms = np.linalg.norm(sums, axis=1, keepdims=True)
+    return np.divide(sums, norms, out=sums, where=norms > 0)
+
+
+def vertex_normals(vectors, normals, weighting='none'):
+    """
+    计算顶点法向量：坐标完全相同的顶点视为同一顶点，
+    把相邻面的法向量按 weighting 加权累加到顶点上，再整体归一化（零向量保持为零）。
+      none    直接平均面法向量 normals（numpy-stl 读入时按叉积重算且不归一化，实际相当于面积加权）
+      uniform 每个相邻面的单位法向量权重相同
+      area    按三角形面积加权
+      angle   按三角形在该顶点处的内角加权
+    返回 (顶点, 顶点法向量)，顶点按 np.unique 的顺序排列。
+    """
+    unique, sums = _accumulate(vectors.reshape(-1, 3), _corner_normals(vectors, normals, weighting))
+    return unique, _normalize(sums)
+
+
+def batched_vertex_normals(batches, weighting='none'):
+    """
+    与 vertex_normals 相同，但逐批读入三角形（batches 产生 STL_DTYPE 数组）。
+    每批先在批内合并顶点，未合并的部分结果超过已合并结果的大小时再统一合并，
+    内存占用取决于顶点数而不是三角形数。
+    """
+    vertices, sums = _batched_vertex_sums(batches, weighting)
+    return vertices, _normalize(sums)
 
-if __name__ == "__main__":
-    input_directory = "data/extract_points"  # 输入文件夹路径
-    output_directory = "data_output/extract_points"  # 输出文件夹路径
+
+def _batched_vertex_sums(batches, weighting):
+    """batched_vertex_normals 归一化之前的 (顶点, 法向量累加和)"""
+    merged = (np.zeros((0, 3), dtype=np.float32), np.zeros((0, 3)))
+    pending, pending_rows = [], 0
+    for records in batches:
+        vectors = records['vectors']
+        part = _accumulate(vectors.reshape(-1, 3),
+                           _corner_normals(vectors, face_normals(vectors), weighting))
+        pending.append(part)
+        pending_rows += len(part[0])
+        if pending_rows > len(merged[0]):
+            parts = [merged] + pending
+            merged = _accumulate(np.concatenate([p[0] for p in parts]),
+                                 np.concatenate([p[1] for p in parts]))
+            pending, pending_rows = [], 0
+    if pending:
+        parts = [merged] + pending
+        merged = _accumulate(np.concatenate([p[0] for p in parts]),
+                             np.concatenate([p[1] for p in parts]))
+    return merged
+
+
+def process_stl_file(file_path, output_file_path, weighting='none', batch_size=None, weld=None):
+    """
+    处理单个STL文件，提取点云数据和法向量，保存为TXT格式。
+    batch_size 给定时每次只读入这么多个三角形，用于超过内存的大网格。
+    weld 给定时按该容差焊接坐标有微小抖动的顶点（见 weld_vertices）。
+    """
+    if batch_size is None:
+        # 二进制 STL 直接内存映射，面法向量与 numpy-stl 一样按顶点重算
+        vectors = read_stl(file_path)['vectors']
+        vertices, sums = _accumulate(vectors.reshape(-1, 3),
+                                     _corner_normals(vectors, face_normals(vectors), weighting))
+    else:
+        vertices, sums = _batched_vertex_sums(iter_stl(file_path, batch_size), weighting)
+    if weld:
+        # 先合并坐标完全相同的顶点，焊接只需处理去重后的顶点
+        vertices, sums, merged = weld_vertices(vertices, sums, weld)
+        instrumentation.count('welded', merged)
+        print(f"{file_path}: 焊接合并了 {merged} 个顶点（{len(vertices) + merged} -> {len(vertices)}）")
+
+    # 保留 6 位小数（ROUND_HALF_UP），与 Decimal.quantize 的结果一致，
+    # 将提取的数据保存到TXT文件
+    write_bytes(output_file_path, format_rows(np.hstack((vertices, _normalize(sums))), 'quantize'))
+    return len(vertices)
+
+
+def process_directory(input_dir, output_dir, jobs=1, weighting='none', batch_size=None,
+                      force=False, weld=None):
+    """递归遍历输入文件夹并处理所有STL文件，将数据输出为TXT文件"""
+    tasks = []
+    for input_file_path in walk_files(input_dir, '.stl'):
+        relative_path = os.path.relpath(input_file_path, input_dir)
+        output_file_path = os.path.join(output_dir, relative_path.replace('.stl', '.txt'))
+        tasks.append((input_file_path,
+                      (input_file_path, output_file_path, weighting, batch_size, weld),
+                      [output_file_path]))
+
+    # 处理每个STL文件，并保存为TXT
+    manifest = Manifest(output_dir, {'weighting': weighting, 'weld': weld}, force)
+    # 分批读取时不预读整个文件，保持内存占用与文件大小无关
+    return run_tasks(process_stl_file, tasks, jobs, manifest, prefetch=batch_size is None)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="从 STL 网格提取顶点及顶点法向量")
+    parser.add_argument('input_dir', nargs='?', default="data/extract_points", help="输入文件夹路径")
+    parser.add_argument('output_dir', nargs='?', default="data_output/extract_points", help="输出文件夹路径")
+    parser.add_argument('--weighting', choices=WEIGHTINGS, default='none',
+                        help="顶点法向量的加权方式（默认 none：直接平均面法向量）")
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help="每批读入的三角形个数，用于超过内存的大网格（默认整个网格一次读入）")
+    parser.add_argument('--weld', type=float, default=None,
+                        help="焊接容差：坐标相差约在该值以内的顶点合并为一个（默认只合并坐标完全相同的顶点）")
+    add_jobs_argument(parser)
+    add_force_argument(parser)
+    args = parser.parse_args()
+    if args.weld is not None and args.weld <= 0:
+        parser.error("--weld 必须大于 0")
 
     # 处理文件夹
-    process_directory(input_directory, output_directory)
+    process_directory(args.input_dir, args.output_dir, args.jobs, args.weighting, args.batch_size,
+                      args.force, args.weld)
 
     print("处理完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,31 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-查找两个文件夹中重复的文件名
+查找两个文件夹中重复的文件名，或按内容查找重复的文件
+
+用法:
+    python find_duplicate_files.py 文件夹1 文件夹2 [recursive] [--content] [--workers N]
+省略文件夹时交互输入（只在终端中运行时）。
+
+--content 按文件内容比较（改名的副本也能找到，同名但内容不同的文件不算重复）：
+先按文件大小分组，大小相同的再比较首尾各 64KB 的哈希，仍相同的才多线程计算整个文件的哈希，
+大多数文件只需读取很少的字节。
 """
 
+import argparse
+import hashlib
 import os
 import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from point_cloud_cache import file_digest
+
+
+# 内容比较时首尾各读取的字节数
+EDGE_SIZE = 64 * 1024
+
 
 def get_filenames_from_folder(folder_path):
     """
@@ -105,17 +123,192 @@ def find_duplicate_filenames(folder1_path, folder2_path, recursive=False):
     return duplicate_filenames, len(filenames1), len(filenames2)
 
 
+def get_file_paths(folder_path, recursive=False):
+    """
+    获取文件夹中所有文件的路径
+    
+    Args:
+        folder_path (str): 文件夹路径
+        recursive (bool): 是否递归搜索子文件夹
+        
+    Returns:
+        list: 文件路径（Path）列表
+    """
+    folder = Path(folder_path)
+    if not folder.is_dir():
+        print(f"错误: '{folder_path}' 不存在或不是一个文件夹")
+        return []
+    items = folder.rglob('*') if recursive else folder.iterdir()
+    return [item for item in items if item.is_file() and not item.is_symlink()]
+
+
+def edge_digest(file_path, size, edge_size=EDGE_SIZE):
+    """
+    文件首尾各 edge_size 字节的哈希；文件不超过 2 * edge_size 时即整个文件的哈希
+    
+    Args:
+        file_path (Path): 文件路径
+        size (int): 文件大小
+        edge_size (int): 首尾各读取的字节数
+        
+    Returns:
+        str: 哈希值
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        if size <= 2 * edge_size:
+            digest.update(f.read())
+        else:
+            digest.update(f.read(edge_size))
+            f.seek(size - edge_size)
+            digest.update(f.read(edge_size))
+    return digest.hexdigest()
+
+
+def _refine(groups, key_func, workers):
+    """
+    对每组候选文件计算 key_func，只保留 key 相同（至少两个文件）的子组
+    
+    Args:
+        groups (list): [[(文件夹序号, 路径, 大小), ...], ...]
+        key_func (callable): (路径, 大小) -> key，在线程池中执行
+        workers (int): 线程数
+        
+    Returns:
+        list: 细分后的候选组
+    """
+    files = [item for group in groups for item in group]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        keys = list(pool.map(lambda item: _safe_key(key_func, item), files))
+    refined = []
+    start = 0
+    for group in groups:
+        buckets = defaultdict(list)
+        for item, key in zip(group, keys[start:start + len(group)]):
+            if key is not None:
+                buckets[key].append(item)
+        start += len(group)
+        refined.extend(b for b in buckets.values() if len(b) > 1)
+    return refined
+
+
+def _safe_key(key_func, item):
+    try:
+        return key_func(item[1], item[2])
+    except OSError as e:
+        print(f"读取文件 '{item[1]}' 时出错: {e}")
+        return None
+
+
+def find_duplicate_contents(folder1_path, folder2_path, recursive=False, workers=8,
+                            edge_size=EDGE_SIZE):
+    """
+    按内容查找两个文件夹中（以及各文件夹内部）重复的文件
+    
+    分三步逐步缩小候选范围：文件大小 -> 首尾 edge_size 字节的哈希 -> 整个文件的哈希，
+    后两步在线程池中并行读取。
+    
+    Args:
+        folder1_path (str): 第一个文件夹路径
+        folder2_path (str): 第二个文件夹路径
+        recursive (bool): 是否递归搜索子文件夹，默认为False
+        workers (int): 读取文件的线程数
+        edge_size (int): 首尾各读取的字节数
+        
+    Returns:
+        tuple: (重复文件组列表, 文件夹1文件数, 文件夹2文件数, 读取字节数, 跳过的文件数)，
+               每组为 [(文件夹序号 1/2, 路径), ...]；扫描后消失或无法访问的文件跳过
+    """
+    files = []
+    seen = set()
+    counts = []
+    skipped = 0
+    for index, folder in enumerate((folder1_path, folder2_path), 1):
+        print(f"正在扫描文件夹: {folder}")
+        paths = get_file_paths(folder, recursive)
+        counts.append(len(paths))
+        for path in paths:
+            real = os.path.realpath(path)
+            if real in seen:  # 两个文件夹有重叠时同一个文件只算一次
+                continue
+            seen.add(real)
+            try:
+                size = path.stat().st_size
+            except OSError as e:
+                print(f"读取文件 '{path}' 时出错: {e}")
+                skipped += 1
+                continue
+            files.append((index, path, size))
+
+    # 第一步：按大小分组
+    by_size = defaultdict(list)
+    for item in files:
+        by_size[item[2]].append(item)
+    groups = [g for g in by_size.values() if len(g) > 1]
+    bytes_read = 0
+
+    # 第二步：首尾哈希（空文件无需读取）
+    candidates = [g for g in groups if g[0][2] > 0]
+    bytes_read += sum(min(item[2], 2 * edge_size) for g in candidates for item in g)
+    refined = _refine(candidates, lambda path, size: edge_digest(path, size, edge_size), workers)
+
+    # 第三步：只对首尾读不全的大文件计算完整哈希
+    small = [g for g in refined if g[0][2] <= 2 * edge_size]
+    large = [g for g in refined if g[0][2] > 2 * edge_size]
+    bytes_read += sum(item[2] for g in large for item in g)
+    large = _refine(large, lambda path, size: file_digest(path), workers)
+
+    duplicates = [g for g in groups if g[0][2] == 0] + small + large
+    duplicates = [[(index, path) for index, path, _ in group] for group in duplicates]
+    duplicates.sort(key=lambda group: str(group[0][1]))
+    return duplicates, counts[0], counts[1], bytes_read, skipped
+
+
+def print_content_duplicates(duplicates):
+    """
+    按 跨文件夹 / 文件夹1内部 / 文件夹2内部 分类输出重复文件组
+    
+    Args:
+        duplicates (list): find_duplicate_contents 返回的重复文件组
+    """
+    sections = [("两个文件夹之间", []), ("文件夹1内部", []), ("文件夹2内部", [])]
+    for group in duplicates:
+        folders = {index for index, _ in group}
+        sections[0 if len(folders) == 2 else min(folders)][1].append(group)
+    for title, groups in sections:
+        print(f"\n{title}: {len(groups)} 组内容相同的文件")
+        print("-" * 30)
+        for group in groups:
+            for index, path in group:
+                print(f"  [{index}] {path}")
+            print()
+
+
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="查找两个文件夹中重复的文件名，或按内容查找重复的文件")
+    parser.add_argument('folder1', nargs='?', help="第一个文件夹路径（省略时交互输入）")
+    parser.add_argument('folder2', nargs='?', help="第二个文件夹路径（省略时交互输入）")
+    parser.add_argument('recursive', nargs='?', default='',
+                        help="写 recursive（或 true/1/yes）时递归搜索子文件夹")
+    parser.add_argument('--content', action='store_true', help="按文件内容比较")
+    parser.add_argument('--workers', type=int, default=8, help="按内容比较时读取文件的线程数")
+    args = parser.parse_args()
+    content = args.content
+    workers = args.workers
+    if not args.folder2 and not sys.stdin.isatty():
+        # 非交互运行（如由调度程序启动）时不等待输入
+        parser.error("请提供两个文件夹路径")
+
     print("=" * 50)
-    print("查找两个文件夹中重复的文件名")
+    print("按内容查找两个文件夹中重复的文件" if content else "查找两个文件夹中重复的文件名")
     print("=" * 50)
     
     # 获取用户输入
-    if len(sys.argv) >= 3:
-        folder1 = sys.argv[1]
-        folder2 = sys.argv[2]
-        recursive = len(sys.argv) > 3 and sys.argv[3].lower() in ['true', '1', 'yes', 'recursive']
+    if args.folder2:
+        folder1 = args.folder1
+        folder2 = args.folder2
+        recursive = args.recursive.lower() in ['true', '1', 'yes', 'recursive']
     else:
         folder1 = input("请输入第一个文件夹路径: ").strip()
         folder2 = input("请输入第二个文件夹路径: ").strip()
@@ -129,6 +322,19 @@ def main():
     print(f"\n搜索模式: {'递归搜索（包括子文件夹）' if recursive else '仅搜索当前文件夹'}")
     print("-" * 50)
     
+    if content:
+        duplicates, count1, count2, bytes_read, skipped = find_duplicate_contents(
+            folder1, folder2, recursive, workers)
+        print(f"\n文件夹1 ({folder1}) 包含 {count1} 个文件")
+        print(f"文件夹2 ({folder2}) 包含 {count2} 个文件")
+        if skipped:
+            print(f"跳过 {skipped} 个无法访问的文件")
+        print(f"共读取 {bytes_read / 1024 ** 2:.1f} MB")
+        print("-" * 50)
+        print_content_duplicates(duplicates)
+        print("=" * 50)
+        return
+    
     # 查找重复文件名
     duplicate_filenames, count1, count2 = find_duplicate_filenames(folder1, folder2, recursive)
     
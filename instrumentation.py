@@ -0,0 +1,264 @@
+"""
+目录批处理的分阶段计时和统计
+
+默认关闭。设置环境变量 POINT_CLOUD_METRICS=metrics.jsonl（或在代码中调用 configure()）后，
+directory_runner.run_tasks 对每个输入文件记录：
+    stages   各阶段的墙钟时间和 CPU 时间（秒）：read 读文件、parse 切分解析、format 数值格式化、
+             write 写出、render 绘图，transform 为不属于以上阶段的其余时间（各脚本自身的计算）
+    counts   rows_in 读入行数；bad_columns 列数不符的行数（多数脚本丢弃，change_labels 等原样保留）；
+             dropped_nan / dropped_inf / dropped_zero_norm 因法向量无效丢弃的行数
+             welded 网格焊接合并的顶点数；unmatched 迁移标签时没有匹配的点数
+    points   写出的点数；bytes_read / bytes_written 输入和输出文件的大小；peak_rss_mb 峰值内存
+每个文件一行追加写入 JSON-lines 文件，运行结束时打印各阶段的汇总表。
+阶段可以嵌套，外层阶段只计入去掉内层阶段之后的时间。关闭时 stage() 只返回一个共享的空对象。
+
+设置 POINT_CLOUD_PROFILE=模式（fnmatch，匹配输入文件路径）时，对匹配的文件运行 cProfile 和
+tracemalloc，统计保存为 profile-<文件名>.prof（指标文件所在目录，否则当前目录），并打印耗时
+和内存分配最多的位置。与指标记录互不依赖。
+"""
+
+import contextlib
+import fnmatch
+import functools
+import json
+import os
+import resource
+import sys
+import time
+
+
+_config = {}
+_record = None  # 正在处理的文件的记录，未启用或不在任务中时为 None
+_stack = []     # 正在计时的阶段：[名称, 开始墙钟, 开始 CPU, 内层阶段墙钟, 内层阶段 CPU]
+
+# 阶段的显示顺序；transform 为其余时间
+STAGES = ('read', 'parse', 'transform', 'format', 'write', 'render')
+
+
+def configure(metrics_path=None, profile=None):
+    """启用指标记录（metrics_path）和/或对匹配 profile 的文件做性能分析"""
+    _config.clear()
+    if metrics_path:
+        _config['metrics_path'] = metrics_path
+        # 写入环境变量，使子进程也记录指标
+        os.environ['POINT_CLOUD_METRICS'] = metrics_path
+    if profile:
+        _config['profile'] = profile
+        os.environ['POINT_CLOUD_PROFILE'] = profile
+
+
+def disable():
+    _config.clear()
+    for name in ('POINT_CLOUD_METRICS', 'POINT_CLOUD_PROFILE'):
+        os.environ.pop(name, None)
+
+
+def metrics_path():
+    """指标文件路径，未启用时返回 None"""
+    return _config.get('metrics_path') or os.environ.get('POINT_CLOUD_METRICS') or None
+
+
+def _profile_pattern():
+    return _config.get('profile') or os.environ.get('POINT_CLOUD_PROFILE') or None
+
+
+class _Stage:
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        _stack.append([self.name, time.perf_counter(), time.process_time(), 0.0, 0.0])
+
+    def __exit__(self, *exc):
+        name, wall0, cpu0, inner_wall, inner_cpu = _stack.pop()
+        wall = time.perf_counter() - wall0
+        cpu = time.process_time() - cpu0
+        if _stack:
+            _stack[-1][3] += wall
+            _stack[-1][4] += cpu
+        if _record is not None:
+            totals = _record['stages'].setdefault(name, [0.0, 0.0])
+            totals[0] += wall - inner_wall
+            totals[1] += cpu - inner_cpu
+
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+def stage(name):
+    """with stage('parse'): ... 把其中的时间计入该阶段；未在记录时什么也不做"""
+    if _record is None:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def timed(name):
+    """装饰器：把函数的执行时间计入阶段 name"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _record is None:
+                return func(*args, **kwargs)
+            with _Stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, n=1):
+    """累加当前文件的计数"""
+    if _record is not None:
+        counts = _record['counts']
+        counts[name] = counts.get(name, 0) + int(n)
+
+
+def _peak_rss_reset():
+    # Linux 上向 /proc/self/clear_refs 写入 5 可把峰值内存（VmHWM）重置为当前值，
+    # 进程池中的每个文件因此得到自己的峰值；不支持时退回进程生命周期内的峰值
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+@contextlib.contextmanager
+def _profiled(input_path):
+    """对匹配 POINT_CLOUD_PROFILE 的文件运行 cProfile 和 tracemalloc"""
+    pattern = _profile_pattern()
+    if pattern is None or not (fnmatch.fnmatch(input_path, pattern) or pattern in input_path):
+        yield
+        return
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        folder = os.path.dirname(metrics_path() or '') or '.'
+        name = os.path.splitext(os.path.basename(input_path))[0]
+        prof_path = os.path.join(folder, f"profile-{name}.prof")
+        profiler.dump_stats(prof_path)
+        print(f"性能分析 {input_path}，统计已保存: {prof_path}")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+        print(f"Python 内存分配峰值 {peak / 1024 ** 2:.1f} MB，分配最多的位置:")
+        for stat in snapshot.statistics('lineno')[:10]:
+            print(f"  {stat}")
+
+
+def run_file(func, args, input_path, outputs):
+    """
+    执行 func(*args)，返回 (结果, 记录)；未启用指标时记录为 None。
+    异常照常抛出，由调用方记录为失败。
+    """
+    global _record
+    if metrics_path() is None:
+        with _profiled(input_path):
+            return func(*args), None
+    record = {'file': input_path, 'stages': {}, 'counts': {}}
+    _peak_rss_reset()
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    _record = record
+    try:
+        with _profiled(input_path):
+            result = func(*args)
+    finally:
+        _record = None
+        del _stack[:]
+    wall = time.perf_counter() - wall0
+    cpu = time.process_time() - cpu0
+    stages = record['stages']
+    named_wall = sum(t[0] for t in stages.values())
+    named_cpu = sum(t[1] for t in stages.values())
+    stages['transform'] = [max(wall - named_wall, 0.0), max(cpu - named_cpu, 0.0)]
+    record['stages'] = {name: [round(w, 6), round(c, 6)] for name, (w, c) in stages.items()}
+    record.update(
+        wall=round(wall, 6), cpu=round(cpu, 6), points=result or 0,
+        bytes_read=_file_size(input_path),
+        bytes_written=sum(_file_size(p) for p in outputs),
+        peak_rss_mb=round(_peak_rss_mb(), 1),
+    )
+    return result, record
+
+
+def write_records(func, records, failed=()):
+    """把各文件的记录追加到指标文件（每个文件一行 JSON），script 记为 脚本名.函数名"""
+    path = metrics_path()
+    if path is None or not (records or failed):
+        return
+    module = sys.modules[func.__module__]
+    script = os.path.splitext(os.path.basename(module.__file__))[0] + '.' + func.__name__
+    run = time.strftime('%Y-%m-%dT%H:%M:%S')
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(dict(record, script=script, run=run, status='ok'),
+                               ensure_ascii=False) + '\n')
+        for input_path in failed:
+            f.write(json.dumps({'file': input_path, 'script': script, 'run': run,
+                                'status': 'failed'}, ensure_ascii=False) + '\n')
+
+
+def print_table(records, slowest=5):
+    """打印各阶段的汇总表、行数统计和最慢的几个文件"""
+    if not records:
+        return
+    wall = sum(r['wall'] for r in records)
+    stages = {}
+    for record in records:
+        for name, (w, c) in record['stages'].items():
+            totals = stages.setdefault(name, [0.0, 0.0])
+            totals[0] += w
+            totals[1] += c
+    order = [name for name in STAGES if name in stages] + sorted(set(stages) - set(STAGES))
+    print(f"{'阶段':<10}{'墙钟(秒)':>10}{'CPU(秒)':>10}{'占比':>8}")
+    for name in order:
+        w, c = stages[name]
+        share = w / wall * 100 if wall else 0.0
+        print(f"{name:<12}{w:>10.3f}{c:>10.3f}{share:>7.1f}%")
+    print(f"{'合计':<10}{wall:>10.3f}{sum(r['cpu'] for r in records):>10.3f}")
+
+    counts = {}
+    for record in records:
+        for name, n in record['counts'].items():
+            counts[name] = counts.get(name, 0) + n
+    mb_read = sum(r['bytes_read'] for r in records) / 1024 ** 2
+    mb_written = sum(r['bytes_written'] for r in records) / 1024 ** 2
+    detail = '，'.join(f"{name} {n}" for name, n in sorted(counts.items()) if n)
+    print(f"读入 {mb_read:.1f} MB，写出 {mb_written:.1f} MB，"
+          f"峰值内存 {max(r['peak_rss_mb'] for r in records):.0f} MB"
+          + (f"；{detail}" if detail else ""))
+    if len(records) > 1:
+        print("最慢的文件:")
+        for record in sorted(records, key=lambda r: -r['wall'])[:slowest]:
+            print(f"  {record['wall']:8.3f} 秒  {record['file']}")
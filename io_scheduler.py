@@ -0,0 +1,248 @@
+"""
+目录批处理的输入预读和异步写出
+
+默认关闭。设置环境变量 POINT_CLOUD_PREFETCH=预读文件数 和/或 POINT_CLOUD_WRITE_QUEUE=写队列长度
+（或在代码中调用 configure()）后，directory_runner.run_tasks 串行处理时：
+    读   读线程按任务顺序提前把之后的输入文件整个读入内存，正在处理的文件之后最多 prefetch 个、
+         合计（含正在处理的文件）不超过 max_bytes；point_cloud_io.map_file 读取这些文件时
+         直接返回内存中的内容。
+         大于 max_bytes 的文件不预读，由任务自己内存映射读取；按块流式处理的运行不预读
+         （run_tasks 的 prefetch=False），否则文件会被读两遍并整个留在内存中
+    写   point_cloud_io.write_bytes 把输出交给写线程，最多 write_queue 个输出排队，队满时等待；
+         任务的输出写失败时该任务记为失败
+读、计算、写互相重叠，在 NFS 等高延迟的存储上总时间接近三者中最慢的一项，而不是三者之和。
+同一时刻在内存中的数据不超过 预读的 max_bytes + write_queue 个输出 + 正在处理的文件。
+读线程同时计算文件的内容哈希，build_manifest 记录处理结果时不必再读一遍输入。
+进程池（jobs > 1）中各进程的读写本来就与其他进程的计算重叠，不使用预读和写线程。
+
+无论是否启用，输出都先写入同目录下的临时文件再改名（原子替换），
+中途失败或被中断时不会留下写了一半的输出。
+"""
+
+import hashlib
+import os
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_THREADS = 2
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+_config = {}
+_active = None    # 正在运行的 Scheduler
+_digests = {}     # 绝对路径 -> (大小, 修改时间, 内容哈希)，由读线程记录
+
+
+def configure(prefetch=4, write_queue=4, threads=DEFAULT_THREADS, max_bytes=DEFAULT_MAX_BYTES):
+    """启用预读（prefetch 个文件）和异步写出（write_queue 个输出排队），为 0 时不启用该项"""
+    _config.update(prefetch=prefetch, write_queue=write_queue, threads=threads,
+                   max_bytes=max_bytes)
+
+
+def disable():
+    _config.clear()
+    for name in ('POINT_CLOUD_PREFETCH', 'POINT_CLOUD_WRITE_QUEUE', 'POINT_CLOUD_IO_THREADS',
+                 'POINT_CLOUD_PREFETCH_MAX_BYTES'):
+        os.environ.pop(name, None)
+
+
+def _settings():
+    """当前设置，预读和异步写出都未启用时返回 None"""
+    settings = _config or {
+        'prefetch': int(os.environ.get('POINT_CLOUD_PREFETCH') or 0),
+        'write_queue': int(os.environ.get('POINT_CLOUD_WRITE_QUEUE') or 0),
+        'threads': int(os.environ.get('POINT_CLOUD_IO_THREADS') or DEFAULT_THREADS),
+        'max_bytes': int(os.environ.get('POINT_CLOUD_PREFETCH_MAX_BYTES') or DEFAULT_MAX_BYTES),
+    }
+    if settings['prefetch'] <= 0 and settings['write_queue'] <= 0:
+        return None
+    return settings
+
+
+class AtomicFile:
+    """
+    写入 path 同目录下的临时文件，commit() 时改名为 path，discard() 时删除。
+    用作上下文管理器时正常退出即 commit，异常退出即 discard。
+    """
+
+    def __init__(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.tmp_path = os.path.join(
+            folder, f".{os.path.basename(path)}.{os.getpid()}-{threading.get_ident()}.tmp")
+        self.file = open(self.tmp_path, 'wb')
+
+    def write(self, data):
+        return self.file.write(data)
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+
+def atomic_write(path, data):
+    """先写临时文件再改名，读者不会看到写了一半的文件"""
+    with AtomicFile(path) as f:
+        f.write(data)
+
+
+def _read(path):
+    """读线程：整个读入文件并记录内容哈希（与 point_cloud_cache.file_digest 相同）"""
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        data = f.read()
+    _digests[path] = (st.st_size, st.st_mtime_ns,
+                      hashlib.blake2b(data, digest_size=20).hexdigest())
+    return data
+
+
+class Scheduler:
+    """一次串行运行的预读和写出；paths 为各任务的输入文件，按处理顺序排列"""
+
+    def __init__(self, paths, prefetch, write_queue, threads, max_bytes):
+        self.prefetch = prefetch
+        self.max_bytes = max_bytes
+        self._upcoming = [os.path.abspath(path) for path in paths] if prefetch > 0 else []
+        self._next = 0
+        self._buffers = OrderedDict()   # 路径 -> (future, 大小)，按任务顺序
+        self._current = None
+        self._readers = ThreadPoolExecutor(threads, 'prefetch') if prefetch > 0 else None
+        self._writers = ThreadPoolExecutor(threads, 'writer') if write_queue > 0 else None
+        self._slots = threading.BoundedSemaphore(max(write_queue, 1))
+        self._writes = []               # (任务输入, 输出路径, future)
+        self._pending = {}              # 输出路径 -> 最近一次写出的 future
+
+    def begin(self, path):
+        """开始处理 path：释放之前任务的预读内容，并补充预读"""
+        self._current = os.path.abspath(path)
+        while self._buffers and next(iter(self._buffers)) != self._current:
+            self._buffers.popitem(last=False)[1][0].cancel()
+        self._fill()
+
+    def _fill(self):
+        """在当前文件之后最多预读 prefetch 个文件（当前文件的内容不计入）"""
+        in_flight = sum(size for _, size in self._buffers.values())
+        ahead = len(self._buffers) - (self._current in self._buffers)
+        while self._next < len(self._upcoming) and ahead < self.prefetch:
+            path = self._upcoming[self._next]
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            if size > self.max_bytes:
+                self._next += 1  # 单个文件就超过上限：不预读，处理时内存映射读取
+                continue
+            if in_flight + size > self.max_bytes:
+                break
+            self._next += 1
+            self._buffers[path] = (self._readers.submit(_read, path), size)
+            in_flight += size
+            ahead += 1
+
+    def take(self, path):
+        """path 已预读时返回其内容（读完之前等待），否则返回 None"""
+        entry = self._buffers.get(os.path.abspath(path))
+        if entry is None:
+            return None
+        try:
+            return entry[0].result()
+        except OSError:
+            return None  # 读失败时由调用方重新读取并报告错误
+
+    def write(self, path, data):
+        """把输出交给写线程；同一输出的上一次写出完成之前不会开始下一次"""
+        if self._writers is None:
+            atomic_write(path, data)
+            return
+        previous = self._pending.get(path)
+        if previous is not None:
+            previous.exception()
+        self._slots.acquire()
+        future = self._writers.submit(self._write, path, data)
+        self._writes.append((self._current, path, future))
+        self._pending[path] = future
+
+    def _write(self, path, data):
+        try:
+            atomic_write(path, data)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """等待所有写出完成，返回 {任务输入: 错误信息}"""
+        if self._readers is not None:
+            self._readers.shutdown(wait=True, cancel_futures=True)
+        self._buffers.clear()
+        errors = {}
+        if self._writers is not None:
+            self._writers.shutdown(wait=True)
+            for task, path, future in self._writes:
+                error = future.exception()
+                if error is not None and task not in errors:
+                    errors[task] = (f"写出 {path} 失败\n"
+                                    + ''.join(traceback.format_exception(
+                                        type(error), error, error.__traceback__)))
+        return errors
+
+
+def start(paths):
+    """为一次串行运行启动预读和写线程，未启用时返回 None"""
+    global _active
+    settings = _settings()
+    if settings is None:
+        return None
+    _digests.clear()
+    _active = Scheduler(paths, **settings)
+    return _active
+
+
+def stop(scheduler):
+    """结束运行，返回写失败的任务 {输入文件绝对路径: 错误信息}"""
+    global _active
+    if scheduler is None:
+        return {}
+    _active = None
+    return scheduler.close()
+
+
+def take(path):
+    """预读的文件内容，不在预读中时返回 None"""
+    if _active is None:
+        return None
+    return _active.take(path)
+
+
+def write(path, data):
+    """原子地写出文件；启用异步写出时交给写线程"""
+    if _active is None:
+        atomic_write(path, data)
+    else:
+        _active.write(path, data)
+
+
+def known_digest(path, st):
+    """读线程记录的内容哈希，文件的大小或修改时间与 st 不同时返回 None"""
+    entry = _digests.get(os.path.abspath(path))
+    if entry is None or entry[:2] != (st.st_size, st.st_mtime_ns):
+        return None
+    return entry[2]
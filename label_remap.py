@@ -0,0 +1,89 @@
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+
+from point_cloud_io import map_unique
+
+
+def remap_numeric(tokens, table):
+    """
+    数值查表映射：按标签的整数部分查 table（未列出的保持不变），
+    结果按原标签的小数位数量化，如 "3.000000" -> "1.000000"。
+    """
+    def remap(token):
+        label_dec = Decimal(token.decode())
+        orig_int = int(label_dec)
+        mapped = table.get(orig_int, orig_int)
+        return str(Decimal(mapped).quantize(label_dec)).encode()
+
+    return map_unique(tokens, remap)
+
+
+def _decimal(text):
+    """文本对应的有限数值，不是数值时返回 None"""
+    try:
+        value = Decimal(text)
+    except InvalidOperation:
+        return None
+    return value if value.is_finite() else None
+
+
+def label_matcher(keys, numeric=True):
+    """
+    返回 token -> 匹配的键：原始文本相同的优先，numeric 为 True 时其次匹配数值相等的
+    （如 b"1.000000" 匹配 "1"），都没有时为 None。
+    """
+    exact = {k.encode(): k for k in keys}
+    values = {}
+    for k in keys if numeric else ():
+        value = _decimal(k)
+        if value is not None:
+            values.setdefault(value, k)
+
+    def match(token):
+        if token in exact or not values:
+            return exact.get(token)
+        value = _decimal(token.decode(errors='replace'))
+        return None if value is None else values.get(value)
+
+    return match
+
+
+def remap_tokens(tokens, table, numeric=False):
+    """
+    字符串查表映射：按原始文本精确匹配 table（未列出的保持不变）。
+    numeric 为 True 时文本不同但数值相等的标签也映射，结果按原标签的小数位数量化，
+    如 table {"1": "2"} 把 "1.000000" 映射为 "2.000000"。
+    """
+    if not numeric:
+        lut = {k.encode(): v.encode() for k, v in table.items()}
+        return map_unique(tokens, lambda t: lut.get(t, t))
+    match = label_matcher(table)
+
+    def remap(token):
+        key = match(token)
+        if key is None:
+            return token
+        mapped = table[key]
+        if token != key.encode() and _decimal(mapped) is not None:
+            return str(Decimal(mapped).quantize(Decimal(token.decode()))).encode()
+        return mapped.encode()
+
+    return map_unique(tokens, remap)
+
+
+def select_labels(label1, label2, rules, default=0):
+    """
+    双列选择规则：按 label2 的原始文本在 rules 中查出取哪一列
+    （0 取 label1，1 取 label2）。未列出的取值使用 default，
+    并返回这些行的下标供调用方提示。
+    """
+    choice = np.full(len(label2), default, dtype=np.int8)
+    known = np.zeros(len(label2), dtype=bool)
+    for value, column in rules.items():
+        hit = label2 == value.encode()
+        choice[hit] = column
+        known |= hit
+    width = max(label1.itemsize, label2.itemsize)
+    labels = np.where(choice == 1, label2.astype(f'S{width}'), label1.astype(f'S{width}'))
+    return labels, np.flatnonzero(~known)
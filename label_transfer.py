@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+把带标签点云（标注的或 _predicted 预测结果，x y z nx ny nz label）的标签迁移到
+extract_points_from_mesh 提取的无标签点（x y z nx ny nz）上。两者的顶点集合不同，
+每个目标点取标注点云中距离不超过 max_dist 的最近点的标签，或 k 个近邻中的多数标签
+（票数相同时取较近的一方）。输出为 7 列 x y z nx ny nz label，可直接交给 change_labels。
+范围内没有标注点的目标点默认丢弃（--fill 指定标签时保留），每个文件报告无匹配的点数。
+
+空间索引为均匀体素哈希网格：标注点按所在体素的编号排序，查询时由近及远逐圈查找相邻体素，
+第 k 近的距离不超过已查找的范围时即停止。全部为 NumPy 向量化操作，查询点按体素排序后分块处理，
+千万级点对千万级点在几分钟内完成。体素边长默认按标注点的密度从 max_dist 开始自动缩小。
+
+命令行：
+    python label_transfer.py 标注点云 目标点云 输出 --max-dist D [-k K] [--fill LABEL]
+三个参数可以都是文件，也可以都是文件夹：文件夹时目标点云按相对路径与标注点云配对
+（标注点云的文件名可以带 _predicted 后缀，同名的标注文件优先），输出保持相同的相对路径。
+"""
+
+import argparse
+import os
+from itertools import product
+
+import numpy as np
+
+import instrumentation
+from build_manifest import Manifest
+from directory_runner import add_force_argument, add_jobs_argument, run_tasks, walk_files
+from point_cloud_io import (XYZ_NORMAL, XYZ_NORMAL_LABEL, canonical_decimal, join_columns,
+                            read_point_cloud, report_bad_rows, write_bytes)
+
+
+# 自动选择体素边长时每个非空体素的平均点数上限
+TARGET_OCCUPANCY = 4
+# 体素边长最小为 max_dist / MAX_RINGS，即每个查询最多向外查找这么多圈
+MAX_RINGS = 4
+# 每块查询的点数，块内临时数组的内存以此为上限
+QUERY_BLOCK = 1 << 20
+# 体素过多时哈希编号的乘数（按 2^64 取模）
+_HASH = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9], dtype=np.uint64)
+
+
+def _ring(r):
+    """与中心体素的切比雪夫距离恰为 r 的体素偏移，(n, 3) 数组"""
+    if r == 0:
+        return np.zeros((1, 3), dtype=np.int64)
+    offsets = np.array(list(product(range(-r, r + 1), repeat=3)), dtype=np.int64)
+    return offsets[np.abs(offsets).max(axis=1) == r]
+
+
+class VoxelGrid:
+    """
+    均匀体素哈希网格。points 为 (N, 3) 数组，按体素编号排序后保存，
+    查询返回的下标指向原始 points 的行。
+    """
+
+    def __init__(self, points, cell):
+        points = np.asarray(points, dtype=np.float64)
+        if cell <= 0:
+            raise ValueError("体素边长必须大于 0")
+        self.cell = cell
+        self.origin = points.min(axis=0) if len(points) else np.zeros(3)
+        ijk = self._ijk(points)
+        self.dims = ijk.max(axis=0) + 1 if len(points) else np.ones(3, dtype=np.int64)
+        # 体素个数在 int64 范围内时按行优先编号，相邻体素在内存中也相近；
+        # 否则（离群点使包围盒很大）改用哈希，哈希冲突的体素只会多出一些候选点，结果不变
+        self.dense = np.prod(self.dims.astype(np.float64) + 2) < 2 ** 62
+        keys = self._linear(ijk)
+        self.order = np.argsort(keys, kind='stable')
+        keys = keys[self.order]
+        self.points = points[self.order]
+        # 非空体素的编号，以及其中的点在排序后数组中的起点和个数
+        self.starts = np.flatnonzero(np.diff(keys, prepend=-1)) if len(keys) else keys
+        self.cells = keys[self.starts]
+        self.counts = np.diff(np.append(self.starts, len(keys)))
+
+    def _ijk(self, points):
+        return np.floor((points - self.origin) / self.cell).astype(np.int64)
+
+    def _linear(self, ijk, dims=None):
+        """体素编号；查询点所在的体素在网格外一圈以内，按 dims + 2 编号"""
+        if not self.dense:
+            return (ijk.astype(np.uint64) * _HASH).sum(axis=1).view(np.int64)
+        dims = self.dims if dims is None else dims
+        return (ijk[:, 0] * dims[1] + ijk[:, 1]) * dims[2] + ijk[:, 2]
+
+    def _lookup(self, ijk, offset):
+        """各体素偏移 offset 之后的体素中的点：(起点, 个数)，空体素或网格外个数为 0"""
+        neighbour = ijk + offset
+        inside = np.all((neighbour >= 0) & (neighbour < self.dims), axis=1)
+        keys = self._linear(neighbour)
+        pos = np.minimum(np.searchsorted(self.cells, keys), len(self.cells) - 1)
+        hit = inside & (self.cells[pos] == keys)
+        return self.starts[pos], np.where(hit, self.counts[pos], 0)
+
+    def query(self, queries, k, max_dist):
+        """
+        查找每个查询点距离不超过 max_dist 的 k 个近邻，返回 (距离, 下标)，均为 (M, k) 数组，
+        每行按距离从近到远排列；不足 k 个时其余的距离为 inf、下标为 -1。
+        """
+        queries = np.asarray(queries, dtype=np.float64)
+        best_d2 = np.full((len(queries), k), np.inf)
+        best_i = np.full((len(queries), k), -1, dtype=np.int64)
+        if len(queries) == 0 or len(self.cells) == 0:
+            return best_d2, best_i
+        # 网格外的查询点移到网格外一圈的体素：到各体素的切比雪夫距离只会变小，
+        # 而到其中各点的实际距离不变，下面的查找范围和提前结束的条件仍然成立
+        ijk = np.clip(self._ijk(queries), -1, self.dims)
+        # max_dist 范围内的点都在 rings 圈以内
+        rings = int(np.ceil(max_dist / self.cell))
+        # 同一体素中的查询共用相邻体素的查找结果（哈希编号冲突时退回逐个查询点查找）
+        _, first, cell_of = np.unique(self._linear(ijk + 1, self.dims + 2),
+                                      return_index=True, return_inverse=True)
+        cell_ijk = ijk[first]
+        if not self.dense and np.any(cell_ijk[cell_of] != ijk):
+            cell_ijk, cell_of = ijk, np.arange(len(queries))
+        active = np.arange(len(queries))
+        for r in range(rings + 1):
+            cells, local = np.unique(cell_of[active], return_inverse=True)
+            for offset in _ring(r):
+                lo, count = self._lookup(cell_ijk[cells], offset)
+                self._scan(queries, active, lo[local], count[local], best_d2, best_i)
+            # 外圈体素中的点与查询点的距离至少为 r * cell，第 k 近已不超过它的查询不必再找
+            worst = best_d2[active].max(axis=1)
+            active = active[worst > (r * self.cell) ** 2]
+            if len(active) == 0:
+                break
+        too_far = best_d2 > max_dist ** 2
+        best_d2[too_far] = np.inf
+        best_i[too_far] = -1
+        order = np.argsort(best_d2, axis=1, kind='stable')
+        best_d2 = np.take_along_axis(best_d2, order, axis=1)
+        best_i = np.take_along_axis(best_i, order, axis=1)
+        found = best_i >= 0
+        best_i[found] = self.order[best_i[found]]
+        return np.sqrt(best_d2), best_i
+
+    def _scan(self, queries, rows, lo, count, best_d2, best_i):
+        """把 rows 各查询点的候选点（排序后数组中 lo 起的 count 个）并入当前的 k 近邻"""
+        nonempty = count > 0
+        rows, lo, count = rows[nonempty], lo[nonempty], count[nonempty]
+        # 每次取每个体素中的第 j 个点，同一批中每个查询只出现一次
+        for j in range(int(count.max(initial=0))):
+            if j:
+                more = count > j
+                rows, lo, count = rows[more], lo[more], count[more]
+            index = lo + j
+            d2 = ((self.points[index] - queries[rows]) ** 2).sum(axis=1)
+            slot = best_d2[rows].argmax(axis=1)
+            better = d2 < best_d2[rows, slot]
+            best_d2[rows[better], slot[better]] = d2[better]
+            best_i[rows[better], slot[better]] = index[better]
+
+
+def auto_grid(points, max_dist):
+    """
+    体素边长从 max_dist 开始减半，直到每个非空体素的平均点数不超过 TARGET_OCCUPANCY，
+    最小为 max_dist / MAX_RINGS。表面点云的密度按包围盒体积估计并不准确，因此直接统计。
+    """
+    grid = VoxelGrid(points, max_dist)
+    while grid.cell > max_dist / MAX_RINGS and len(grid.cells):
+        if len(grid.points) / len(grid.cells) <= TARGET_OCCUPANCY:
+            break
+        grid = VoxelGrid(points, grid.cell / 2)
+    return grid
+
+
+def majority(labels, index):
+    """
+    index 为 (M, k) 近邻下标（按距离排列，-1 为空），返回每行的多数标签编号，没有近邻时为 -1。
+    票数相同时取其中最近的点的标签。
+    """
+    codes = np.where(index >= 0, labels[np.maximum(index, 0)], -1)
+    if codes.shape[1] == 1:
+        return codes[:, 0]
+    valid = codes >= 0
+    votes = ((codes[:, :, None] == codes[:, None, :]) & valid[:, None, :]).sum(axis=2)
+    votes[~valid] = -1
+    winner = votes.argmax(axis=1)  # 相同票数取第一个，即较近的点
+    return codes[np.arange(len(codes)), winner]
+
+
+def transfer(source_points, source_labels, target_points, max_dist, k=1, cell=None):
+    """
+    source_labels 为每个标注点的标签编号（非负整数），返回 (每个目标点的标签编号, 最近距离)，
+    范围内没有标注点时标签编号为 -1、距离为 inf。
+    """
+    if not 0 < max_dist < np.inf:
+        raise ValueError("max_dist 必须是大于 0 的有限值")
+    grid = auto_grid(source_points, max_dist) if cell is None else VoxelGrid(source_points, cell)
+    target_points = np.asarray(target_points, dtype=np.float64)
+    codes = np.full(len(target_points), -1, dtype=np.int64)
+    nearest = np.full(len(target_points), np.inf)
+    # 查询点按体素排序，每块中同一体素的查询集中在一起，取点时访问相近的内存
+    ijk = np.clip(grid._ijk(target_points), -1, grid.dims)
+    order = np.argsort(grid._linear(ijk + 1, grid.dims + 2), kind='stable')
+    for start in range(0, len(order), QUERY_BLOCK):
+        block = order[start:start + QUERY_BLOCK]
+        distance, index = grid.query(target_points[block], k, max_dist)
+        codes[block] = majority(source_labels, index)
+        nearest[block] = distance[:, 0]
+    return codes, nearest
+
+
+def transfer_file(source_path, target_path, output_path, max_dist, k=1, cell=None, fill=None):
+    """
+    迁移单个文件的标签并写出 7 列结果，坐标和法向量保持目标点云的 Decimal 写法。
+    fill 为 None 时丢弃无匹配的点，否则以 fill 作为它们的标签。返回写出的点数。
+    """
+    source = read_point_cloud(source_path, XYZ_NORMAL_LABEL)
+    report_bad_rows(source_path, source)  # 列数不符的行直接丢弃
+    target = read_point_cloud(target_path, XYZ_NORMAL)
+    report_bad_rows(target_path, target)
+
+    names, labels = np.unique(canonical_decimal(source.tokens('label')), return_inverse=True)
+    codes, nearest = transfer(source.values('x', 'y', 'z'), labels.ravel(),
+                              target.values('x', 'y', 'z'), max_dist, k, cell)
+    matched = codes >= 0
+    unmatched = int(np.count_nonzero(~matched))
+    instrumentation.count('unmatched', unmatched)
+    if unmatched:
+        action = "已丢弃" if fill is None else f"标签记为 {fill}"
+        print(f"{target_path}: {unmatched} / {len(codes)} 个点在 {max_dist} 以内没有标注点，{action}")
+
+    keep = matched if fill is None else slice(None)
+    columns = [canonical_decimal(target.tokens(name)[keep]) for name in XYZ_NORMAL]
+    if fill is None:
+        label_column = names[codes[matched]]
+    else:
+        fill_token = str(fill).encode()
+        label_column = np.full(len(codes), fill_token,
+                               dtype=f'S{max(names.itemsize, len(fill_token))}')
+        label_column[matched] = names[codes[matched]]
+    columns.append(label_column)
+    write_bytes(output_path, join_columns(columns))
+    if matched.any():
+        print(f"{target_path}: 最近标注点距离 平均 {nearest[matched].mean():.6g}，"
+              f"最大 {nearest[matched].max():.6g}")
+    return len(label_column)
+
+
+def pair_files(source_dir, target_dir):
+    """
+    按相对路径配对，返回 ([(标注文件, 目标文件, 相对路径)], [没有标注文件的目标文件])。
+    标注文件名可以带 _predicted 后缀；同名的标注文件和预测文件都存在时使用标注文件。
+    """
+    sources = {}
+    for path in sorted(walk_files(source_dir, '.txt')):
+        name, ext = os.path.splitext(os.path.relpath(path, source_dir))
+        predicted = name.endswith('_predicted')
+        if predicted:
+            name = name[:-10]  # 去掉 "_predicted"
+        if not predicted or name + ext not in sources:
+            sources[name + ext] = path
+    pairs, missing = [], []
+    for path in walk_files(target_dir, '.txt'):
+        relative_path = os.path.relpath(path, target_dir)
+        if relative_path in sources:
+            pairs.append((sources[relative_path], path, relative_path))
+        else:
+            missing.append(path)
+    return pairs, missing
+
+
+def process_directory(source_dir, target_dir, output_dir, max_dist, k=1, cell=None, fill=None,
+                      jobs=1, force=False):
+    """按相对路径配对两个文件夹中的点云，迁移标签后写入 output_dir"""
+    pairs, missing = pair_files(source_dir, target_dir)
+    for path in missing:
+        print(f"没有对应的标注点云，跳过: {path}")
+    tasks = []
+    sources = {}
+    for source_path, target_path, relative_path in pairs:
+        output_path = os.path.join(output_dir, relative_path)
+        tasks.append((target_path, (source_path, target_path, output_path, max_dist, k, cell, fill),
+                      [output_path]))
+        st = os.stat(source_path)
+        sources[os.path.relpath(source_path, source_dir)] = [st.st_size, st.st_mtime_ns]
+
+    # 处理记录只跟踪目标文件；标注文件有任何变化时全部重新迁移
+    params = {'max_dist': max_dist, 'k': k, 'cell': cell, 'fill': fill, 'sources': sources}
+    return run_tasks(transfer_file, tasks, jobs, Manifest(output_dir, params, force))
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="把带标签点云的标签按最近点（或 k 近邻多数）迁移到网格提取的点上")
+    parser.add_argument('source', help="带标签的点云（x y z nx ny nz label），文件或文件夹")
+    parser.add_argument('target', help="要加标签的点云（x y z nx ny nz），文件或文件夹")
+    parser.add_argument('output', help="输出文件或文件夹")
+    parser.add_argument('--max-dist', type=float, required=True,
+                        help="最大匹配距离，超过它的标注点不参与迁移")
+    parser.add_argument('-k', type=int, default=1,
+                        help="参与投票的近邻个数（默认 1，即最近点的标签）")
+    parser.add_argument('--cell', type=float, default=None,
+                        help="体素边长（默认按标注点的密度自动选择）")
+    parser.add_argument('--fill', default=None,
+                        help="无匹配的点使用的标签（默认丢弃这些点）")
+    add_jobs_argument(parser)
+    add_force_argument(parser)
+    args = parser.parse_args()
+    if args.max_dist <= 0 or args.k < 1:
+        parser.error("--max-dist 必须大于 0，-k 至少为 1")
+
+    if os.path.isfile(args.source) and os.path.isfile(args.target):
+        points = transfer_file(args.source, args.target, args.output, args.max_dist, args.k,
+                               args.cell, args.fill)
+        print(f"写出 {points} 个点: {args.output}")
+    else:
+        process_directory(args.source, args.target, args.output, args.max_dist, args.k,
+                          args.cell, args.fill, args.jobs, args.force)
+    print("处理完成！")
+
+
+if __name__ == "__main__":
+    main()
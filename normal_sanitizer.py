@@ -0,0 +1,41 @@
+import numpy as np
+
+from instrumentation import count
+
+
+# 法向量被剔除的原因及提示中的名称
+REJECT_REASONS = {'nan': 'NaN', 'inf': 'Inf', 'zero': '零向量'}
+
+
+def sanitize_normals(normals, decimals=8, counts=None):
+    """
+    批量检查并归一化 (N, 3) 法向量：含 NaN、含 Inf、模长为 0 的行按此顺序归入一种原因并剔除，
+    其余行除以模长后保留 decimals 位小数（与逐行 np.round(normals / norm, 8) 的结果一致）。
+    返回 (归一化后的 (M, 3) 数组, 保留行的布尔掩码, {原因: 行数})。
+    给定 counts 时把各原因的行数累加进去，流式处理时用于按文件汇总。
+    """
+    has_nan = np.isnan(normals).any(axis=1)
+    has_inf = np.isinf(normals).any(axis=1) & ~has_nan
+    norms = np.linalg.norm(normals, axis=1)
+    zero = (norms == 0) & ~has_nan & ~has_inf
+    keep = ~(has_nan | has_inf | zero)
+    normalized = np.round(normals[keep] / norms[keep, None], decimals=decimals)
+
+    found = {'nan': int(np.count_nonzero(has_nan)), 'inf': int(np.count_nonzero(has_inf)),
+             'zero': int(np.count_nonzero(zero))}
+    count('dropped_nan', found['nan'])
+    count('dropped_inf', found['inf'])
+    count('dropped_zero_norm', found['zero'])
+    if counts is not None:
+        for reason, n in found.items():
+            counts[reason] = counts.get(reason, 0) + n
+    return normalized, keep, found
+
+
+def report_rejected(file_path, counts):
+    """每个文件只输出一条被剔除点数的汇总提示"""
+    total = sum(counts.values())
+    if total == 0:
+        return
+    detail = '，'.join(f"{REJECT_REASONS[reason]} {n}" for reason, n in counts.items() if n)
+    print(f"{file_path}: 丢弃 {total} 个法向量无效的点（{detail}）")
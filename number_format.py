@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量数值格式化
+
+把 (N, k) 的浮点数组或 token（定长字节）数组整块转换为文本行，每列可选以下写法：
+    quantize  Decimal(float(v)).quantize(Decimal('0.000001'), ROUND_HALF_UP)，定点 decimals 位小数
+    format    f"{Decimal(float(v)):.6f}"（即 ROUND_HALF_EVEN），定点 decimals 位小数
+    keep      str(Decimal(token))，保留 token 原有的小数位数（需要 token 数组）
+    repr      f"{np.float64(v)}"，float 的最短往返写法
+结果与对应的逐个 Decimal/f-string 写法逐字节相同，golden 检查见命令行 check。
+
+命令行：
+    python number_format.py check [--rows N] [--seed S] [--decimals D]
+    python number_format.py bench [--rows N] [--cols K] [--reference-rows N]
+"""
+
+import argparse
+import sys
+import time
+from decimal import ROUND_HALF_EVEN, ROUND_HALF_UP, Decimal
+
+import numpy as np
+
+from point_cloud_io import canonical_decimal, format_fixed, join_columns
+
+
+MODES = ('quantize', 'format', 'keep', 'repr')
+
+
+def _as_float(values):
+    values = np.asarray(values)
+    if values.dtype.kind == 'S':
+        return values.astype(np.float64)
+    return values.astype(np.float64, copy=False)
+
+
+def format_column(values, mode='quantize', decimals=6):
+    """把一列数值格式化为 'S{w}' 定长字节数组"""
+    if mode == 'quantize':
+        return format_fixed(_as_float(values), decimals)
+    if mode == 'format':
+        return format_fixed(_as_float(values), decimals, ROUND_HALF_EVEN)
+    if mode == 'keep':
+        values = np.asarray(values)
+        if values.dtype.kind != 'S':
+            raise ValueError("keep 模式需要 token（字节串）数组，浮点数已丢失原有的小数位数")
+        return canonical_decimal(values)
+    if mode == 'repr':
+        return _as_float(values).astype('S32')
+    raise ValueError(f"未知的格式: {mode}（可用: {', '.join(MODES)}）")
+
+
+def format_columns(values, modes='quantize', decimals=6):
+    """
+    values 为 (N, k) 数组或 k 个长度为 N 的列；modes 为一种写法或每列一种写法。
+    返回 k 个定长字节数组。
+    """
+    if isinstance(values, np.ndarray) and values.ndim == 2:
+        values = [np.ascontiguousarray(values[:, j]) for j in range(values.shape[1])]
+    if isinstance(modes, str):
+        modes = [modes] * len(values)
+    if len(modes) != len(values):
+        raise ValueError(f"列数为 {len(values)}，但给出了 {len(modes)} 种写法")
+    return [format_column(column, mode, decimals) for column, mode in zip(values, modes)]
+
+
+def format_rows(values, modes='quantize', decimals=6, sep=b' ', end=b'\n'):
+    """按行格式化为文本，返回 bytes（各列以 sep 分隔，每行以 end 结尾）"""
+    columns = format_columns(values, modes, decimals)
+    if not columns:
+        return b''
+    return join_columns(columns, sep, end)
+
+
+def reference_format(value, mode='quantize', decimals=6):
+    """逐个值的原始写法，作为 golden 检查和基准测试的参照"""
+    if mode == 'quantize':
+        # decimals <= 6 时 format(q, 'f') 与 str(q) 相同；更多位时 str 会改用科学计数法
+        return format(Decimal(float(value)).quantize(Decimal(1).scaleb(-decimals),
+                                                     rounding=ROUND_HALF_UP), 'f')
+    if mode == 'format':
+        return f"{Decimal(float(value)):.{decimals}f}"
+    if mode == 'keep':
+        return str(Decimal(value.decode()))
+    if mode == 'repr':
+        return f"{np.float64(value)}"
+    raise ValueError(f"未知的格式: {mode}（可用: {', '.join(MODES)}）")
+
+
+def golden_values(rows, seed=0, decimals=6):
+    """
+    golden 检查用的浮点数：各数量级的随机值，外加恰好落在进位边界上、
+    紧挨边界两侧、负零、极小值、整数等容易出错的值
+    """
+    rng = np.random.default_rng(seed)
+    scale = 10.0 ** decimals
+    magnitudes = 10.0 ** rng.integers(-9, 9, rows)
+    parts = [
+        rng.uniform(-1, 1, rows) * magnitudes,
+        (rng.integers(-10 ** 9, 10 ** 9, rows) + 0.5) / scale,           # 十进制意义上的 .5
+        rng.integers(-2 ** 20, 2 ** 20, rows) / 2.0 ** rng.integers(1, 24, rows),  # 二进制精确的 .5
+        np.round(rng.uniform(-1000, 1000, rows), decimals + 1),
+        rng.integers(-10 ** 6, 10 ** 6, rows).astype(np.float64),
+        np.array([0.0, -0.0, 1e-300, -1e-300, 5e-324, 0.5 / scale, -0.5 / scale,
+                  1.5 / scale, 2.5 / scale, 0.1, 0.2, 0.3, 1 / 3, 2 / 3, 999999.9999995,
+                  123456789.123456789, -0.0000005, 0.0000015]),
+    ]
+    values = np.concatenate(parts)
+    near = values[:rows]
+    return np.concatenate([values, np.nextafter(near, np.inf), np.nextafter(near, -np.inf)])
+
+
+def golden_tokens(rows, seed=0):
+    """golden 检查用的 token：常见写法以及科学计数法、前导零、正号、极小值等需要改写的写法"""
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(-1, 1, rows) * 10.0 ** rng.integers(-9, 9, rows)
+    tokens = [f"{v:.6f}" for v in values] + [f"{v}" for v in values] + [f"{v:e}" for v in values]
+    tokens += ['0', '-0', '+1.5', '007.50', '.5', '5.', '0.0000001', '0.000001', '1E+3',
+               '-0.000', '1e-7', '12345678901234567890.123', '0.00000100', '-00.1']
+    return np.array([t.encode() for t in tokens])
+
+
+def check(rows=20000, seed=0, decimals=6):
+    """对每种写法比较批量结果和逐个参照写法，返回不一致的个数"""
+    values = golden_values(rows, seed, decimals)
+    tokens = golden_tokens(rows, seed)
+    failures = 0
+    for mode in MODES:
+        data = tokens if mode == 'keep' else values
+        got = format_column(data, mode, decimals)
+        bad = [(data[i], got[i]) for i in range(len(data))
+               if got[i].decode() != reference_format(data[i], mode, decimals)]
+        status = "OK" if not bad else f"{len(bad)} 个不一致"
+        print(f"{mode:>8}: {len(data)} 个值，{status}")
+        for value, text in bad[:5]:
+            print(f"          {value!r}: 得到 {text.decode()}，"
+                  f"应为 {reference_format(value, mode, decimals)}")
+        failures += len(bad)
+    return failures
+
+
+def bench(rows=1000000, cols=6, reference_rows=20000, seed=0):
+    """比较各写法批量格式化和逐行 f-string 格式化的速度（行/秒）"""
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(-100, 100, (rows, cols))
+    tokens = np.char.mod('%.6f', values).astype('S')
+    print(f"{rows} 行 x {cols} 列，参照写法取前 {reference_rows} 行估算")
+    for mode in MODES:
+        data = tokens if mode == 'keep' else values
+        start = time.perf_counter()
+        text = format_rows(data, mode)
+        bulk = rows / (time.perf_counter() - start)
+
+        sample = data[:reference_rows]
+        start = time.perf_counter()
+        reference = ''.join(' '.join(reference_format(v, mode) for v in row) + '\n'
+                            for row in sample).encode()
+        slow = len(sample) / (time.perf_counter() - start)
+        same = text.startswith(reference)
+        print(f"{mode:>8}: 批量 {bulk:,.0f} 行/秒，逐行 {slow:,.0f} 行/秒，"
+              f"加速 {bulk / slow:.1f} 倍，结果{'一致' if same else '不一致'}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="批量数值格式化的 golden 检查与基准测试")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('check', help="与逐个 Decimal 写法逐字节比较")
+    p.add_argument('--rows', type=int, default=20000, help="每类随机值的个数")
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--decimals', type=int, default=6, help="定点写法的小数位数")
+    p = sub.add_parser('bench', help="测量批量格式化的行/秒")
+    p.add_argument('--rows', type=int, default=1000000)
+    p.add_argument('--cols', type=int, default=6)
+    p.add_argument('--reference-rows', type=int, default=20000, help="逐行参照写法测量的行数")
+    args = parser.parse_args()
+
+    if args.command == 'check':
+        failures = check(args.rows, args.seed, args.decimals)
+        sys.exit(1 if failures else 0)
+    bench(args.rows, args.cols, args.reference_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+单遍预处理流水线
+
+把 combine_labels、transfer_data、change_labels、process_point_clouds 等脚本的处理步骤
+作为阶段串起来：每个输入文件只解析一次，各阶段直接在内存中的列之间传递，最后只写出一次，
+不再产生中间目录。阶段之间按列名传递数据（而不是按列的位置）。
+
+流水线配置为 JSON 文件，例如：
+    {
+        "stages": [
+            "combine_labels",
+            "transfer_data",
+            {"name": "change_labels", "table": {"1": 0, "2": 0, "3": 1}},
+            {"name": "process_point_clouds", "swap": {}, "suffixes": {"0": "-CP", "1": "-S"}}
+        ]
+    }
+拆分阶段的 swap、suffixes 默认与 process_point_clouds.py 相同（交换 1、2，按 1、2、3 拆分），
+上例中标签已被 change_labels 映射为 0、1，所以需要写出。流水线中按标签的数值匹配
+（change_labels 之后的 "1.000000" 与 "1" 相同）；未知标签的点丢弃，每个文件汇总提示一次。
+可选的 "input_schema" 指定输入文件的列名，默认取第一个阶段脚本的输入格式
+（downsample 阶段放在第一个时需要指定）。
+降采样阶段写作 {"name": "downsample", "method": "fps", "n_points": 4096}，见 downsample.py，
+点数很多时默认先缩减候选点（近似），加上 "max_candidates": 0 为精确的最远点采样；
+它需要整个文件的点，不能与 --chunk-rows 同时使用。
+列数不符的行在解析时汇总提示一次并丢弃。
+
+命令行：
+    python pipeline.py spec.json input_dir output_dir [--jobs N] [--chunk-rows N] [--force]
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+import change_labels
+import combine_labels
+import downsample
+import process_point_clouds
+import transfer_data
+import transfer_training_data
+from build_manifest import Manifest
+from directory_runner import (add_chunk_rows_argument, add_force_argument, add_jobs_argument,
+                              run_tasks, walk_files)
+from instrumentation import stage
+from io_scheduler import AtomicFile
+from normal_sanitizer import report_rejected
+from point_cloud_io import (XYZ_LABEL_NORMAL, XYZ_LABELS_NORMAL, XYZ_NORMAL, XYZ_NORMAL_LABEL,
+                            iter_point_clouds, join_columns, report_bad_lines)
+
+
+def _normalize(columns, counts=None):
+    return transfer_data.normalize_columns(columns, counts)
+
+
+def _remap(columns, table=None):
+    # JSON 的键只能是字符串，这里转回整数标签
+    if table is not None:
+        table = {int(k): v for k, v in table.items()}
+        return change_labels.remap_columns(columns, table)
+    return change_labels.remap_columns(columns)
+
+
+def _split(columns, swap=None, suffixes=None, unknown=None):
+    # swap 为 {} 时不交换标签；前面的阶段（如 change_labels）会把标签写成 "1.000000"，按数值匹配
+    return process_point_clouds.split_columns(
+        columns, process_point_clouds.LABEL_SWAP if swap is None else swap,
+        suffixes or process_point_clouds.LABEL_SUFFIXES, unknown, numeric=True)
+
+
+# 阶段名 -> (函数, 需要的输入列, 输出列)；输出列为 None 的阶段按类别拆分输出，只能放在最后，
+# 输出列为 SAME_COLUMNS 的阶段只筛选行，列保持不变
+SAME_COLUMNS = 'same'
+STAGES = {
+    'combine_labels': (combine_labels.combine_columns, XYZ_LABELS_NORMAL, XYZ_NORMAL_LABEL),
+    'transfer_data': (_normalize, XYZ_LABEL_NORMAL, XYZ_NORMAL_LABEL),
+    'change_labels': (_remap, XYZ_NORMAL_LABEL, XYZ_NORMAL_LABEL),
+    'transfer_training_data': (transfer_training_data.drop_label_columns, XYZ_NORMAL_LABEL,
+                               XYZ_NORMAL),
+    'downsample': (downsample.downsample_columns, ('x', 'y', 'z'), SAME_COLUMNS),
+    'process_point_clouds': (_split, XYZ_NORMAL_LABEL, None),
+}
+# 会丢弃法向量无效点、需要按文件汇总提示的阶段
+COUNTING_STAGES = {'transfer_data'}
+# 会丢弃未知标签的点、需要按文件汇总提示的阶段
+LABEL_STAGES = {'process_point_clouds'}
+# 遇到未识别的标签2值时改用标签1、需要按文件汇总提示的阶段
+LABEL2_STAGES = {'combine_labels'}
+# 需要整个文件的点才能得到正确结果的阶段，不能与 --chunk-rows 同时使用
+WHOLE_FILE_STAGES = {'downsample'}
+
+
+def load_spec(spec):
+    """
+    读取并检查流水线配置（JSON 文件路径或已解析的字典），
+    返回 (输入列名, [(阶段名, 参数)])。
+    """
+    if not isinstance(spec, dict):
+        with open(spec, encoding='utf-8') as f:
+            spec = json.load(f)
+    stages = []
+    for item in spec['stages']:
+        if isinstance(item, str):
+            item = {'name': item}
+        options = dict(item)
+        name = options.pop('name')
+        if name not in STAGES:
+            raise ValueError(f"未知的阶段: {name}（可用: {', '.join(STAGES)}）")
+        stages.append((name, options))
+    if not stages:
+        raise ValueError("流水线至少需要一个阶段")
+
+    schema = tuple(spec.get('input_schema') or STAGES[stages[0][0]][1])
+    available = set(schema)
+    for i, (name, _) in enumerate(stages):
+        _, inputs, outputs = STAGES[name]
+        missing = [c for c in inputs if c not in available]
+        if missing:
+            raise ValueError(f"阶段 {name} 缺少输入列: {', '.join(missing)}")
+        if outputs is None and i != len(stages) - 1:
+            raise ValueError(f"阶段 {name} 按类别拆分输出，只能作为最后一个阶段")
+        if outputs != SAME_COLUMNS:
+            available = set(outputs or ())
+    return schema, stages
+
+
+def run_stages(columns, stages, counts=None, unknown=None, unknown_label2=None):
+    """
+    依次执行各阶段。返回最终的列，或拆分阶段的 {后缀: 列}。
+    给定 counts 时，丢弃法向量无效点的阶段把各原因的行数累加进去；
+    给定 unknown 时，拆分阶段把未知标签的行数累加进去；
+    给定 unknown_label2 时，combine_labels 把未识别的标签2值的行数累加进去。
+    """
+    for name, options in stages:
+        if name in COUNTING_STAGES:
+            options = dict(options, counts=counts)
+        if name in LABEL_STAGES:
+            options = dict(options, unknown=unknown)
+        if name in LABEL2_STAGES:
+            options = dict(options, unknown=unknown_label2)
+        columns = STAGES[name][0](columns, **options)
+    return columns
+
+
+def process_file(file_path, output_file_path, schema, stages, chunk_rows=None):
+    """
+    对单个文件执行流水线。拆分阶段结尾时 output_file_path 去掉扩展名后加各类别后缀，
+    只有有数据的类别才生成文件。返回写出的点数。
+    """
+    split = STAGES[stages[-1][0]][2] is None
+    base, ext = os.path.splitext(output_file_path)
+    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+    files, points, bad_lines, counts, unknown, unknown_label2 = {}, 0, [], {}, {}, {}
+
+    def write(path, columns):
+        if path not in files:
+            files[path] = AtomicFile(path)
+        data = join_columns(list(columns.values()))
+        with stage('write'):
+            files[path].write(data)
+        return len(next(iter(columns.values())))
+
+    # 各输出先写临时文件，全部处理成功后才改名为输出文件
+    try:
+        if not split:
+            files[output_file_path] = AtomicFile(output_file_path)
+        for cloud in iter_point_clouds(file_path, schema, chunk_rows):
+            bad_lines.append(cloud.bad_lines)
+            result = run_stages(cloud.token_columns(), stages, counts, unknown, unknown_label2)
+            if split:
+                for suffix, columns in result.items():
+                    points += write(base + suffix + ext, columns)
+            else:
+                points += write(output_file_path, result)
+    except BaseException:
+        for f in files.values():
+            f.discard()
+        raise
+    for f in files.values():
+        f.commit()
+    if bad_lines:
+        report_bad_lines(file_path, np.concatenate(bad_lines), len(schema))
+    report_rejected(file_path, counts)
+    process_point_clouds.report_unknown_labels(file_path, unknown)
+    combine_labels.report_unknown_label2(file_path, unknown_label2)
+    return points
+
+
+def _outputs(output_file_path, stages):
+    """任务可能生成的输出文件，供处理记录使用"""
+    name, options = stages[-1]
+    if STAGES[name][2] is not None:
+        return [output_file_path]
+    base, ext = os.path.splitext(output_file_path)
+    suffixes = options.get('suffixes') or process_point_clouds.LABEL_SUFFIXES
+    return [base + suffix + ext for suffix in suffixes.values()]
+
+
+def process_directory(spec, input_dir, output_dir, jobs=1, chunk_rows=None, force=False):
+    """对 input_dir 下所有 txt 文件执行流水线，输出保持相对路径"""
+    schema, stages = load_spec(spec)
+    whole_file = [name for name, _ in stages if name in WHOLE_FILE_STAGES]
+    if chunk_rows and whole_file:
+        raise ValueError(f"阶段 {', '.join(whole_file)} 需要整个文件，不能按块流式处理")
+    tasks = []
+    for input_file_path in walk_files(input_dir, '.txt'):
+        relative_path = os.path.relpath(input_file_path, input_dir)
+        output_file_path = os.path.join(output_dir, relative_path)
+        tasks.append((input_file_path,
+                      (input_file_path, output_file_path, schema, stages, chunk_rows),
+                      _outputs(output_file_path, stages)))
+    params = {'schema': list(schema), 'stages': [[name, options] for name, options in stages]}
+    return run_tasks(process_file, tasks, jobs, Manifest(output_dir, params, force),
+                     prefetch=chunk_rows is None)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="按配置文件单遍执行多个预处理步骤")
+    parser.add_argument('spec', help="流水线配置（JSON）")
+    parser.add_argument('input_dir', help="输入文件夹路径")
+    parser.add_argument('output_dir', help="输出文件夹路径")
+    add_jobs_argument(parser)
+    add_chunk_rows_argument(parser)
+    add_force_argument(parser)
+    args = parser.parse_args()
+
+    process_directory(args.spec, args.input_dir, args.output_dir, args.jobs, args.chunk_rows,
+                      args.force)
+    print("处理完成！")
+
+
+if __name__ == "__main__":
+    main()
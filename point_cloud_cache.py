@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+点云 txt 解析结果的二进制缓存
+
+缓存默认关闭。设置环境变量 POINT_CLOUD_CACHE_DIR（或在代码中调用 configure()）后，
+point_cloud_io 第一次解析某个 txt 文件时会把各列结果保存为 .npy，之后直接内存映射读取。
+缓存条目按 路径 + 大小 + 修改时间（可选内容哈希）区分，源文件变化后自动失效；
+总大小超过上限时按最近使用时间淘汰到上限的 EVICT_TARGET 倍。总大小只在每个进程第一次写入、
+估计值超过上限、或本进程写入了上限的 RESCAN_FRACTION 倍之后才重新统计（遍历全部条目），
+平时按写入的字节数累加估计，写入 N 个条目的总代价与 N 成正比。
+
+命令行：
+    python point_cloud_cache.py stats  [--dir DIR]
+    python point_cloud_cache.py list   [--dir DIR]
+    python point_cloud_cache.py purge  [--dir DIR] [--older-than-days N] [--max-bytes N]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'point_cloud_cache')
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+# 超过上限时淘汰到上限的这么多倍，留出余量，不必每次写入都重新淘汰
+EVICT_TARGET = 0.9
+# 本进程写入的字节数超过上限的这么多倍时重新统计总大小，计入其他进程写入的条目
+RESCAN_FRACTION = 1 / 16
+
+_META = 'meta.json'
+_config = {}
+_usage = {}  # 缓存目录 -> [估计的总字节数, 上次统计之后本进程写入的字节数]
+
+
+def configure(cache_dir=None, max_bytes=None, content_hash=False):
+    """启用缓存。content_hash=True 时用文件内容哈希代替修改时间判断是否变化"""
+    _config.update(
+        cache_dir=cache_dir or DEFAULT_CACHE_DIR,
+        max_bytes=DEFAULT_MAX_BYTES if max_bytes is None else max_bytes,
+        content_hash=content_hash,
+    )
+    # 写入环境变量，使子进程也使用同一缓存
+    os.environ['POINT_CLOUD_CACHE_DIR'] = _config['cache_dir']
+    os.environ['POINT_CLOUD_CACHE_MAX_BYTES'] = str(_config['max_bytes'])
+    os.environ['POINT_CLOUD_CACHE_CONTENT_HASH'] = '1' if content_hash else '0'
+
+
+def disable():
+    _config.clear()
+    for name in ('POINT_CLOUD_CACHE_DIR', 'POINT_CLOUD_CACHE_MAX_BYTES',
+                 'POINT_CLOUD_CACHE_CONTENT_HASH'):
+        os.environ.pop(name, None)
+
+
+def _settings():
+    """当前缓存设置，未启用时返回 None"""
+    if _config:
+        return _config
+    cache_dir = os.environ.get('POINT_CLOUD_CACHE_DIR')
+    if not cache_dir:
+        return None
+    return {
+        'cache_dir': cache_dir,
+        'max_bytes': int(os.environ.get('POINT_CLOUD_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+        'content_hash': os.environ.get('POINT_CLOUD_CACHE_CONTENT_HASH') == '1',
+    }
+
+
+def file_digest(file_path, chunk_size=1 << 20):
+    """文件内容哈希（blake2b）"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def entry_key(file_path, kind):
+    """
+    缓存条目的键，未启用缓存时返回 None。同一个文件先 load() 再 save() 时计算一次传给两者，
+    content_hash=True 时文件只哈希一次。
+    """
+    settings = _settings()
+    if settings is None:
+        return None
+    return _entry_key(file_path, kind, settings)
+
+
+def _entry_key(file_path, kind, settings):
+    path = os.path.abspath(file_path)
+    st = os.stat(path)
+    if settings['content_hash']:
+        version = f"{st.st_size}:{file_digest(path)}"
+    else:
+        version = f"{st.st_size}:{st.st_mtime_ns}"
+    key = hashlib.sha1(f"{path}\0{version}\0{kind}".encode()).hexdigest()
+    return key, path, st
+
+
+def load(file_path, kind, key=None):
+    """
+    查找缓存，命中时返回 {名称: 只读内存映射数组}，否则返回 None。
+    kind 区分同一文件的不同解析方式（如不同的列定义）；key 为 entry_key() 的结果，省略时计算。
+    """
+    settings = _settings()
+    if settings is None:
+        return None
+    import numpy as np  # 只在启用缓存时才需要，校验目录树等命令不必加载 numpy
+
+    key, _, _ = key or _entry_key(file_path, kind, settings)
+    entry = os.path.join(settings['cache_dir'], key)
+    try:
+        with open(os.path.join(entry, _META)) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(entry, name + '.npy'), mmap_mode='r')
+                  for name in meta['arrays']}
+    except (OSError, ValueError, KeyError):
+        return None
+    try:
+        os.utime(os.path.join(entry, _META))  # 记录最近使用时间，供 LRU 淘汰
+    except OSError:
+        pass  # 条目刚被其他进程淘汰：已映射的数组仍然可用
+    return arrays
+
+
+def save(file_path, kind, arrays, key=None):
+    """
+    把解析结果写入缓存（先写临时目录再改名，多进程同时写入也安全）。
+    key 为 entry_key() 的结果，省略时计算。
+    """
+    settings = _settings()
+    if settings is None:
+        return
+    import numpy as np
+
+    key, path, st = key or _entry_key(file_path, kind, settings)
+    cache_dir = settings['cache_dir']
+    entry = os.path.join(cache_dir, key)
+    if os.path.isdir(entry):
+        return
+    tmp = os.path.join(cache_dir, f".tmp-{key}-{os.urandom(16).hex()}")
+    os.makedirs(tmp)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + '.npy'), np.ascontiguousarray(array))
+        meta = {'source': path, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                'kind': kind, 'arrays': list(arrays), 'created': time.time()}
+        with open(os.path.join(tmp, _META), 'w') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        size = sum(item.stat().st_size for item in os.scandir(tmp))
+        os.rename(tmp, entry)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+    _account(cache_dir, settings['max_bytes'], size)
+
+
+def _account(cache_dir, max_bytes, added):
+    """累加本进程写入的字节数，估计的总大小超过上限或需要重新统计时才遍历全部条目"""
+    usage = _usage.get(cache_dir)
+    if usage is not None:
+        usage[0] += added
+        usage[1] += added
+        if usage[0] <= max_bytes and usage[1] <= max_bytes * RESCAN_FRACTION:
+            return
+    _, total = _evict(cache_dir, max_bytes, int(max_bytes * EVICT_TARGET))
+    _usage[cache_dir] = [total, 0]
+
+
+def entries(cache_dir=None):
+    """列出缓存条目：[(条目目录, 字节数, 最近使用时间, 元数据)]，按最近使用时间排序"""
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    result = []
+    if not os.path.isdir(cache_dir):
+        return result
+    for item in os.scandir(cache_dir):
+        if not item.is_dir() or item.name.startswith('.tmp-'):
+            continue
+        meta_path = os.path.join(item.path, _META)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            last_used = os.stat(meta_path).st_mtime
+            size = sum(f.stat().st_size for f in os.scandir(item.path))
+        except (OSError, ValueError):
+            continue
+        result.append((item.path, size, last_used, meta))
+    result.sort(key=lambda e: e[2])
+    return result
+
+
+def evict(cache_dir, max_bytes):
+    """总大小超过 max_bytes 时从最久未使用的条目开始删除，返回删除的条目数"""
+    return _evict(cache_dir, max_bytes, max_bytes)[0]
+
+
+def _evict(cache_dir, max_bytes, target):
+    """总大小超过 max_bytes 时从最久未使用的条目开始删除到不超过 target，返回 (删除的条目数, 总大小)"""
+    items = entries(cache_dir)
+    total = sum(e[1] for e in items)
+    removed = 0
+    if total > max_bytes:
+        for path, size, _, _ in items:
+            if total <= target:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+    return removed, total
+
+
+def purge(cache_dir=None, older_than_days=None):
+    """删除全部条目，或只删除超过 older_than_days 天未使用的条目"""
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    cutoff = None if older_than_days is None else time.time() - older_than_days * 86400
+    removed = 0
+    for path, _, last_used, _ in entries(cache_dir):
+        if cutoff is None or last_used < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    # 清理中断写入留下的临时目录
+    if os.path.isdir(cache_dir):
+        for item in os.scandir(cache_dir):
+            if item.is_dir() and item.name.startswith('.tmp-'):
+                shutil.rmtree(item.path, ignore_errors=True)
+    return removed
+
+
+def _format_size(n):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="查看和清理点云解析缓存")
+    parser.add_argument('command', choices=['stats', 'list', 'purge'])
+    parser.add_argument('--dir', default=os.environ.get('POINT_CLOUD_CACHE_DIR', DEFAULT_CACHE_DIR),
+                        help="缓存目录")
+    parser.add_argument('--older-than-days', type=float, default=None,
+                        help="purge 时只删除超过该天数未使用的条目")
+    parser.add_argument('--max-bytes', type=int, default=None,
+                        help="purge 时按 LRU 淘汰到不超过该大小，而不是全部删除")
+    args = parser.parse_args()
+
+    if args.command == 'purge':
+        if args.max_bytes is not None:
+            removed = evict(args.dir, args.max_bytes)
+        else:
+            removed = purge(args.dir, args.older_than_days)
+        print(f"已删除 {removed} 个缓存条目")
+        return
+
+    items = entries(args.dir)
+    if args.command == 'list':
+        for path, size, last_used, meta in reversed(items):
+            used = time.strftime('%Y-%m-%d %H:%M', time.localtime(last_used))
+            print(f"{used}  {_format_size(size):>10}  {meta['kind']:<32}  {meta['source']}")
+    stale = sum(1 for _, _, _, meta in items if not _is_current(meta))
+    print(f"缓存目录: {args.dir}")
+    print(f"条目数: {len(items)}（源文件已变化或删除: {stale}）")
+    print(f"总大小: {_format_size(sum(e[1] for e in items))}")
+
+
+def _is_current(meta):
+    try:
+        st = os.stat(meta['source'])
+    except OSError:
+        return False
+    return st.st_size == meta['size'] and st.st_mtime_ns == meta['mtime_ns']
+
+
+if __name__ == "__main__":
+    sys.exit(main())
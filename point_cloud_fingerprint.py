@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按几何内容查找近似重复的点云文件
+
+同一次扫描多次导出的文件（行顺序打乱、Decimal 重新格式化后小数位数不同、
+change_labels 重映射了标签）逐字节比较并不相同，find_duplicate_files.py 和
+verification.py 都找不出来。这里只看 xyz 坐标：
+
+    1. 每个文件计算一个与行顺序无关的指纹：点数，以及每个坐标轴的均值、标准差和
+       QUANTILES 个分位数。每个点的坐标变化不超过 tol 时，这些量的变化都不超过 tol。
+    2. 按点数和若干指纹分量（宽度 BUCKET_FACTOR * tol 的网格）分桶，每个文件只查找
+       所在的桶以及离边界不到 tol 的相邻桶，整体接近线性时间；指纹各分量相差都不超过
+       tol 的文件对成为候选。
+    3. 只对候选对做精确的几何比较：点数相同，且一方的每个点取另一方中最近的点时
+       恰好一一对应（重复的点按个数计），每对各坐标相差不超过 tol。
+
+近似重复定义为点数相同、坐标在 tol 以内一一对得上，标签和法向量不参与比较。
+启用 point_cloud_cache 时解析结果会被缓存，再次运行时计算指纹很快。
+
+命令行：
+    python point_cloud_fingerprint.py 文件夹1 [文件夹2 ...] [--tol 0.001] [--jobs N]
+"""
+
+import argparse
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import product
+
+import numpy as np
+
+from directory_runner import add_jobs_argument, walk_files
+from point_cloud_io import load_array, report_bad_lines
+
+
+# 每个坐标轴记录的分位数个数（含最小值和最大值）
+QUANTILES = 17
+# 分桶网格的宽度为 tol 的这么多倍：越大每个文件需要查找的相邻桶越少，但桶内的文件越多
+BUCKET_FACTOR = 8
+# 指纹比较留出的余量，抵消不同文本解析出的浮点数在求和时的舍入误差
+SKETCH_MARGIN = 1.01
+# 指纹的排列：每个坐标轴一行 [均值, 标准差, 分位数...]，分桶使用均值、标准差和中位数
+_KEY_COLUMNS = (0, 1, 2 + QUANTILES // 2)
+
+
+def _column_count(file_path):
+    """第一个非空行的列数"""
+    with open(file_path, 'rb') as f:
+        for line in f:
+            if line.split():
+                return len(line.split())
+    return 0
+
+
+def load_xyz(file_path):
+    """读取点云文件的前三列（列数取自第一个非空行，列数不符的行汇总提示后丢弃）"""
+    ncols = _column_count(file_path)
+    if ncols < 3:
+        return np.zeros((0, 3))
+    array, bad = load_array(file_path, tuple(f'c{j}' for j in range(ncols)))
+    report_bad_lines(file_path, bad, ncols)
+    return array[:, :3]
+
+
+def fingerprint(points):
+    """
+    与点的顺序无关的指纹，返回 (3, QUANTILES + 2) 数组，每个坐标轴一行
+    [均值, 标准差, 分位数...]。每个点的坐标变化不超过 tol 时，每个分量的变化不超过 tol
+    （分位数是排序后若干位置的值或其线性插值，均值和标准差满足三角不等式）。
+    """
+    points = np.asarray(points, dtype=np.float64)
+    sketch = np.empty((3, QUANTILES + 2))
+    sketch[:, 0] = points.mean(axis=0)
+    sketch[:, 1] = points.std(axis=0)
+    sketch[:, 2:] = np.quantile(points, np.linspace(0, 1, QUANTILES), axis=0).T
+    return sketch
+
+
+def fingerprint_file(file_path):
+    """返回 (点数, 指纹)；没有点的文件指纹为 None"""
+    points = load_xyz(file_path)
+    if len(points) == 0:
+        return 0, None
+    return len(points), fingerprint(points)
+
+
+def fingerprint_files(paths, jobs=1):
+    """计算每个文件的 (点数, 指纹)，jobs > 1 时使用进程池"""
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1 or len(paths) <= 1:
+        return [fingerprint_file(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(fingerprint_file, paths, chunksize=8))
+
+
+def _cells(values, width, tol):
+    """values 所在的网格单元，以及离边界不到 tol 的维度上的相邻单元"""
+    scaled = values / width
+    cell = np.floor(scaled).astype(np.int64)
+    frac = scaled - cell
+    choices = []
+    for c, f in zip(cell.tolist(), frac.tolist()):
+        options = [c]
+        if f * width <= tol:
+            options.append(c - 1)
+        if (1 - f) * width <= tol:
+            options.append(c + 1)
+        choices.append(options)
+    return product(*choices)
+
+
+def candidate_pairs(counts, sketches, tol):
+    """
+    返回指纹相近的文件对 [(i, j)]（i < j）：点数相同且指纹各分量相差都不超过 tol。
+    sketches 中为 None 的文件（没有点）不参与比较。
+    """
+    width = BUCKET_FACTOR * tol
+    limit = tol * SKETCH_MARGIN
+    keys = {}
+    buckets = defaultdict(list)
+    for i, sketch in enumerate(sketches):
+        if sketch is None:
+            continue
+        values = sketch[:, _KEY_COLUMNS].ravel()
+        keys[i] = values
+        cell = tuple(np.floor(values / width).astype(np.int64).tolist())
+        buckets[(counts[i],) + cell].append(i)
+
+    pairs = []
+    for i, values in keys.items():
+        for cell in _cells(values, width, limit):
+            for j in buckets.get((counts[i],) + cell, ()):
+                if j > i and np.abs(sketches[i] - sketches[j]).max() <= limit:
+                    pairs.append((i, j))
+    pairs.sort()
+    return pairs
+
+
+def _nearest(a, b, tol):
+    """
+    a 的每个点在 b 中最近的点（各坐标之差的最大值最小）的下标，最近的点也相差超过 tol 时为 -1。
+    按边长 2 * tol 的网格查找：相差不超过 tol 的点只可能在所在格以及每个轴上靠近的一侧的相邻格，
+    共 8 个格。
+    """
+    size = 2 * tol
+    origin = np.minimum(a.min(axis=0), b.min(axis=0))
+    scaled_a = (a - origin) / size
+    ijk_a = np.floor(scaled_a).astype(np.int64)
+    ijk_b = np.floor((b - origin) / size).astype(np.int64)
+    dims = np.maximum(ijk_a.max(axis=0), ijk_b.max(axis=0)) + 3
+    if np.prod(dims.astype(np.float64)) >= 2 ** 62:
+        raise ValueError(f"tol={tol} 相对于点云范围过小，网格单元个数超出范围")
+
+    def linear(ijk):
+        # 偏移 1，使相邻格的编号不会越界到另一行
+        return ((ijk[:, 0] + 1) * dims[1] + ijk[:, 1] + 1) * dims[2] + ijk[:, 2] + 1
+
+    keys_b = linear(ijk_b)
+    order_b = np.argsort(keys_b, kind='stable')
+    keys_b = keys_b[order_b]
+    # 按所在格排序后查找，访问 keys_b 的位置是连续的
+    order_a = np.argsort(linear(ijk_a), kind='stable')
+    a, ijk_a = a[order_a], ijk_a[order_a]
+    side = np.where(scaled_a[order_a] - ijk_a < 0.5, -1, 1)
+    best = np.full(len(a), -1)
+    best_dist = np.full(len(a), np.inf)
+    for offset in product((0, 1), repeat=3):
+        keys = linear(ijk_a + side * offset)
+        lo = np.searchsorted(keys_b, keys, 'left')
+        hi = np.searchsorted(keys_b, keys, 'right')
+        for k in range(int((hi - lo).max(initial=0))):
+            rows = np.flatnonzero(hi - lo > k)
+            j = order_b[lo[rows] + k]
+            dist = np.abs(a[rows] - b[j]).max(axis=1)
+            better = (dist <= tol) & (dist < best_dist[rows])
+            best[rows[better]] = j[better]
+            best_dist[rows[better]] = dist[better]
+    result = np.empty_like(best)
+    result[order_a] = best
+    return result
+
+
+def _matched(a, count_a, b, count_b, tol):
+    """
+    a、b 为两个点云中不同的坐标，count_a、count_b 为各坐标出现的次数。
+    a 的每个坐标取 b 中最近的坐标，检查这样的对应是否一一对应（重复的点按个数计）：
+    b 的每个坐标被对应到的点数恰好等于它出现的次数。成立时两个点云的点能一一配对且
+    每对坐标相差不超过 tol；最近点有并列时可能误判为不同。
+    """
+    nearest = _nearest(a, b, tol)
+    if (nearest < 0).any():
+        return False
+    return np.array_equal(np.bincount(nearest, weights=count_a, minlength=len(b)), count_b)
+
+
+def same_geometry(a, b, tol):
+    """
+    精确比较：点数相同，且两者的点能一一配对、每对各坐标相差不超过 tol
+    （只要求互相覆盖时，重复点的个数不同的点云也会判为相同）
+    """
+    if len(a) != len(b):
+        return False
+    if len(a) == 0:
+        return True
+    unique_a, count_a = np.unique(a, axis=0, return_counts=True)
+    unique_b, count_b = np.unique(b, axis=0, return_counts=True)
+    return (_matched(unique_a, count_a, unique_b, count_b, tol)
+            or _matched(unique_b, count_b, unique_a, count_a, tol))
+
+
+def _groups(n, pairs):
+    """把确认重复的文件对合并为组（并查集），返回 [[下标, ...], ...]"""
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs:
+        parent[find(i)] = find(j)
+    members = sorted({i for pair in pairs for i in pair})
+    groups = defaultdict(list)
+    for i in members:
+        groups[find(i)].append(i)
+    return sorted(groups.values())
+
+
+def find_near_duplicates(folders, tol=1e-3, jobs=1):
+    """
+    在若干文件夹（递归，所有 .txt 文件）中查找近似重复的点云。
+    返回 (重复组列表, 统计信息)，每组为 [(文件夹序号, 路径), ...]。
+    """
+    if tol <= 0:
+        raise ValueError("tol 必须大于 0")
+    files = []
+    for index, folder in enumerate(folders, 1):
+        files += [(index, path) for path in sorted(walk_files(folder, '.txt'))]
+    paths = [path for _, path in files]
+
+    start = time.perf_counter()
+    results = fingerprint_files(paths, jobs)
+    counts = [n for n, _ in results]
+    sketches = [sketch for _, sketch in results]
+    fingerprint_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    candidates = candidate_pairs(counts, sketches, tol)
+    index_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cached_xyz = lru_cache(maxsize=16)(load_xyz)
+    confirmed = [(i, j) for i, j in candidates
+                 if same_geometry(cached_xyz(paths[i]), cached_xyz(paths[j]), tol)]
+    verify_time = time.perf_counter() - start
+
+    groups = [[files[i] for i in group] for group in _groups(len(files), confirmed)]
+    stats = {'files': len(files), 'empty': sum(1 for s in sketches if s is None),
+             'candidates': len(candidates), 'confirmed': len(confirmed),
+             'fingerprint_time': fingerprint_time, 'index_time': index_time,
+             'verify_time': verify_time}
+    return groups, stats
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="按几何内容查找近似重复的点云（与行顺序、小数位数、标签无关）")
+    parser.add_argument('folders', nargs='+', help="要查找的文件夹，多个文件夹时同时报告跨文件夹的重复")
+    parser.add_argument('--tol', type=float, default=1e-3,
+                        help="坐标容差，各坐标相差不超过它的点视为同一个点（默认 0.001）")
+    add_jobs_argument(parser)
+    args = parser.parse_args()
+
+    groups, stats = find_near_duplicates(args.folders, args.tol, args.jobs)
+    print(f"共 {stats['files']} 个文件（{stats['empty']} 个没有点）：")
+    print(f"  指纹 {stats['fingerprint_time']:.2f} 秒，"
+          f"分桶查找 {stats['index_time']:.2f} 秒，得到 {stats['candidates']} 对候选")
+    print(f"  精确比较 {stats['verify_time']:.2f} 秒，确认 {stats['confirmed']} 对")
+
+    across = [g for g in groups if len({index for index, _ in g}) > 1]
+    print(f"\n{len(groups)} 组近似重复的点云，其中 {len(across)} 组跨文件夹")
+    print("-" * 30)
+    for group in groups:
+        mark = "（跨文件夹）" if group in across else ""
+        print(f"{len(group)} 个文件{mark}:")
+        for index, path in group:
+            print(f"  [{index}] {path}")
+
+
+if __name__ == "__main__":
+    main()
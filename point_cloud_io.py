@@ -0,0 +1,579 @@
+import mmap
+import os
+import warnings
+from decimal import ROUND_HALF_UP, Context, Decimal
+
+import numpy as np
+
+import point_cloud_cache
+import instrumentation
+import io_scheduler
+
+
+# 各脚本输入文件的列定义
+XYZ_NORMAL_LABEL = ('x', 'y', 'z', 'nx', 'ny', 'nz', 'label')
+XYZ_LABEL_NORMAL = ('x', 'y', 'z', 'label', 'nx', 'ny', 'nz')
+XYZ_LABELS_NORMAL = ('x', 'y', 'z', 'label1', 'label2', 'nx', 'ny', 'nz')
+XYZ_NORMAL = ('x', 'y', 'z', 'nx', 'ny', 'nz')
+
+
+def map_file(file_path):
+    """
+    以内存映射方式只读打开文件（零拷贝），空文件返回 b''。
+    文件已被 io_scheduler 预读时直接返回内存中的内容。
+    """
+    data = io_scheduler.take(file_path)
+    if data is not None:
+        return data
+    with open(file_path, 'rb') as infile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _universal_newlines(data):
+    """按文本模式的通用换行规则把 \\r\\n、\\r 统一为 \\n（不含 \\r 时不拷贝）"""
+    if data.find(b'\r') != -1:
+        data = data[:].replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    return data
+
+
+@instrumentation.timed('read')
+def read_bytes(file_path):
+    """内存映射读取整个文件；含 \\r 时才读入内存并统一换行符"""
+    return _universal_newlines(map_file(file_path))
+
+
+# 分块解析时每块的大致字节数，块内临时数组的内存以此为上限
+BLOCK_SIZE = 1 << 22
+
+
+class TextTable:
+    """
+    把一段文本（data[start:stop]，按整行切分）一次性切分为行和 token，
+    只记录每个 token 的起止位置，真正取出某几列时才按列拷贝成定长字节数组。
+    """
+
+    def __init__(self, data, start=0, stop=None):
+        if stop is None:
+            stop = len(data)
+        self.data = data
+        self.offset = start
+        self.buf = np.frombuffer(data, dtype=np.uint8, count=stop - start, offset=start)
+
+        newlines = np.flatnonzero(self.buf == 10)
+        n_lines = len(newlines)
+        if len(self.buf) and self.buf[-1] != 10:
+            n_lines += 1  # 最后一行没有换行符
+        self.n_lines = n_lines
+        self.line_starts = np.concatenate(([0], newlines + 1))[:n_lines]
+        self.line_ends = np.append(newlines, len(self.buf))[:n_lines]
+
+        # token 起止：非空白段的上升沿 / 下降沿，两者交替出现
+        # 空格及所有 ASCII 控制字符都当作分隔符（覆盖 str.split() 的全部 ASCII 空白）
+        non_ws = self.buf > 32
+        edges = np.flatnonzero(non_ws[1:] != non_ws[:-1]) + 1
+        if len(non_ws) and non_ws[0]:
+            edges = np.concatenate(([0], edges))
+        if len(non_ws) and non_ws[-1]:
+            edges = np.append(edges, len(non_ws))
+        self.token_starts = edges[0::2]
+        self.token_ends = edges[1::2]
+        del non_ws, edges
+
+        # 每行的 token 个数：行首位置在 token 起点序列中的插入点之差
+        bounds = np.append(self.line_starts, len(self.buf))
+        self.counts = np.diff(np.searchsorted(self.token_starts, bounds))
+
+    def rows_with(self, ncols):
+        """列数等于 ncols 的行的布尔掩码"""
+        return self.counts == ncols
+
+    def columns(self, ncols):
+        """取出所有 ncols 列的行，返回每一列的定长字节数组（顺序与文件一致）"""
+        token_mask = np.repeat(self.rows_with(ncols), self.counts)
+        starts = self.token_starts[token_mask].reshape(-1, ncols)
+        lengths = self.token_ends[token_mask].reshape(-1, ncols) - starts
+        return [gather_tokens(self.buf, starts[:, j], lengths[:, j]) for j in range(ncols)]
+
+    def line_bytes(self, i):
+        """第 i 行的原始字节（含行尾换行符，如果有）"""
+        end = self.line_ends[i]
+        if end < len(self.buf):
+            end += 1
+        return self.data[self.offset + self.line_starts[i]:self.offset + end]
+
+
+def iter_tables(data, block_size=BLOCK_SIZE):
+    """按整行把 data 切成约 block_size 字节的块，逐块生成 TextTable"""
+    start, total = 0, len(data)
+    while start < total:
+        stop = min(start + block_size, total)
+        if stop < total:
+            newline = data.find(b'\n', stop - 1)
+            stop = total if newline == -1 else newline + 1
+        yield TextTable(data, start, stop)
+        start = stop
+
+
+class PointCloudText:
+    """
+    按列定义解析后的点云文本。列数符合的行按列保存原始 token，
+    浮点值按需转换；列数不符的行只记录行号和原始内容，由调用方决定如何处理。
+    """
+
+    def __init__(self, schema, columns, valid, bad_line_bytes, first_line=1):
+        self.schema = tuple(schema)
+        self._tokens = dict(zip(self.schema, columns))
+        self.valid = valid
+        self.bad_line_bytes = list(bad_line_bytes)
+        self.first_line = first_line  # 流式处理时本块第一行在文件中的行号
+
+    @classmethod
+    @instrumentation.timed('parse')
+    def parse(cls, data, schema, block_size=BLOCK_SIZE, first_line=1):
+        """逐块切分并按列取出 token"""
+        ncols = len(schema)
+        valid, blocks, bad_line_bytes = [], [], []
+        for table in iter_tables(data, block_size):
+            mask = table.rows_with(ncols)
+            valid.append(mask)
+            blocks.append(table.columns(ncols))
+            bad_line_bytes += [table.line_bytes(i) for i in np.flatnonzero(~mask)]
+        if len(blocks) == 1:
+            columns = blocks[0]
+        elif blocks:
+            columns = [_concat_tokens([b[j] for b in blocks]) for j in range(ncols)]
+        else:
+            columns = [np.zeros(0, dtype='S1')] * ncols
+        valid = np.concatenate(valid) if valid else np.zeros(0, dtype=bool)
+        return cls(schema, columns, valid, bad_line_bytes, first_line)
+
+    def __len__(self):
+        return len(self._tokens[self.schema[0]])
+
+    @property
+    def bad_lines(self):
+        """列数不符的行号（从 1 开始）"""
+        return np.flatnonzero(~self.valid) + self.first_line
+
+    def tokens(self, name):
+        """某一列的原始 token（定长字节数组）"""
+        return self._tokens[name]
+
+    def token_columns(self):
+        """{列名: token 数组}，按 schema 的顺序"""
+        return dict(self._tokens)
+
+    def values(self, *names):
+        """把若干列转换为 float64，单列返回一维数组，多列返回 (N, k) 数组"""
+        if len(names) == 1:
+            return self._tokens[names[0]].astype(np.float64)
+        out = np.empty((len(self), len(names)), dtype=np.float64)
+        for j, name in enumerate(names):
+            out[:, j] = self._tokens[name]
+        return out
+
+    def to_array(self):
+        """全部列的 (N, k) float64 数组"""
+        return self.values(*self.schema)
+
+
+def _concat_tokens(parts):
+    width = max(p.itemsize for p in parts)
+    return np.concatenate([p.astype(f'S{width}', copy=False) for p in parts])
+
+
+@instrumentation.timed('read')
+def read_point_cloud(file_path, schema):
+    """
+    读取点云 txt 文件，schema 为列名元组（见 XYZ_NORMAL_LABEL 等）。
+    启用 point_cloud_cache 时优先内存映射缓存的解析结果。
+    """
+    kind = 'tokens:' + ','.join(schema)
+    key = point_cloud_cache.entry_key(file_path, kind)
+    cached = point_cloud_cache.load(file_path, kind, key)
+    if cached is not None:
+        instrumentation.count('rows_in', len(cached['valid']))
+        return PointCloudText(schema, [cached['col_' + name] for name in schema],
+                              cached['valid'], cached['bad_lines'].tolist())
+    cloud = PointCloudText.parse(read_bytes(file_path), schema)
+    instrumentation.count('rows_in', len(cloud.valid))
+    arrays = {'col_' + name: cloud.tokens(name) for name in schema}
+    arrays['valid'] = cloud.valid
+    arrays['bad_lines'] = np.array(cloud.bad_line_bytes, dtype=bytes)
+    point_cloud_cache.save(file_path, kind, arrays, key)
+    return cloud
+
+
+def iter_point_clouds(file_path, schema, chunk_rows=None, read_size=1 << 20):
+    """
+    chunk_rows 为 None 时整文件读取（可命中缓存），只产生一个 PointCloudText；
+    否则按 read_size 顺序读取，每凑满 chunk_rows 行解析一次，内存占用与文件大小无关。
+    """
+    if chunk_rows is None:
+        yield read_point_cloud(file_path, schema)
+        return
+    first_line = 1
+
+    def parse(chunk):
+        nonlocal first_line
+        # 块总是在换行符之后结束，\r\n 不会被切开
+        cloud = PointCloudText.parse(_universal_newlines(chunk), schema, first_line=first_line)
+        first_line += len(cloud.valid)
+        instrumentation.count('rows_in', len(cloud.valid))
+        return cloud
+
+    pieces, count = [], 0
+    with open(file_path, 'rb') as f:
+        for piece in iter(lambda: f.read(read_size), b''):
+            pieces.append(piece)
+            count += piece.count(b'\n')
+            if count < chunk_rows:
+                continue
+            data = b''.join(pieces)
+            # 每第 chunk_rows 个换行符之后切一块，剩余部分留到下一次
+            newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)
+            start = 0
+            for stop in newlines[chunk_rows - 1::chunk_rows] + 1:
+                yield parse(data[start:stop])
+                start = stop
+            pieces, count = [data[start:]], count % chunk_rows
+    data = b''.join(pieces)
+    if data:
+        yield parse(data)
+
+
+def transform_file(file_path, output_file_path, schema, transform, chunk_rows=None):
+    """
+    读取 file_path，对每个 PointCloudText 调用 transform(cloud) 得到 (输出字节, 点数)，
+    依次写入 output_file_path。chunk_rows 给定时按块流式处理，输出与整文件处理完全一致。
+    列数不符的行在结束时按文件汇总提示一次。返回写出的点数。
+    """
+    if chunk_rows is None:
+        cloud = read_point_cloud(file_path, schema)
+        data, points = transform(cloud)
+        write_bytes(output_file_path, data)
+        report_bad_lines(file_path, cloud.bad_lines, len(schema))
+        return points
+    points, bad_lines = 0, []
+    with io_scheduler.AtomicFile(output_file_path) as outfile:
+        for cloud in iter_point_clouds(file_path, schema, chunk_rows):
+            bad_lines.append(cloud.bad_lines)
+            data, n = transform(cloud)
+            with instrumentation.stage('write'):
+                outfile.write(data)
+            points += n
+    if bad_lines:
+        report_bad_lines(file_path, np.concatenate(bad_lines), len(schema))
+    return points
+
+
+@instrumentation.timed('parse')
+def load_array(file_path, schema, block_size=BLOCK_SIZE):
+    """
+    只需要浮点值时使用，返回 (N, k) float64 数组和列数不符的行号。
+    每行都是 k 个浮点数时直接交给 np.loadtxt（C 解析器）；否则逐块解析并直接写入
+    预分配的数组，不保留 token，峰值内存约为输出数组加一个块的临时数组。
+    """
+    kind = 'array:' + ','.join(schema)
+    key = point_cloud_cache.entry_key(file_path, kind)
+    cached = point_cloud_cache.load(file_path, kind, key)
+    if cached is not None:
+        instrumentation.count('rows_in', len(cached['array']) + len(cached['bad_lines']))
+        return cached['array'], cached['bad_lines']
+    data = read_bytes(file_path)
+    ncols = len(schema)
+    n_lines = _count_lines(data, block_size)
+    out = _load_clean(file_path, ncols, n_lines)
+    if out is not None:
+        bad = np.zeros(0, dtype=np.intp)
+        instrumentation.count('rows_in', n_lines)
+        point_cloud_cache.save(file_path, kind, {'array': out, 'bad_lines': bad}, key)
+        return out, bad
+    out = np.empty((n_lines, ncols), dtype=np.float64)
+    n, first_line, bad = 0, 1, []
+    for table in iter_tables(data, block_size):
+        columns = table.columns(ncols)
+        m = len(columns[0])
+        for j, column in enumerate(columns):
+            out[n:n + m, j] = column
+        bad.append(np.flatnonzero(~table.rows_with(ncols)) + first_line)
+        n += m
+        first_line += table.n_lines
+    out.resize((n, ncols), refcheck=False)
+    bad = np.concatenate(bad) if bad else np.zeros(0, dtype=np.intp)
+    instrumentation.count('rows_in', first_line - 1)
+    point_cloud_cache.save(file_path, kind, {'array': out, 'bad_lines': bad}, key)
+    return out, bad
+
+
+def _load_clean(file_path, ncols, n_lines):
+    """
+    np.loadtxt 比逐 token 转换快约一倍，但遇到列数不符的行会直接报错、空行会被跳过。
+    只有得到 n_lines 行、每行 ncols 列时才采用它的结果，否则返回 None 交给逐块解析。
+    """
+    if not n_lines:
+        return None
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')  # 只有空白行时 loadtxt 会警告 "no data"
+            array = np.loadtxt(file_path, dtype=np.float64, comments=None, ndmin=2)
+    except ValueError:
+        return None
+    return array if array.shape == (n_lines, ncols) else None
+
+
+def _count_lines(data, block_size):
+    """逐块统计行数（与 readlines() 的行数一致），用于预分配输出"""
+    n_lines = 0
+    for start in range(0, len(data), block_size):
+        block = np.frombuffer(data, dtype=np.uint8, count=min(block_size, len(data) - start),
+                              offset=start)
+        n_lines += np.count_nonzero(block == 10)
+    if len(data) and data[-1:] != b'\n':
+        n_lines += 1
+    return n_lines
+
+
+def report_bad_rows(file_path, cloud, limit=10):
+    """每个文件只输出一条列数不符的汇总提示，附前 limit 个行号"""
+    report_bad_lines(file_path, cloud.bad_lines, len(cloud.schema), limit)
+
+
+def report_bad_lines(file_path, bad_lines, ncols, limit=10):
+    if len(bad_lines) == 0:
+        return
+    instrumentation.count('bad_columns', len(bad_lines))
+    shown = ', '.join(str(n) for n in bad_lines[:limit])
+    if len(bad_lines) > limit:
+        shown += ', ...'
+    print(f"{file_path}: {len(bad_lines)} 行列数不为 {ncols}（行号: {shown}）")
+
+
+def gather_tokens(buf, starts, lengths):
+    """按起点和长度从字节缓冲区中取出 token，得到 'S{w}' 定长字节数组"""
+    n = len(starts)
+    if n == 0:
+        return np.zeros(0, dtype='S1')
+    width = int(lengths.max())
+    # 滑动窗口视图不拷贝数据，按起点取行即得每个 token 的前 width 个字节
+    windows = np.lib.stride_tricks.sliding_window_view(buf, width)
+    inside = starts <= len(buf) - width
+    if inside.all():
+        out = windows[starts]
+    else:
+        out = np.zeros((n, width), dtype=np.uint8)
+        out[inside] = windows[starts[inside]]
+        for i in np.flatnonzero(~inside):  # 文件末尾不足 width 字节的 token
+            tail = buf[starts[i]:starts[i] + lengths[i]]
+            out[i, :len(tail)] = tail
+    out[np.arange(width) >= lengths[:, None]] = 0
+    return out.view(f'S{width}').reshape(n)
+
+
+def _char_matrix(tokens):
+    n = len(tokens)
+    return tokens.view(np.uint8).reshape(n, tokens.itemsize)
+
+
+def _decimal_state_table():
+    r"""
+    判断 token 是否已是 str(Decimal(token)) 规范写法的有限状态机，
+    对应正则 -?(0|[1-9]\d*)(\.\d+)?，另外把 0.000000x 这类 Decimal
+    会改写为科学计数法的值判为不规范。字节 0 为定长数组的填充（即结束）。
+    """
+    (START, MINUS, INT_ZERO, INT, DOT, FRAC, ZERO_DOT) = range(7)
+    ZERO_FRAC = 7   # 7..11：0. 后已有 1..5 个 0
+    END, REJECT = 12, 13
+    table = np.full((14, 256), REJECT, dtype=np.uint8)
+    digits = np.arange(48, 58)
+    nonzero = np.arange(49, 58)
+
+    table[START, 45] = MINUS
+    for state in (START, MINUS):
+        table[state, 48] = INT_ZERO
+        table[state, nonzero] = INT
+    table[INT_ZERO, 46] = ZERO_DOT
+    table[INT, digits] = INT
+    table[INT, 46] = DOT
+    table[DOT, digits] = FRAC
+    table[FRAC, digits] = FRAC
+    table[ZERO_DOT, 48] = ZERO_FRAC
+    table[ZERO_DOT, nonzero] = FRAC
+    for k in range(5):
+        table[ZERO_FRAC + k, 48] = ZERO_FRAC + k + 1 if k < 4 else REJECT
+        table[ZERO_FRAC + k, nonzero] = FRAC
+    for state in (INT_ZERO, INT, FRAC, END) + tuple(range(ZERO_FRAC, ZERO_FRAC + 5)):
+        table[state, 0] = END
+    return table, END
+
+
+_DECIMAL_STATES, _DECIMAL_END = _decimal_state_table()
+
+
+@instrumentation.timed('format')
+def canonical_decimal(tokens):
+    """
+    批量计算 str(Decimal(token))。
+    绝大多数 token 本身就是 Decimal 的规范写法，直接保留；
+    其余（科学计数法、前导零、'+' 号、极小值等）才逐个交给 Decimal。
+    """
+    n = len(tokens)
+    if n == 0:
+        return tokens
+    # 转置后逐个字符位置推进状态机，每步只是一次查表
+    chars = np.ascontiguousarray(_char_matrix(tokens).T)
+    state = np.zeros(n, dtype=np.uint8)
+    for column in chars:
+        state = _DECIMAL_STATES[state, column]
+    state = _DECIMAL_STATES[state, 0]
+    bad = np.flatnonzero(state != _DECIMAL_END)
+    if len(bad) == 0:
+        return tokens
+    fixed = [str(Decimal(tokens[i].decode())).encode() for i in bad]
+    width = max(tokens.itemsize, max(len(t) for t in fixed))
+    result = tokens.astype(f'S{width}')
+    result[bad] = fixed
+    return result
+
+
+def unique_tokens(tokens):
+    """
+    等同于 np.unique(tokens, return_inverse=True)。
+    不超过 8 字节的 token 按大端 uint64 比较与按字节比较的顺序相同，整数去重比字节串快得多。
+    """
+    if tokens.dtype.kind == 'S' and 0 < tokens.itemsize <= 8 and len(tokens):
+        ints = np.ascontiguousarray(tokens).astype('S8').view('>u8')
+        _, first, inverse = np.unique(ints, return_index=True, return_inverse=True)
+        return tokens[first], inverse
+    return np.unique(tokens, return_inverse=True)
+
+
+def map_unique(tokens, func):
+    """取值种类很少的列（如标签）：对去重后的取值逐个计算，再用逆索引一次性展开"""
+    if len(tokens) == 0:
+        return tokens
+    unique, inverse = unique_tokens(tokens)
+    mapped = np.array([func(t) for t in unique], dtype=bytes)
+    return mapped[inverse]
+
+
+def _exact_fixed(value, decimals, rounding):
+    """单个值按 Decimal 精确舍入到 decimals 位小数后的定点写法，format_fixed 的慢速路径"""
+    d = Decimal(float(value))
+    if not d.is_finite():
+        return str(d)
+    # 精度足够容纳任意 float64 的整数部分，超大值也不会因超出默认 28 位精度而报错
+    q = d.quantize(Decimal(1).scaleb(-decimals), rounding=rounding,
+                   context=Context(prec=400 + decimals))
+    return format(q, 'f')
+
+
+@instrumentation.timed('format')
+def format_fixed(values, decimals=6, rounding=ROUND_HALF_UP):
+    """
+    批量计算 str(Decimal(float(v)).quantize(Decimal('0.000001'), rounding=ROUND_HALF_UP))
+    （小数位数由 decimals 指定）。先用浮点运算四舍五入，
+    离进位边界过近、绝对值过大或非有限的值再逐个交给 Decimal，结果完全一致。
+    rounding=ROUND_HALF_EVEN 时结果与 f"{Decimal(float(v)):.6f}" 一致。
+    decimals 大于 6 时同样输出定点写法（即 format(q, 'f')，str 会改用科学计数法）。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return np.zeros(0, dtype='S1')
+    scale = 10 ** decimals
+    scaled = np.abs(values) * scale
+    # scaled < 1e12 时乘法误差远小于 1e-3，不在 .5 附近的值舍入方向不会出错
+    frac = scaled - np.floor(scaled)
+    risky = ~(scaled < 1e12) | (np.abs(frac - 0.5) < 1e-3)
+    q = np.floor(np.where(risky, 0, scaled) + 0.5).astype(np.int64)
+    int_part, frac_part = np.divmod(q, scale)
+
+    # 从低位到高位逐位取数字写入字符矩阵：[符号][整数部分右对齐][.][小数部分]
+    width = len(str(int(int_part.max())))
+    total = 1 + width + (1 + decimals if decimals else 0)
+    mat = np.zeros((len(q), total), dtype=np.uint8)
+    for col in range(total - 1, 1 + width, -1):
+        frac_part, digit = np.divmod(frac_part, 10)
+        mat[:, col] = digit + 48
+    if decimals:
+        mat[:, 1 + width] = ord('.')
+    n_lead = np.zeros(len(q), dtype=np.intp)  # 整数部分的前导空位数
+    for col in range(width, 0, -1):
+        int_part, digit = np.divmod(int_part, 10)
+        mat[:, col] = digit + 48
+        if col < width:
+            empty = (digit == 0) & (int_part == 0)
+            mat[empty, col] = 0
+            n_lead += empty
+    negative = np.signbit(values)
+    mat[np.flatnonzero(negative), n_lead[negative]] = ord('-')
+
+    # 按行去掉开头的空位，左对齐成定长字节数组
+    shift = n_lead + ~negative
+    out = np.zeros_like(mat)
+    for k in np.unique(shift):
+        rows = shift == k
+        out[rows, :total - k] = mat[rows, k:]
+    result = out.view(f'S{total}').ravel()
+    bad = np.flatnonzero(risky)
+    if len(bad) == 0:
+        return result
+    fixed = [_exact_fixed(values[i], decimals, rounding).encode() for i in bad]
+    result = result.astype(f'S{max(result.itemsize, max(len(t) for t in fixed))}')
+    result[bad] = fixed
+    return result
+
+
+@instrumentation.timed('format')
+def join_columns(columns, sep=b' ', end=b'\n'):
+    """把若干列定长字节数组按行拼接为文本，返回 bytes"""
+    n = len(columns[0])
+    if n == 0:
+        return b''
+    total = sum(c.itemsize for c in columns) + len(sep) * (len(columns) - 1) + len(end)
+    mat = np.zeros((n, total), dtype=np.uint8)
+    offset = 0
+    for i, col in enumerate(columns):
+        w = col.itemsize
+        mat[:, offset:offset + w] = _char_matrix(col)
+        offset += w
+        if i < len(columns) - 1 and sep:
+            mat[:, offset:offset + len(sep)] = np.frombuffer(sep, dtype=np.uint8)
+            offset += len(sep)
+    if end:
+        mat[:, offset:] = np.frombuffer(end, dtype=np.uint8)
+    flat = mat.reshape(-1)
+    # 定长数组的填充字节为 0，去掉即得变长文本
+    return flat[flat != 0].tobytes()
+
+
+def merge_lines(cloud, columns, sep=b' ', end=b'\n'):
+    """
+    按原始行顺序输出：列数符合的行用 columns 拼出的新行，
+    其余行原样保留（与逐行处理时直接返回原行的行为一致）。
+    """
+    bad_lines = np.flatnonzero(~cloud.valid)
+    if len(bad_lines) == 0:
+        return join_columns(columns, sep, end)
+    parts = []
+    row = 0
+    for k, line in enumerate(bad_lines):
+        next_row = line - k  # 该行之前的合法行数
+        if next_row > row:
+            parts.append(join_columns([c[row:next_row] for c in columns], sep, end))
+        parts.append(cloud.bad_line_bytes[k])
+        row = next_row
+    if row < len(columns[0]):
+        parts.append(join_columns([c[row:] for c in columns], sep, end))
+    return b''.join(parts)
+
+
+@instrumentation.timed('write')
+def write_bytes(output_file_path, data):
+    """
+    写出文件，必要时创建输出文件夹。先写临时文件再改名；
+    启用 io_scheduler 的异步写出时交给写线程，这里只计入排队等待的时间。
+    """
+    io_scheduler.write(output_file_path, data)
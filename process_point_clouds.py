@@ -1,6 +1,27 @@
+import argparse
+import io
 import os
+import sys
 from decimal import Decimal
 
+import numpy as np
+
+from build_manifest import Manifest
+from directory_runner import add_force_argument, add_jobs_argument, run_tasks, walk_files
+from label_remap import label_matcher, remap_tokens
+from point_cloud_io import (XYZ_NORMAL_LABEL, canonical_decimal, join_columns, read_point_cloud,
+                            report_bad_rows, unique_tokens, write_bytes)
+
+# 标签交换表：1 <-> 2，其他保持不变
+LABEL_SWAP = {"1": "2", "2": "1"}
+
+# 每个标签对应的输出文件后缀
+LABEL_SUFFIXES = {
+    "1": "-C",  # C类
+    "2": "-P",  # P类
+    "3": "-S"   # S类
+}
+
 
 def process_line(line):
     """处理每行数据，交换标签1和标签2"""
@@ -9,13 +30,8 @@ def process_line(line):
         # 提取各列数据
         x, y, z, nx, ny, nz, label = columns
         
-        # 交换标签1和标签2
-        if label == "1":
-            new_label = "2"
-        elif label == "2":
-            new_label = "1"
-        else:
-            new_label = label  # 其他标签保持不变
+        # 交换标签1和标签2，其他标签保持不变
+        new_label = LABEL_SWAP.get(label, label)
             
         # 使用Decimal来保持精度并返回处理后的行
         new_line = f"{Decimal(x)} {Decimal(y)} {Decimal(z)} {Decimal(nx)} {Decimal(ny)} {Decimal(nz)} {new_label}"
@@ -26,75 +42,149 @@ def process_line(line):
         return line.strip()
 
 
-def process_file(file_path, output_dir):
-    """处理单个文件，交换标签并按标签分类保存"""
-    with open(file_path, 'r') as infile:
-        lines = infile.readlines()
+FORMATS = ('txt', 'npy', 'both')
+
+
+def split_columns(columns, swap=LABEL_SWAP, suffixes=LABEL_SUFFIXES, unknown=None,
+                  numeric=False):
+    """
+    交换标签并按标签分组，columns 为 {列名: token 数组}。
+    返回 {输出文件后缀: 该类别的列}，只包含有数据的类别，类别内保持输入的行顺序。
+    标签按原始文本匹配 swap 和 suffixes 的键；numeric 为 True 时文本不同但数值相等的也匹配
+    （"1.000000" 与 "1" 视为同一标签）。
+    未知标签的行被丢弃，给定 unknown 时把 {标签: 行数} 累加进去，由调用方按文件汇总提示。
+    """
+    # 整列处理：坐标保持 Decimal 精度，标签查表交换
+    result = {name: canonical_decimal(columns[name]) for name in XYZ_NORMAL_LABEL[:6]}
+    labels = remap_tokens(columns['label'], swap, numeric)
+    result['label'] = labels
+
+    # 每行的类别序号（未知标签为 -1），稳定排序一次后每个类别是一段连续的行
+    values, inverse = unique_tokens(labels)
+    match = label_matcher(suffixes, numeric)
+    order_of = {label: k for k, label in enumerate(suffixes)}
+    value_group = np.array([order_of.get(match(v), -1) for v in values], dtype=np.intp)
+    group = value_group[inverse]
+    if unknown is not None:
+        rows_per_value = np.bincount(inverse, minlength=len(values))
+        for k in np.flatnonzero(value_group < 0):
+            label = values[k].decode()
+            unknown[label] = unknown.get(label, 0) + int(rows_per_value[k])
+    order = np.argsort(group, kind='stable')
+    bounds = np.searchsorted(group[order], np.arange(len(suffixes) + 1))
+    groups = {}
+    for k, label in enumerate(suffixes):
+        rows = order[bounds[k]:bounds[k + 1]]
+        if len(rows):
+            groups[suffixes[label]] = {name: c[rows] for name, c in result.items()}
+    return groups
+
+
+def report_unknown_labels(file_path, unknown):
+    """每个文件只输出一条未知标签的汇总提示"""
+    total = sum(unknown.values())
+    if total == 0:
+        return
+    detail = '，'.join(f"{label} {n}" for label, n in sorted(unknown.items()))
+    print(f"警告：{file_path}: 丢弃 {total} 个未知标签的点（{detail}）")
+
+
+def output_paths(output_dir, base_name, suffixes=LABEL_SUFFIXES, output_format='txt'):
+    """各类别可能生成的输出文件"""
+    extensions = ['.txt', '.npy'] if output_format == 'both' else ['.' + output_format]
+    return [os.path.join(output_dir, f"{base_name}{suffix}{ext}")
+            for suffix in suffixes.values() for ext in extensions]
+
+
+def process_file(file_path, output_dir, suffixes=LABEL_SUFFIXES, output_format='txt'):
+    """
+    处理单个文件，交换标签并按标签分类保存。
+    output_format 为 'npy' 时每个类别保存为 (N, 7) float64 的 .npy，'both' 时同时保存 txt 和 npy。
+    """
+    cloud = read_point_cloud(file_path, XYZ_NORMAL_LABEL)
+    report_bad_rows(file_path, cloud)  # 列数不符的行不写出
 
-    # 处理每行数据
-    processed_lines = [process_line(line) for line in lines]
-    
-    # 按标签分组
-    label_groups = {
-        "1": [],  # C类
-        "2": [],  # P类
-        "3": []   # S类
-    }
-    
-    for line in processed_lines:
-        columns = line.split()
-        if len(columns) == 7:
-            label = columns[6]
-            if label in label_groups:
-                label_groups[label].append(line)
-            else:
-                print(f"警告：未知标签 {label}")
-    
     # 获取原始文件名（不含扩展名）
     base_name = os.path.splitext(os.path.basename(file_path))[0]
-    
-    # 为每个标签创建对应的输出文件
-    label_suffixes = {
-        "1": "-C",
-        "2": "-P",
-        "3": "-S"
-    }
-    
+
     # 确保输出目录存在
     os.makedirs(output_dir, exist_ok=True)
-    
-    # 保存每个标签的点云到单独的文件
-    for label, lines in label_groups.items():
-        if lines:  # 只有当有数据时才创建文件
-            suffix = label_suffixes.get(label, f"-{label}")
-            output_file_path = os.path.join(output_dir, f"{base_name}{suffix}.txt")
-            with open(output_file_path, 'w') as outfile:
-                outfile.write('\n'.join(lines) + '\n')
+
+    # 保存每个标签的点云到单独的文件（只有当有数据时才创建文件）
+    points, unknown = 0, {}
+    groups = split_columns(cloud.token_columns(), suffixes=suffixes, unknown=unknown)
+    report_unknown_labels(file_path, unknown)
+    for suffix, columns in groups.items():
+        output_file_path = os.path.join(output_dir, f"{base_name}{suffix}")
+        if output_format in ('txt', 'both'):
+            write_bytes(output_file_path + '.txt', join_columns(list(columns.values())))
+        if output_format in ('npy', 'both'):
+            data = np.column_stack([c.astype(np.float64) for c in columns.values()])
+            buffer = io.BytesIO()
+            np.save(buffer, data)
+            write_bytes(output_file_path + '.npy', buffer.getvalue())
+        points += len(columns['label'])
+    return points
 
 
-def process_directory(input_dir, output_dir):
+def process_directory(input_dir, output_dir, jobs=1, force=False, suffixes=LABEL_SUFFIXES,
+                      output_format='txt'):
     """递归遍历输入文件夹并处理所有txt文件"""
-    for root, dirs, files in os.walk(input_dir):
-        for file in files:
-            if file.endswith('.txt'):
-                input_file_path = os.path.join(root, file)
-                
-                # 保持相对路径结构
-                relative_path = os.path.relpath(root, input_dir)
-                output_subdir = os.path.join(output_dir, relative_path)
-                
-                # 确保输出子目录存在
-                os.makedirs(output_subdir, exist_ok=True)
-                
-                # 处理每个文件
-                process_file(input_file_path, output_subdir)
+    tasks = []
+    for input_file_path in walk_files(input_dir, '.txt'):
+        # 保持相对路径结构
+        relative_path = os.path.relpath(os.path.dirname(input_file_path), input_dir)
+        output_subdir = os.path.join(output_dir, relative_path)
 
+        # 确保输出子目录存在
+        os.makedirs(output_subdir, exist_ok=True)
+        # 可能生成的各类别输出文件（实际只生成有数据的类别）
+        base_name = os.path.splitext(os.path.basename(input_file_path))[0]
+        outputs = output_paths(output_subdir, base_name, suffixes, output_format)
+        tasks.append((input_file_path, (input_file_path, output_subdir, suffixes, output_format),
+                      outputs))
 
-if __name__ == "__main__":
-    input_directory = input("请输入源文件夹路径: ")
-    output_directory = input("请输入目标文件夹路径: ")
+    # 处理每个文件
+    params = {'suffixes': suffixes, 'format': output_format}
+    return run_tasks(process_file, tasks, jobs, Manifest(output_dir, params, force))
+
+
+def parse_suffixes(items):
+    """解析命令行的 标签=后缀 列表，如 ["1=-C", "2=-P"]"""
+    suffixes = {}
+    for item in items:
+        label, sep, suffix = item.partition('=')
+        if not sep or not label:
+            raise argparse.ArgumentTypeError(f"标签后缀应写作 标签=后缀，得到 {item!r}")
+        suffixes[label] = suffix
+    return suffixes
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="交换标签1和标签2，并按标签拆分点云")
+    parser.add_argument('input_dir', nargs='?', help="源文件夹路径（省略时交互输入）")
+    parser.add_argument('output_dir', nargs='?', help="目标文件夹路径（省略时交互输入）")
+    parser.add_argument('--suffixes', nargs='+', metavar='LABEL=SUFFIX',
+                        help="标签到输出文件后缀的映射（按交换后的标签），默认 1=-C 2=-P 3=-S")
+    parser.add_argument('--format', choices=FORMATS, default='txt',
+                        help="每个类别的输出格式：txt、npy（(N, 7) float64）或两者都写")
+    add_jobs_argument(parser)
+    add_force_argument(parser)
+    args = parser.parse_args()
+    suffixes = parse_suffixes(args.suffixes) if args.suffixes else LABEL_SUFFIXES
+    if not (args.input_dir and args.output_dir) and not sys.stdin.isatty():
+        # 非交互运行（如由调度程序启动）时不等待输入
+        parser.error("请提供源文件夹和目标文件夹路径")
+    input_directory = args.input_dir or input("请输入源文件夹路径: ")
+    output_directory = args.output_dir or input("请输入目标文件夹路径: ")
     
     # 处理文件夹
-    process_directory(input_directory, output_directory)
+    process_directory(input_directory, output_directory, args.jobs, args.force, suffixes,
+                      args.format)
     
-    print("处理完成！") 
\ No newline at end of file
+    print("处理完成！")
+
+
+if __name__ == "__main__":
+    main()
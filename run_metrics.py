@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多次训练日志的汇总
+
+build 把一组训练日志（glob 模式）并行解析，每个日志的各轮结果保存为一个 .npz 文件（按列存储）：
+    epoch       出现过的轮次（升序，int32）
+    train_loss, train_acc, test_loss, test_acc, test_iou, time
+                各轮的值（float64），日志中缺少的为 NaN
+    source, source_size, source_mtime_ns
+                日志路径、大小和修改时间，日志没有变化时再次 build 会跳过
+日志用 mmap 整块扫描（与 calculate_results.py 相同的正则表达式），不逐行读入 Python，
+几个 GB 的日志也不需要整个读入内存。
+运行名为日志相对 glob 模式中第一个通配符之前的目录的路径（去掉扩展名），
+.npz 按同样的相对路径保存在汇总目录中。
+
+best / leaderboard / plot 只读取汇总目录中的 .npz，不再解析日志：
+    best         每次运行最佳测试准确率所在的轮次（与 calculate_results.py 的汇总相同）
+    leaderboard  按最佳测试 IoU 排序
+    plot         把多次运行的某项指标画在同一张图上
+
+命令行：
+    python run_metrics.py build "sweeps/*/run.log" store_dir [--jobs N] [--force]
+    python run_metrics.py best store_dir
+    python run_metrics.py leaderboard store_dir [--top N]
+    python run_metrics.py plot store_dir output.png [--metric test_iou] [--top N] [--runs 名称 ...]
+"""
+
+import argparse
+import glob
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from calculate_results import test_pattern, train_pattern
+from directory_runner import add_force_argument, add_jobs_argument, walk_files
+
+
+METRICS = ('train_loss', 'train_acc', 'test_loss', 'test_acc', 'test_iou', 'time')
+
+# 两个正则表达式合并为一个，在整个文件上搜索一遍：训练行为第 1-5 组，测试行为第 6-11 组。
+# 不写 ^ 锚定行首，正则引擎才能按开头的字面量快速跳过无关的行（约快 10 倍），
+# 是否位于行首在找到之后再检查
+_LINE_PATTERN = re.compile(
+    rb'(?:' + train_pattern.pattern.encode() + rb'|' + test_pattern.pattern.encode() + rb')')
+
+
+def scan_log(log_path):
+    """
+    用 mmap 扫描整个日志，返回 (train, test)：
+    train[轮次] = (loss, acc)，test[轮次] = (loss, acc, IoU, 耗时)，同一轮次以最后一次为准。
+    """
+    train, test = {}, {}
+    with open(log_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return train, test
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for m in _LINE_PATTERN.finditer(data):
+                # 与逐行 strip() 后 match() 相同：匹配之前只能有空白
+                start = m.start()
+                if data[data.rfind(b'\n', 0, start) + 1:start].strip():
+                    continue
+                if m.group(1) is not None:
+                    train[int(m.group(1))] = (float(m.group(2)), float(m.group(3)))
+                else:
+                    test[int(m.group(6))] = (float(m.group(7)), float(m.group(8)),
+                                             float(m.group(10)), float(m.group(11)))
+    return train, test
+
+
+def to_columns(train, test):
+    """把各轮结果展开为按列存储的数组，缺少的值为 NaN"""
+    epochs = np.array(sorted(train.keys() | test.keys()), dtype=np.int32)
+    columns = {'epoch': epochs}
+    for name in METRICS:
+        columns[name] = np.full(len(epochs), np.nan)
+    for i, epoch in enumerate(epochs.tolist()):
+        if epoch in train:
+            columns['train_loss'][i], columns['train_acc'][i] = train[epoch]
+        if epoch in test:
+            (columns['test_loss'][i], columns['test_acc'][i],
+             columns['test_iou'][i], columns['time'][i]) = test[epoch]
+    return columns
+
+
+def _glob_root(pattern):
+    """glob 模式中第一个含通配符的路径部分之前的目录"""
+    parts = pattern.replace(os.sep, '/').split('/')
+    fixed = []
+    for part in parts[:-1]:
+        if glob.has_magic(part):
+            break
+        fixed.append(part)
+    return '/'.join(fixed) or '.'
+
+
+def _is_current(store_path, log_path):
+    """汇总文件存在，且记录的日志大小和修改时间与现在相同"""
+    try:
+        with np.load(store_path) as data:
+            st = os.stat(log_path)
+            return (int(data['source_size']) == st.st_size
+                    and int(data['source_mtime_ns']) == st.st_mtime_ns)
+    except (OSError, KeyError, ValueError):
+        return False
+
+
+def build_run(log_path, store_path):
+    """解析一个日志并写出它的 .npz，返回解析到的轮次数"""
+    st = os.stat(log_path)
+    columns = to_columns(*scan_log(log_path))
+    os.makedirs(os.path.dirname(store_path) or '.', exist_ok=True)
+    tmp = f"{store_path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        np.savez(f, source=np.array(os.path.abspath(log_path)),
+                 source_size=np.int64(st.st_size), source_mtime_ns=np.int64(st.st_mtime_ns),
+                 **columns)
+    os.replace(tmp, store_path)
+    return len(columns['epoch'])
+
+
+def build_store(pattern, store_dir, jobs=1, force=False):
+    """解析匹配 pattern 的全部日志，写入 store_dir，返回 {运行名: 轮次数}（跳过的不计入）"""
+    root = _glob_root(pattern)
+    log_paths = [p for p in sorted(glob.glob(pattern, recursive=True)) if os.path.isfile(p)]
+    tasks = []
+    for log_path in log_paths:
+        run = os.path.splitext(os.path.relpath(log_path, root))[0]
+        store_path = os.path.join(store_dir, run + '.npz')
+        if force or not _is_current(store_path, log_path):
+            tasks.append((run, log_path, store_path))
+    print(f"共 {len(log_paths)} 个日志，{len(log_paths) - len(tasks)} 个未变化已跳过")
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    # 大日志先开始
+    tasks.sort(key=lambda task: os.path.getsize(task[1]), reverse=True)
+    built, failed = {}, []
+    if jobs <= 1 or len(tasks) <= 1:
+        for run, log_path, store_path in tasks:
+            try:
+                built[run] = build_run(log_path, store_path)
+            except Exception as e:
+                failed.append((log_path, e))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(build_run, log_path, store_path): (run, log_path)
+                       for run, log_path, store_path in tasks}
+            for future in as_completed(futures):
+                run, log_path = futures[future]
+                try:
+                    built[run] = future.result()
+                except Exception as e:  # 子进程异常退出等
+                    failed.append((log_path, e))
+    print(f"解析 {len(built)} 个日志，共 {sum(built.values())} 轮，失败 {len(failed)} 个")
+    for log_path, e in sorted(failed, key=lambda item: item[0]):
+        print(f"  失败: {log_path}: {type(e).__name__}: {e}")
+    return built
+
+
+def load_store(store_dir):
+    """读取汇总目录中的全部运行，返回 {运行名: {列名: 数组}}（按运行名排序）"""
+    runs = {}
+    for path in sorted(walk_files(store_dir, '.npz')):
+        run = os.path.splitext(os.path.relpath(path, store_dir))[0].replace(os.sep, '/')
+        with np.load(path) as data:
+            runs[run] = {name: data[name] for name in ('epoch',) + METRICS}
+    return runs
+
+
+def best_epoch(columns, metric='test_acc'):
+    """metric 最大的轮次所在的行号，相同时取最早的轮次；没有该指标时返回 None"""
+    values = columns[metric]
+    if np.isnan(values).all():
+        return None
+    return int(np.nanargmax(values))
+
+
+def best_epochs(runs):
+    """每次运行最佳测试准确率所在轮次的汇总，返回 [(运行名, 字典或 None)]"""
+    rows = []
+    for run, columns in runs.items():
+        i = best_epoch(columns)
+        if i is None:
+            rows.append((run, None))
+            continue
+        rows.append((run, {
+            'epoch': int(columns['epoch'][i]),
+            'test_acc': float(columns['test_acc'][i]),
+            'train_acc': float(columns['train_acc'][i]),
+            'test_iou': float(columns['test_iou'][i]),
+            'total_time': float(np.nansum(columns['time'])),
+            'epochs': int(np.count_nonzero(~np.isnan(columns['test_acc']))),
+        }))
+    return rows
+
+
+def leaderboard(runs, top=None):
+    """按最佳测试 IoU 从高到低排序，返回 [(运行名, 轮次, 最佳 IoU, 该轮测试准确率)]"""
+    rows = []
+    for run, columns in runs.items():
+        i = best_epoch(columns, 'test_iou')
+        if i is not None:
+            rows.append((run, int(columns['epoch'][i]), float(columns['test_iou'][i]),
+                         float(columns['test_acc'][i])))
+    rows.sort(key=lambda row: (-row[2], row[0]))
+    return rows[:top] if top else rows
+
+
+def plot_runs(runs, output_path, metric='test_iou'):
+    """把各次运行的 metric 曲线画在同一张图上（缺少的轮次处断开）"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(12, 8))
+    for run, columns in runs.items():
+        # 轮次不连续时插入 NaN，曲线在缺少的轮次处断开
+        epochs = columns['epoch']
+        x = np.arange(epochs.max() + 1 if len(epochs) else 0)
+        y = np.full(len(x), np.nan)
+        y[epochs] = columns[metric]
+        plt.plot(x, y, label=run, linewidth=1)
+    plt.xlabel('Epoch', fontsize=14)
+    plt.ylabel(metric, fontsize=14)
+    plt.title(f'{metric} ({len(runs)} runs)', fontsize=16)
+    if len(runs) <= 20:
+        plt.legend(fontsize=8)
+    plt.grid(True, linestyle='--', alpha=0.7)
+    plt.tight_layout()
+    fig.savefig(output_path)
+    plt.close(fig)
+
+
+def _value(value, spec='.4f'):
+    return "缺失" if value is None or np.isnan(value) else format(value, spec)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="汇总多次训练的日志并按运行比较结果")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('build', help="并行解析日志，写入汇总目录")
+    p.add_argument('pattern', help="日志的 glob 模式（如 \"sweeps/*/run.log\"，** 递归）")
+    p.add_argument('store_dir', help="汇总目录")
+    add_jobs_argument(p)
+    add_force_argument(p)
+    p = sub.add_parser('best', help="每次运行最佳测试准确率所在的轮次")
+    p.add_argument('store_dir', help="汇总目录")
+    p = sub.add_parser('leaderboard', help="按最佳测试 IoU 排序")
+    p.add_argument('store_dir', help="汇总目录")
+    p.add_argument('--top', type=int, default=None, help="只显示前 N 次运行")
+    p = sub.add_parser('plot', help="把多次运行的曲线画在同一张图上")
+    p.add_argument('store_dir', help="汇总目录")
+    p.add_argument('output', help="输出图片路径")
+    p.add_argument('--metric', choices=METRICS, default='test_iou', help="要画的指标")
+    p.add_argument('--top', type=int, default=None, help="只画最佳测试 IoU 排名前 N 的运行")
+    p.add_argument('--runs', nargs='+', default=None, help="只画名称包含这些字符串的运行")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_store(args.pattern, args.store_dir, args.jobs, args.force)
+        return
+
+    runs = load_store(args.store_dir)
+    if args.command == 'best':
+        for run, summary in best_epochs(runs):
+            if summary is None:
+                print(f"{run}: 还没有测试结果")
+                continue
+            print(f"{run}: 轮次 {summary['epoch']}，测试准确率 {summary['test_acc']:.4f}，"
+                  f"训练准确率 {_value(summary['train_acc'])}，测试IoU {summary['test_iou']:.4f}，"
+                  f"总训练时长 {summary['total_time']:.2f} 秒（{summary['epochs']} 轮）")
+    elif args.command == 'leaderboard':
+        rows = leaderboard(runs, args.top)
+        width = max((len(row[0]) for row in rows), default=0)
+        print(f"{'#':>4}  {'运行':<{width}}  {'轮次':>6}  {'测试IoU':>8}  {'测试准确率':>8}")
+        for rank, (run, epoch, iou, acc) in enumerate(rows, 1):
+            print(f"{rank:>4}  {run:<{width}}  {epoch:>6}  {iou:>8.4f}  {_value(acc):>8}")
+    else:
+        if args.top:
+            keep = {row[0] for row in leaderboard(runs, args.top)}
+            runs = {run: columns for run, columns in runs.items() if run in keep}
+        if args.runs:
+            runs = {run: columns for run, columns in runs.items()
+                    if any(s in run for s in args.runs)}
+        plot_runs(runs, args.output, args.metric)
+        print(f"已保存 {len(runs)} 次运行的 {args.metric} 曲线: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
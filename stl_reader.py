@@ -0,0 +1,107 @@
+import re
+
+import numpy as np
+
+from instrumentation import timed
+from point_cloud_io import map_file
+
+
+# 二进制 STL：80 字节文件头 + uint32 三角形个数 + 每个三角形 50 字节的记录
+HEADER_SIZE = 80
+COUNT_SIZE = 4
+STL_DTYPE = np.dtype([
+    ('normals', '<f4', (3,)),
+    ('vectors', '<f4', (3, 3)),
+    ('attr', '<u2', (1,)),
+])
+
+_FLOAT = rb'\s+(\S+)\s+(\S+)\s+(\S+)'
+_ASCII_FACET = re.compile(
+    rb'facet\s+normal' + _FLOAT + rb'\s+outer\s+loop' + (rb'\s+vertex' + _FLOAT) * 3 +
+    rb'\s+endloop\s+endfacet', re.IGNORECASE)
+_ASCII_END = re.compile(rb'^\s*end\s*solid', re.IGNORECASE | re.MULTILINE)
+_ENDFACET = re.compile(rb'endfacet', re.IGNORECASE)
+
+
+def _binary_count(data):
+    """按二进制格式解释时的三角形个数；文件大小与文件头记录的个数不符时返回 None"""
+    if len(data) < HEADER_SIZE + COUNT_SIZE:
+        return None
+    count = int(np.frombuffer(data, dtype='<u4', count=1, offset=HEADER_SIZE)[0])
+    if len(data) != HEADER_SIZE + COUNT_SIZE + count * STL_DTYPE.itemsize:
+        return None
+    return count
+
+
+def _is_ascii(data, count):
+    """与 numpy-stl 的判断一致：以 solid 开头且不是大小吻合的二进制文件时按 ASCII 读取"""
+    return count is None and data[:HEADER_SIZE].lstrip().lower().startswith(b'solid')
+
+
+def _parse_ascii(data):
+    """解析一段 ASCII STL 文本中的全部 facet"""
+    values = np.array(_ASCII_FACET.findall(data), dtype='S').astype(np.float64)
+    records = np.zeros(len(values), dtype=STL_DTYPE)
+    if len(values):
+        records['normals'] = values[:, :3]
+        records['vectors'] = values[:, 3:].reshape(-1, 3, 3)
+    return records
+
+
+def _ascii_end(data):
+    """第一个 solid 的结束位置（numpy-stl 也只读取第一个 solid）"""
+    end = _ASCII_END.search(data)
+    return end.start() if end else len(data)
+
+
+@timed('parse')
+def read_stl(file_path):
+    """
+    读取二进制或 ASCII STL，返回 STL_DTYPE 结构化数组。
+    二进制文件直接内存映射为只读数组（零拷贝），ASCII 文件整体解析。
+    """
+    data = map_file(file_path)
+    if len(data) == 0:
+        raise ValueError(f"STL file is empty: {file_path}")
+    count = _binary_count(data)
+    if _is_ascii(data, count):
+        return _parse_ascii(data[:_ascii_end(data)])
+    if count is None:
+        # 文件被截断等情况：按实际长度能容纳的记录数读取
+        available = (len(data) - HEADER_SIZE - COUNT_SIZE) // STL_DTYPE.itemsize
+        count = max(0, min(available, int(np.frombuffer(data, dtype='<u4', count=1,
+                                                        offset=HEADER_SIZE)[0])))
+    return np.frombuffer(data, dtype=STL_DTYPE, count=count, offset=HEADER_SIZE + COUNT_SIZE)
+
+
+def iter_stl(file_path, batch_size):
+    """
+    每次产生最多 batch_size 个三角形的 STL_DTYPE 数组。
+    二进制文件的每一批都是内存映射上的视图；ASCII 文件按 endfacet 切成小段逐段解析，
+    内存占用只与 batch_size 有关。
+    """
+    data = map_file(file_path)
+    if len(data) == 0:
+        raise ValueError(f"STL file is empty: {file_path}")
+    if not _is_ascii(data, _binary_count(data)):
+        records = read_stl(file_path)
+        for start in range(0, len(records), batch_size):
+            yield records[start:start + batch_size]
+        return
+
+    # ASCII：每个 facet 约 250 字节，按此估计每段的长度，段尾对齐到 endfacet 之后
+    end = _ascii_end(data)
+    start, step = 0, batch_size * 256
+    while start < end:
+        stop = min(start + step, end)
+        match = _ENDFACET.search(data, stop, end) if stop < end else None
+        stop = match.end() if match else end
+        records = _parse_ascii(data[start:stop])
+        for first in range(0, len(records), batch_size):
+            yield records[first:first + batch_size]
+        start = stop
+
+
+def face_normals(vectors):
+    """按顶点重新计算面法向量（叉积，不归一化），与 numpy-stl 读入时的计算完全相同"""
+    return np.cross(vectors[:, 1] - vectors[:, 0], vectors[:, 2] - vectors[:, 0])
@@ -0,0 +1,40 @@
+import numpy as np
+
+from extract_points_from_mesh import weld_groups, weld_vertices
+
+
+def _max_span(vertices, inverse, m):
+    """每组顶点各分量跨度的最大值"""
+    span = 0.0
+    for g in range(m):
+        members = vertices[inverse == g]
+        span = max(span, float((members.max(axis=0) - members.min(axis=0)).max()))
+    return span
+
+
+def test_weld_does_not_chain_along_dense_points():
+    tol = 1e-3
+    vertices = np.zeros((50, 3))
+    vertices[:, 0] = np.arange(50) * 0.6 * tol
+    inverse, m = weld_groups(vertices, tol)
+    assert _max_span(vertices, inverse, m) <= 2 * tol
+    assert m > 50 * 0.6 / 2
+
+
+def test_weld_span_bounded_on_random_cloud():
+    tol = 0.05
+    vertices = np.random.default_rng(0).random((5000, 3))
+    inverse, m = weld_groups(vertices, tol)
+    assert _max_span(vertices, inverse, m) <= 2 * tol
+
+
+def test_weld_merges_jitter_across_grid_boundary():
+    tol = 1e-3
+    base = np.array([[0.0, 0.0, 0.0], [0.0, 1.0, 0.0], [1.0, 0.0, 0.0]]) + 0.5 * tol
+    jittered = base + np.array([1e-6, -1e-6, 2e-6])
+    vertices = np.concatenate([base, jittered])
+    sums = np.concatenate([np.eye(3), np.eye(3)])
+    positions, summed, merged = weld_vertices(vertices, sums, tol)
+    assert merged == 3
+    assert np.allclose(positions, (base + jittered) / 2)
+    assert np.allclose(summed, 2 * np.eye(3))
@@ -1,7 +1,15 @@
+import argparse
 import os
 from decimal import Decimal
 import numpy as np
 
+from build_manifest import Manifest
+from directory_runner import (add_chunk_rows_argument, add_force_argument, add_jobs_argument,
+                              run_tasks, walk_files)
+from normal_sanitizer import report_rejected, sanitize_normals
+from point_cloud_io import (XYZ_LABEL_NORMAL, canonical_decimal, join_columns, map_unique,
+                            transform_file)
+
 
 def process_line(line):
     """处理每行数据，调整顺序：x/y/z 法向量 x/y/z 标签"""
@@ -44,51 +52,79 @@ def process_line(line):
         return None
 
 
-def process_file(file_path, output_file_path):
-    """处理单个文件，调整数据顺序并保存到新的文件中"""
-    with open(file_path, 'r') as infile:
-        lines = infile.readlines()
-
-    # 调整每行的顺序
-    new_lines = [process_line(line) for line in lines]
-
-    # 过滤掉返回 None 的行（即包含 NaN 或 Inf 的行）
-    new_lines = [line for line in new_lines if line is not None]
-
-    # 创建输出文件夹，如果不存在
-    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
-
-    # 将调整后的数据保存到新文件
-    with open(output_file_path, 'w') as outfile:
-        outfile.writelines(new_lines)
-
-
-def process_directory(input_dir, output_dir):
+def normalize_columns(columns, counts=None):
+    """
+    调整顺序为 x y z nx ny nz label 并归一化法向量（整列向量化，结果与 process_line 一致），
+    法向量含 NaN、Inf 或为零向量的行被丢弃，各原因的行数累加到 counts。
+    columns 为 {列名: token 数组}，返回同样形式的新列。
+    """
+    # 整块检查并归一化法向量，过滤掉包含 NaN、Inf 或零向量的行
+    normals = np.empty((len(columns['nx']), 3))
+    for j, name in enumerate(('nx', 'ny', 'nz')):
+        normals[:, j] = columns[name]
+    normalized, keep, _ = sanitize_normals(normals, counts=counts)
+
+    # 使用Decimal来保持精度并重新排列
+    result = {name: canonical_decimal(columns[name][keep]) for name in ('x', 'y', 'z')}
+    for j, name in enumerate(('nx', 'ny', 'nz')):
+        result[name] = normalized[:, j].astype('S32')
+    result['label'] = map_unique(columns['label'][keep],
+                                 lambda t: f"{Decimal(float(t)):.6f}".encode())
+    return result
+
+
+def process_file(file_path, output_file_path, chunk_rows=None):
+    """
+    处理单个文件并保存到新的文件中，chunk_rows 给定时按块流式处理。
+    列数不符的行直接丢弃；法向量无效的点按原因汇总后每个文件提示一次。
+    """
+    counts = {}
+
+    def transform(cloud):
+        columns = normalize_columns(cloud.token_columns(), counts)
+        return join_columns(list(columns.values())), len(columns['x'])
+
+    points = transform_file(file_path, output_file_path, XYZ_LABEL_NORMAL, transform, chunk_rows)
+    report_rejected(file_path, counts)
+    return points
+
+
+def process_directory(input_dir, output_dir, jobs=1, chunk_rows=None, force=False):
     """递归遍历输入文件夹并处理所有txt文件"""
-    for root, dirs, files in os.walk(input_dir):
-        for file in files:
-            if file.endswith('.txt'):
-                input_file_path = os.path.join(root, file)
-                
-                # 获取文件名的前6个字符作为新文件名
-                file_name = os.path.basename(file)
-                new_file_name = file_name[:6] + '.txt'
-                
-                # 获取相对路径的目录部分
-                rel_dir = os.path.relpath(root, input_dir)
-                
-                # 组合新的输出路径
-                output_file_path = os.path.join(output_dir, rel_dir, new_file_name)
-                
-                # 处理每个文件
-                process_file(input_file_path, output_file_path)
-
-
-if __name__ == "__main__":
-    input_directory = "data"  # 输入文件夹路径
-    output_directory = "data_output"  # 输出文件夹路径
+    tasks = []
+    for input_file_path in walk_files(input_dir, '.txt'):
+        # 获取文件名的前6个字符作为新文件名
+        file_name = os.path.basename(input_file_path)
+        new_file_name = file_name[:6] + '.txt'
+
+        # 获取相对路径的目录部分
+        rel_dir = os.path.relpath(os.path.dirname(input_file_path), input_dir)
+
+        # 组合新的输出路径
+        output_file_path = os.path.join(output_dir, rel_dir, new_file_name)
+        tasks.append((input_file_path, (input_file_path, output_file_path, chunk_rows),
+                      [output_file_path]))
+
+    # 处理每个文件
+    return run_tasks(process_file, tasks, jobs, Manifest(output_dir, force=force),
+                     prefetch=chunk_rows is None)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="调整列顺序为 x/y/z 法向量 标签，并归一化法向量")
+    parser.add_argument('input_dir', nargs='?', default="data", help="输入文件夹路径")
+    parser.add_argument('output_dir', nargs='?', default="data_output", help="输出文件夹路径")
+    add_jobs_argument(parser)
+    add_chunk_rows_argument(parser)
+    add_force_argument(parser)
+    args = parser.parse_args()
 
     # 处理文件夹
-    process_directory(input_directory, output_directory)
+    process_directory(args.input_dir, args.output_dir, args.jobs, args.chunk_rows, args.force)
 
     print("处理完成！")
+
+
+if __name__ == "__main__":
+    main()
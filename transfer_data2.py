@@ -1,7 +1,14 @@
+import argparse
 import os
 from decimal import Decimal
 import numpy as np
 
+from build_manifest import Manifest
+from directory_runner import add_force_argument, add_jobs_argument, run_tasks, walk_files
+from normal_sanitizer import report_rejected, sanitize_normals
+from point_cloud_io import (XYZ_NORMAL, canonical_decimal, join_columns, read_point_cloud,
+                            report_bad_rows, write_bytes)
+
 
 def process_line(line):
     """处理每行数据，消除nan或inf数据"""
@@ -22,6 +29,9 @@ def process_line(line):
             print("has_inf:true")
             return None
         norms = np.linalg.norm(normals)  # 计算标量模
+        if norms == 0:
+            print("Warning: Zero-length normal vector detected.")
+            return None
         normalized_normals = normals / norms  # 直接除以标量
         normalized_normals = np.round(normalized_normals, decimals=8)
         nx, ny, nz = normalized_normals
@@ -35,42 +45,49 @@ def process_line(line):
 
 
 def process_file(file_path, output_file_path):
-    """处理单个文件，调整数据顺序并保存到新的文件中"""
-    with open(file_path, 'r') as infile:
-        lines = infile.readlines()
+    """处理单个文件，调整数据顺序并保存到新的文件中（整列向量化，结果与 process_line 一致）"""
+    cloud = read_point_cloud(file_path, XYZ_NORMAL)
+    report_bad_rows(file_path, cloud)  # 列数不符的行直接丢弃
 
-    # 调整每行的顺序
-    new_lines = [process_line(line) for line in lines]
+    # 整块检查并归一化法向量，过滤掉包含 NaN、Inf 或零向量的行
+    normalized, keep, counts = sanitize_normals(cloud.values('nx', 'ny', 'nz'))
+    report_rejected(file_path, counts)
 
-    # 过滤掉返回 None 的行（即包含 NaN 或 Inf 的行）
-    new_lines = [line for line in new_lines if line is not None]
-
-    # 创建输出文件夹，如果不存在
-    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+    # 使用Decimal来保持精度并重新排列
+    columns = [canonical_decimal(cloud.tokens(name)[keep]) for name in ('x', 'y', 'z')]
+    columns += [normalized[:, j].astype('S32') for j in range(3)]
 
     # 将调整后的数据保存到新文件
-    with open(output_file_path, 'w') as outfile:
-        outfile.writelines(new_lines)
+    write_bytes(output_file_path, join_columns(columns, end=b' \n'))
+    return len(columns[0])
 
 
-def process_directory(input_dir, output_dir):
+def process_directory(input_dir, output_dir, jobs=1, force=False):
     """递归遍历输入文件夹并处理所有txt文件"""
-    for root, dirs, files in os.walk(input_dir):
-        for file in files:
-            if file.endswith('.txt'):
-                input_file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(input_file_path, input_dir)
-                output_file_path = os.path.join(output_dir, relative_path)
+    tasks = []
+    for input_file_path in walk_files(input_dir, '.txt'):
+        relative_path = os.path.relpath(input_file_path, input_dir)
+        output_file_path = os.path.join(output_dir, relative_path)
+        tasks.append((input_file_path, (input_file_path, output_file_path), [output_file_path]))
 
-                # 处理每个文件
-                process_file(input_file_path, output_file_path)
+    # 处理每个文件
+    return run_tasks(process_file, tasks, jobs, Manifest(output_dir, force=force))
 
 
-if __name__ == "__main__":
-    input_directory = "data/data-test"  # 输入文件夹路径
-    output_directory = "data/data-test2"  # 输出文件夹路径
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="去除法向量为 NaN/Inf 的点并归一化法向量")
+    parser.add_argument('input_dir', nargs='?', default="data/data-test", help="输入文件夹路径")
+    parser.add_argument('output_dir', nargs='?', default="data/data-test2", help="输出文件夹路径")
+    add_jobs_argument(parser)
+    add_force_argument(parser)
+    args = parser.parse_args()
 
     # 处理文件夹
-    process_directory(input_directory, output_directory)
+    process_directory(args.input_dir, args.output_dir, args.jobs, args.force)
 
     print("处理完成！")
+
+
+if __name__ == "__main__":
+    main()
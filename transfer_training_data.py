@@ -1,6 +1,12 @@
+import argparse
 import os
 from decimal import Decimal
 
+from build_manifest import Manifest
+from directory_runner import (add_chunk_rows_argument, add_force_argument, add_jobs_argument,
+                              run_tasks, walk_files)
+from point_cloud_io import XYZ_NORMAL_LABEL, canonical_decimal, merge_lines, transform_file
+
 
 def process_line(line):
     """处理每行数据，调整顺序：x/y/z 法向量 x/y/z 标签"""
@@ -17,45 +23,55 @@ def process_line(line):
         return line
 
 
-def process_file(file_path, output_file_path):
-    """处理单个文件，调整数据顺序并保存到新的文件中"""
-    with open(file_path, 'r') as infile:
-        lines = infile.readlines()
+def drop_label_columns(columns):
+    """去掉标签列，坐标和法向量保持 Decimal 精度"""
+    return {name: canonical_decimal(columns[name]) for name in XYZ_NORMAL_LABEL[:6]}
+
 
-    # 调整每行的顺序
-    new_lines = [process_line(line) for line in lines]
+def transform(cloud):
+    columns = drop_label_columns(cloud.token_columns())
+    return merge_lines(cloud, list(columns.values())), len(cloud)  # 列数不符的行原样保留
 
-    # 创建输出文件夹，如果不存在
-    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
 
-    # 将调整后的数据保存到新文件
-    with open(output_file_path, 'w') as outfile:
-        outfile.writelines(new_lines)
+def process_file(file_path, output_file_path, chunk_rows=None):
+    """处理单个文件并保存到新的文件中，chunk_rows 给定时按块流式处理"""
+    return transform_file(file_path, output_file_path, XYZ_NORMAL_LABEL, transform, chunk_rows)
 
 
-def process_directory(input_dir, output_dir):
+def process_directory(input_dir, output_dir, jobs=1, chunk_rows=None, force=False):
     """递归遍历输入文件夹并处理所有txt文件"""
-    for root, dirs, files in os.walk(input_dir):
-        for file in files:
-            if file.endswith('.txt'):
-                input_file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(input_file_path, input_dir)
+    tasks = []
+    for input_file_path in walk_files(input_dir, '.txt'):
+        relative_path = os.path.relpath(input_file_path, input_dir)
 
-                # 处理文件名：如果以 _predicted 结尾，则去掉它
-                file_name, ext = os.path.splitext(relative_path)
-                if file_name.endswith('_predicted'):
-                    file_name = file_name[:-10]  # 去掉 "_predicted"
-                output_file_path = os.path.join(output_dir, file_name + ext)
+        # 处理文件名：如果以 _predicted 结尾，则去掉它
+        file_name, ext = os.path.splitext(relative_path)
+        if file_name.endswith('_predicted'):
+            file_name = file_name[:-10]  # 去掉 "_predicted"
+        output_file_path = os.path.join(output_dir, file_name + ext)
+        tasks.append((input_file_path, (input_file_path, output_file_path, chunk_rows),
+                      [output_file_path]))
 
-                # 处理每个文件
-                process_file(input_file_path, output_file_path)
+    # 处理每个文件
+    return run_tasks(process_file, tasks, jobs, Manifest(output_dir, force=force),
+                     prefetch=chunk_rows is None)
 
 
-if __name__ == "__main__":
-    input_directory = "data"  # 输入文件夹路径
-    output_directory = "data_output/test"  # 输出文件夹路径
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="去掉标签列，生成训练输入")
+    parser.add_argument('input_dir', nargs='?', default="data", help="输入文件夹路径")
+    parser.add_argument('output_dir', nargs='?', default="data_output/test", help="输出文件夹路径")
+    add_jobs_argument(parser)
+    add_chunk_rows_argument(parser)
+    add_force_argument(parser)
+    args = parser.parse_args()
 
     # 处理文件夹
-    process_directory(input_directory, output_directory)
+    process_directory(args.input_dir, args.output_dir, args.jobs, args.chunk_rows, args.force)
 
     print("处理完成！")
+
+
+if __name__ == "__main__":
+    main()
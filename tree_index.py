@@ -0,0 +1,194 @@
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from point_cloud_cache import file_digest
+
+
+# 旧版本保存在目录树根下的索引文件名；扫描时连同 SQLite 的 -journal/-wal/-shm 文件一起跳过
+INDEX_NAME = '.tree_index.sqlite'
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'tree_index')
+# 修改时间离现在这么近的文件不保存哈希：同一时间精度内的再次修改无法从大小和修改时间看出来
+RACY_SECONDS = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT
+)
+"""
+
+
+def _scan_dir(path, prefix):
+    """
+    扫描一个目录，返回 (文件 [(相对路径, 大小, 修改时间)], 子目录 [(路径, 相对路径前缀)])。
+    prefix 为该目录相对根目录的路径前缀（根目录为 ''）。
+    """
+    files, dirs = [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append((entry.path, prefix + entry.name + '/'))
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        files.append((prefix + entry.name, st.st_size, st.st_mtime_ns))
+                except OSError:
+                    continue
+    except OSError as e:
+        print(f"无法读取目录 {path}: {e}")
+    return files, dirs
+
+
+def scan_tree(root_dir, workers=8):
+    """
+    多线程并行 os.scandir 遍历整棵目录树，
+    返回 {相对路径: (大小, 修改时间 ns)}，相对路径统一用 '/' 分隔。
+    """
+    found = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan_dir, root_dir, '')}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, dirs = future.result()
+                for rel_path, size, mtime_ns in files:
+                    found[rel_path] = (size, mtime_ns)
+                pending.update(pool.submit(_scan_dir, d, prefix) for d, prefix in dirs)
+    return {path: entry for path, entry in found.items() if not path.startswith(INDEX_NAME)}
+
+
+def default_index_path(root_dir, index_dir=None):
+    """
+    索引文件位置：放在 index_dir（默认为用户缓存目录下的 tree_index）中，
+    按根目录的真实路径命名，不在被比较的目录树里写入文件。
+    """
+    real = os.path.realpath(root_dir)
+    key = hashlib.blake2b(real.encode(), digest_size=8).hexdigest()
+    return os.path.join(index_dir or DEFAULT_INDEX_DIR, f"{os.path.basename(real)}-{key}.sqlite")
+
+
+def _connect(path):
+    """打开索引；无法创建或写入（只读目录、共享目录等）时改用内存索引，本次运行仍可比较"""
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if os.path.exists(path) and not os.access(path, os.W_OK):
+            raise PermissionError(f"没有写入权限: {path}")
+        db = sqlite3.connect(path)
+        try:
+            with db:
+                db.execute(_SCHEMA)
+        except sqlite3.Error:
+            db.close()
+            raise
+        return db
+    except (OSError, sqlite3.Error) as e:
+        print(f"无法写入索引 {path}: {e}，本次使用内存索引")
+        db = sqlite3.connect(':memory:')
+        db.execute(_SCHEMA)
+        return db
+
+
+class TreeIndex:
+    """
+    目录树的持久索引：每个文件的 相对路径、大小、修改时间、内容哈希，保存在 SQLite 中。
+    refresh() 增量更新：大小或修改时间变化的文件清除旧哈希，已删除的文件移除记录；
+    哈希只在需要时（digests()）计算并写回，未变化的文件再次运行时不会重新读取。
+    """
+
+    def __init__(self, root_dir, index_path=None, workers=8):
+        self.root_dir = root_dir
+        self.workers = workers
+        self.path = index_path or default_index_path(root_dir)
+        self.db = _connect(self.path)
+        self.files = {}
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def refresh(self):
+        """重新扫描目录树并更新索引，返回 {相对路径: (大小, 修改时间, 哈希或 None)}"""
+        old = {path: (size, mtime_ns, digest) for path, size, mtime_ns, digest
+               in self.db.execute("SELECT path, size, mtime_ns, digest FROM files")}
+        current = scan_tree(self.root_dir, self.workers)
+        files, changed = {}, []
+        for path, (size, mtime_ns) in current.items():
+            entry = old.get(path)
+            if entry is not None and entry[:2] == (size, mtime_ns):
+                files[path] = entry
+            else:
+                files[path] = (size, mtime_ns, None)
+                changed.append((path, size, mtime_ns))
+        removed = [(path,) for path in old.keys() - current.keys()]
+        with self.db:
+            self.db.executemany("DELETE FROM files WHERE path = ?", removed)
+            self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, NULL)", changed)
+        self.files = files
+        return files
+
+    def _digest(self, rel_path):
+        """文件的内容哈希；无法读取（无权限、扫描之后被删除等）时返回 None"""
+        path = os.path.join(self.root_dir, rel_path)
+        try:
+            return file_digest(path)
+        except OSError as e:
+            print(f"无法读取文件 {path}: {e}")
+            return None
+
+    def digests(self, paths):
+        """
+        返回 {相对路径: 内容哈希}，缺少哈希的文件多线程计算后写回索引；
+        无法读取的文件哈希为 None，不写回索引，下次运行重新计算。
+        """
+        missing = [p for p in paths if self.files[p][2] is None]
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                computed = list(pool.map(self._digest, missing))
+            racy = time.time_ns() - RACY_SECONDS * 10 ** 9
+            rows = []
+            for path, digest in zip(missing, computed):
+                if digest is None:
+                    continue
+                size, mtime_ns, _ = self.files[path]
+                self.files[path] = (size, mtime_ns, digest)
+                if mtime_ns < racy:
+                    rows.append((digest, path, size, mtime_ns))
+            with self.db:
+                self.db.executemany("UPDATE files SET digest = ? "
+                                    "WHERE path = ? AND size = ? AND mtime_ns = ?", rows)
+        return {p: self.files[p][2] for p in paths}
+
+
+def compare_trees(folder1, folder2, index_dir=None, workers=8):
+    """
+    按相对路径比较两棵目录树，返回
+    {'identical': [...], 'different': [...], 'unreadable': [...], 'only_a': [...], 'only_b': [...]}
+    （各为排好序的相对路径）。大小不同的文件直接判为不同，大小相同的才比较内容哈希；
+    大小相同但其中一边无法读取的文件归入 unreadable。
+    """
+    with TreeIndex(folder1, default_index_path(folder1, index_dir), workers) as a, \
+            TreeIndex(folder2, default_index_path(folder2, index_dir), workers) as b:
+        files_a, files_b = a.refresh(), b.refresh()
+        common = files_a.keys() & files_b.keys()
+        same_size = [p for p in common if files_a[p][0] == files_b[p][0]]
+        digests_a, digests_b = a.digests(same_size), b.digests(same_size)
+    unreadable = {p for p in same_size if digests_a[p] is None or digests_b[p] is None}
+    identical = {p for p in same_size if p not in unreadable and digests_a[p] == digests_b[p]}
+    return {
+        'identical': sorted(identical),
+        'different': sorted(common - identical - unreadable),
+        'unreadable': sorted(unreadable),
+        'only_a': sorted(files_a.keys() - files_b.keys()),
+        'only_b': sorted(files_b.keys() - files_a.keys()),
+    }
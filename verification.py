@@ -1,12 +1,13 @@
+import argparse
 import os
 
+from tree_index import compare_trees, scan_tree
+
 
 def get_all_files_with_relative_paths(root_dir):
     file_dict = {}
-    for dirpath, _, filenames in os.walk(root_dir):
-        for filename in filenames:
-            rel_path = os.path.relpath(os.path.join(dirpath, filename), root_dir)
-            file_dict[rel_path] = os.path.join(dirpath, filename)
+    for rel_path in scan_tree(root_dir):
+        file_dict[os.path.normpath(rel_path)] = os.path.join(root_dir, rel_path)
     return file_dict
 
 
@@ -19,15 +20,27 @@ def find_duplicate_files(folder1, folder2):
     return [(file, files1[file], files2[file]) for file in duplicates]
 
 
-if __name__ == "__main__":
-    folder1 = "data/h"  # 修改为你的文件夹路径
-    folder2 = "data/hh"  # 修改为你的文件夹路径
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="按相对路径比较两个文件夹：内容相同 / 内容不同 / 只在其中一个文件夹中")
+    parser.add_argument('folder1', nargs='?', default="data/h", help="第一个文件夹路径")
+    parser.add_argument('folder2', nargs='?', default="data/hh", help="第二个文件夹路径")
+    parser.add_argument('--index-dir', default=None,
+                        help="索引（SQLite）保存目录，默认为 ~/.cache/tree_index")
+    parser.add_argument('--workers', type=int, default=8, help="扫描目录和计算哈希的线程数")
+    parser.add_argument('--list', action='store_true', help="列出每一类的全部文件")
+    args = parser.parse_args()
+
+    report = compare_trees(args.folder1, args.folder2, args.index_dir, args.workers)
+    titles = {'identical': "内容相同", 'different': "内容不同", 'unreadable': "无法读取",
+              'only_a': f"只在 {args.folder1} 中", 'only_b': f"只在 {args.folder2} 中"}
+    for key, title in titles.items():
+        print(f"{title}: {len(report[key])} 个文件")
+        if args.list or key in ('different', 'unreadable'):
+            for rel_path in report[key]:
+                print(f"  {rel_path}")
 
-    duplicate_files = find_duplicate_files(folder1, folder2)
 
-    if duplicate_files:
-        print("Duplicate files found:")
-        for rel_path, path1, path2 in duplicate_files:
-            print(f"{rel_path}\n  Folder1: {path1}\n  Folder2: {path2}\n")
-    else:
-        print("No duplicate files found.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,20 @@
+import argparse
 import os
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # 只保存图片，不打开窗口；多进程渲染时子进程也不依赖显示环境
 import matplotlib.pyplot as plt
+from matplotlib.colors import to_rgb
 from decimal import Decimal
 
+from build_manifest import Manifest
+from directory_runner import add_force_argument, add_jobs_argument, run_tasks, walk_files
+from instrumentation import timed
+from normal_sanitizer import report_rejected, sanitize_normals
+from point_cloud_io import (XYZ_NORMAL_LABEL, canonical_decimal, join_columns, load_array,
+                            map_unique, read_point_cloud, report_bad_lines, report_bad_rows,
+                            write_bytes)
+
 
 def process_line(line):
     """
@@ -36,41 +48,116 @@ def process_line(line):
         return None
 
 
-def process_file_txt(input_file_path, processed_file_path):
+def process_file_txt(input_file_path, processed_file_path=None):
     """
     对单个 txt 文件做预处理（例如处理法向量归一化等），
-    将处理后的数据写入 processed_file_path。
+    返回处理后的 (N, 7) float 数组，数值与把结果写出再读回完全相同；
+    给定 processed_file_path 时同时写出处理后的 txt。
     """
-    with open(input_file_path, 'r') as infile:
-        lines = infile.readlines()
-    new_lines = [process_line(line) for line in lines]
-    # 过滤掉处理失败的行
-    new_lines = [line for line in new_lines if line is not None]
-    os.makedirs(os.path.dirname(processed_file_path), exist_ok=True)
-    with open(processed_file_path, 'w') as outfile:
-        outfile.writelines(new_lines)
-    return processed_file_path
+    cloud = read_point_cloud(input_file_path, XYZ_NORMAL_LABEL)
+    report_bad_rows(input_file_path, cloud)  # 列数不符的行直接丢弃
+
+    # 整块检查并归一化法向量，过滤掉处理失败的行
+    normalized, keep, counts = sanitize_normals(cloud.values('nx', 'ny', 'nz'))
+    report_rejected(input_file_path, counts)
+    labels = map_unique(cloud.tokens('label')[keep],
+                        lambda t: f"{Decimal(float(t)):.6f}".encode())
+
+    # 坐标的值不受 Decimal 规范写法影响；标签按写出的 6 位小数取值
+    data = np.empty((len(normalized), 7))
+    data[:, :3] = cloud.values('x', 'y', 'z')[keep]
+    data[:, 3:6] = normalized
+    data[:, 6] = labels.astype(np.float64)
+
+    if processed_file_path is not None:
+        columns = [canonical_decimal(cloud.tokens(name)[keep]) for name in ('x', 'y', 'z')]
+        columns += [normalized[:, j].astype('S32') for j in range(3)]
+        columns.append(labels)
+        write_bytes(processed_file_path, join_columns(columns))
+    return data
 
 
 def load_point_cloud(file_path):
     """
-    加载点云数据，返回 numpy 数组，数据类型为 float。
+    加载点云数据，返回 (N, 7) 的 float 数组。
     假定每行数据格式为：x y z nx ny nz label
     """
-    data = np.loadtxt(file_path)
-    if data.ndim == 1:
-        # 只有一行数据
-        data = data.reshape(1, -1)
+    data, bad_lines = load_array(file_path, XYZ_NORMAL_LABEL)
+    report_bad_lines(file_path, bad_lines, len(XYZ_NORMAL_LABEL))
     return data
 
 
-def visualize_point_cloud(data, output_image_path):
+# 各标签的颜色
+LABEL_COLORS = {1: 'blue', 2: 'green', 3: 'red'}
+POINT_SIZE = 1      # 散点大小（scatter 的 s，单位为 points^2）
+POINT_ALPHA = 0.3   # 每个点的透明度
+RENDER_MODES = ('scatter', 'raster')
+
+
+def _panel_limits(u, v, margin=0.05):
+    """与 scatter 自动缩放相同的坐标范围：数据范围两侧各留 5%"""
+    limits = []
+    for values in (u, v):
+        lo, hi = (float(values.min()), float(values.max())) if len(values) else (0.0, 1.0)
+        pad = (hi - lo) * margin or 0.5
+        limits.append((lo - pad, hi + pad))
+    return limits
+
+
+def rasterize_panel(u, v, labels, limits, shape):
+    """
+    把投影后的点按标签分别统计到 shape=(行, 列) 的二维直方图，再做 alpha 混合：
+    一个格子里共有 k 个点时不透明度为 1-(1-alpha)^k，与逐点叠加 scatter 的效果相同；
+    各标签的点在文件中交错出现，颜色取格子内各标签颜色按点数的加权平均。
+    返回可直接 imshow 的 RGBA 浮点图像（第 0 行对应 v 的最小值）。
+    """
+    (u0, u1), (v0, v1) = limits
+    rows, cols = shape
+    iu = np.clip(((u - u0) / (u1 - u0) * cols).astype(np.intp), 0, cols - 1)
+    iv = np.clip(((v - v0) / (v1 - v0) * rows).astype(np.intp), 0, rows - 1)
+    cell = iv * cols + iu
+
+    rgb = np.zeros((rows * cols, 3))
+    total = np.zeros(rows * cols)
+    for label, color in LABEL_COLORS.items():
+        counts = np.bincount(cell[labels == label], minlength=rows * cols)
+        rgb += np.outer(counts, to_rgb(color))
+        total += counts
+    image = np.zeros((rows * cols, 4))
+    covered = total > 0
+    image[covered, :3] = rgb[covered] / total[covered, None]
+    image[:, 3] = 1 - (1 - POINT_ALPHA) ** total
+    return image.reshape(rows, cols, 4)
+
+
+_figure = None
+
+
+def _figure_axes():
+    """每个进程只创建一次画布，之后的文件清空三个子图后复用，省去反复创建和销毁 figure"""
+    global _figure
+    if _figure is None:
+        _figure = plt.subplots(1, 3, figsize=(18, 6))  # 3列
+    fig, axes = _figure
+    # 恢复默认边距和子图位置，上一个文件的 tight_layout 和等比例调整不影响这次的布局
+    fig.subplots_adjust(**{name: plt.rcParams[f'figure.subplot.{name}']
+                           for name in ('left', 'right', 'bottom', 'top', 'wspace', 'hspace')})
+    for ax in axes:
+        ax.clear()
+        ax.set_position(ax.get_subplotspec().get_position(fig))
+    return fig, axes
+
+
+@timed('render')
+def visualize_point_cloud(data, output_image_path, render='scatter', dpi=600):
     """
     可视化点云：
       - 左图显示 y > 0 的点（从 +Y 投影到 xz 平面）
       - 中图显示 y <= 0 的点（从 -Y 投影到 xz 平面）
       - 右图显示 x <= 0 的点（从 +X 投影到 yz 平面）
       - 标签为3的点放大显示
+    render='raster' 时不逐点绘制散点，而是按输出分辨率把点统计成每个标签的二维直方图
+    再合成为一张图像，耗时基本与点数无关；格子大小取一个散点的大小，外观与 scatter 相同。
     """
     # 提取字段
     x = data[:, 0]
@@ -89,99 +176,133 @@ def visualize_point_cloud(data, output_image_path):
         labels_sub = labels[mask]
 
         # 点大小
-        sizes = np.full_like(labels_sub, 1, dtype=float)
+        sizes = np.full_like(labels_sub, POINT_SIZE, dtype=float)
         # sizes[labels_sub == 3] = 5
 
         # 点颜色
         colors = np.empty(labels_sub.shape, dtype=object)
-        colors[labels_sub == 1] = 'blue'
-        colors[labels_sub == 2] = 'green'
-        colors[labels_sub == 3] = 'red'
+        for label, color in LABEL_COLORS.items():
+            colors[labels_sub == label] = color
 
         # 点透明度
-        alphas = np.full_like(labels_sub, 0.3, dtype=float)  # 默认较透明
+        alphas = np.full_like(labels_sub, POINT_ALPHA, dtype=float)  # 默认较透明
         # alphas[labels_sub == 3] = 1.0  # 标签为3的不透明
 
         return axis1_vals, axis2_vals, sizes, colors, alphas
 
-    # 获取每个图的数据
-    x1, z1, sizes1, colors1, alphas1 = get_plot_data(mask_pos_y, x, z)
-    x2, z2, sizes2, colors2, alphas2 = get_plot_data(mask_neg_y, x, z)
-    y3, z3, sizes3, colors3, alphas3 = get_plot_data(mask_neg_x, y, z)
+    panels = [
+        (mask_pos_y, x, z, "Y > 0 (Projection to XZ)", "X"),   # 图 1：Y > 0
+        (mask_neg_y, x, z, "Y <= 0 (Projection to XZ)", "X"),  # 图 2：Y <= 0
+        (mask_neg_x, y, z, "X <= 0 (Projection to YZ)", "Y"),  # 图 3：X <= 0
+    ]
     # 开始绘图
-    fig, axes = plt.subplots(1, 3, figsize=(18, 6))  # 3列
-
-    # 图 1：Y > 0
-    axes[0].scatter(x1, z1, s=sizes1, c=colors1, alpha=alphas1)
-    axes[0].set_title("Y > 0 (Projection to XZ)")
-    axes[0].set_xlabel("X")
-    axes[0].set_ylabel("Z")
-    axes[0].grid(True)
-    axes[0].set_aspect('equal')
-
-    # 图 2：Y <= 0
-    axes[1].scatter(x2, z2, s=sizes2, c=colors2, alpha=alphas2)
-    axes[1].set_title("Y <= 0 (Projection to XZ)")
-    axes[1].set_xlabel("X")
-    axes[1].set_ylabel("Z")
-    axes[1].grid(True)
-    axes[1].set_aspect('equal')
-
-    # 图 3：X <= 0
-    axes[2].scatter(y3, z3, s=sizes3, c=colors3, alpha=alphas3)
-    axes[2].set_title("X <= 0 (Projection to YZ)")
-    axes[2].set_xlabel("Y")
-    axes[2].set_ylabel("Z")
-    axes[2].grid(True)
-    axes[2].set_aspect('equal')
-
-    plt.tight_layout()
+    fig, axes = _figure_axes()
+
+    for ax, (mask, axis1, axis2, title, xlabel) in zip(axes, panels):
+        if render == 'scatter':
+            u, v, sizes, colors, alphas = get_plot_data(mask, axis1, axis2)
+            ax.scatter(u, v, s=sizes, c=colors, alpha=alphas)
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel("Z")
+        ax.grid(True)
+        ax.set_aspect('equal')
+        if render == 'raster':
+            xlim, ylim = _panel_limits(axis1[mask], axis2[mask])
+            ax.set_xlim(xlim)
+            ax.set_ylim(ylim)
+
+    fig.tight_layout()
+    if render == 'raster':
+        # 布局确定后才知道每个子图在输出图片中的像素大小；
+        # 散点直径含描边宽度，格子取与圆点面积相同的正方形
+        diameter = np.sqrt(POINT_SIZE) + plt.rcParams['lines.linewidth']
+        point_px = diameter * np.sqrt(np.pi) / 2 * dpi / 72
+        for ax, (mask, axis1, axis2, _, _) in zip(axes, panels):
+            ax.apply_aspect()
+            box = ax.get_position()
+            width, height = fig.get_size_inches() * dpi * (box.width, box.height)
+            shape = (max(1, int(height / point_px)), max(1, int(width / point_px)))
+            limits = (ax.get_xlim(), ax.get_ylim())
+            image = rasterize_panel(axis1[mask], axis2[mask], labels[mask], limits, shape)
+            ax.imshow(image, origin='lower', extent=(*limits[0], *limits[1]),
+                      interpolation='nearest', aspect='equal')
+            ax.set_xlim(limits[0])
+            ax.set_ylim(limits[1])
     os.makedirs(os.path.dirname(output_image_path), exist_ok=True)
-    plt.savefig(output_image_path, dpi=600)
-    plt.close(fig)
+    fig.savefig(output_image_path, dpi=dpi)
     print(f"Saved visualization to {output_image_path}")
 
 
-def process_directory(input_dir, processed_dir, output_image_dir):
+def process_and_visualize(input_file_path, processed_file_path, output_image_path,
+                          render='scatter'):
+    """
+    预处理单个 txt 文件并可视化保存为 jpg，返回点数。
+    直接用内存中的处理结果绘图，processed_file_path 为 None 时不写出处理后的 txt。
+    """
+    print(f"Processing file: {input_file_path}")
+    # 对 txt 文件进行预处理
+    data = process_file_txt(input_file_path, processed_file_path)
+    # 对点云数据进行可视化，并保存 jpg
+    visualize_point_cloud(data, output_image_path, render)
+    return len(data)
+
+
+def process_directory(input_dir, processed_dir, output_image_dir, jobs=1, force=False,
+                      render='scatter'):
     """
     递归遍历 input_dir 中所有 txt 文件：
       1. 对每个 txt 文件预处理（归一化法向量）
       2. 加载处理后的点云数据并可视化保存为 jpg
     对应的输出文件会放到 processed_dir（处理后的 txt 文件）和 output_image_dir（jpg文件），
-    同时保持相对目录结构。
+    同时保持相对目录结构。processed_dir 为 None 时只生成图片。
+    jobs > 1 时多进程渲染，每个进程复用同一个画布。
     """
-    for root, dirs, files in os.walk(input_dir):
-        for file in files:
-            if file.endswith('.txt'):
-                input_file_path = os.path.join(root, file)
-
-                # 生成预处理 txt 文件路径
-                relative_path = os.path.relpath(input_file_path, input_dir)
-                processed_file_path = os.path.join(processed_dir, relative_path)
-
-                # 生成输出图片的路径，扩展名改为 jpg
-                output_image_path = os.path.join(output_image_dir, os.path.splitext(relative_path)[0] + ".jpg")
-
-                print(f"Processing file: {input_file_path}")
-                # 对 txt 文件进行预处理
-                proc_file = process_file_txt(input_file_path, processed_file_path)
-                # 加载点云数据
-                try:
-                    data = load_point_cloud(proc_file)
-                except Exception as e:
-                    print(f"Error loading {proc_file}: {e}")
-                    continue
-                # 对点云数据进行可视化，并保存 jpg
-                visualize_point_cloud(data, output_image_path)
+    tasks = []
+    for input_file_path in walk_files(input_dir, '.txt'):
+        # 生成预处理 txt 文件路径
+        relative_path = os.path.relpath(input_file_path, input_dir)
+        processed_file_path = None
+        if processed_dir is not None:
+            processed_file_path = os.path.join(processed_dir, relative_path)
 
+        # 生成输出图片的路径，扩展名改为 jpg
+        output_image_path = os.path.join(output_image_dir, os.path.splitext(relative_path)[0] + ".jpg")
+        outputs = [output_image_path]
+        if processed_file_path is not None:
+            outputs.append(processed_file_path)
+        tasks.append((input_file_path,
+                      (input_file_path, processed_file_path, output_image_path, render),
+                      outputs))
+    # 处理记录保存在图片目录
+    return run_tasks(process_and_visualize, tasks, jobs,
+                     Manifest(output_image_dir, {'render': render}, force))
 
-if __name__ == "__main__":
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="预处理点云并生成三视图投影图片")
     # 输入包含原始 txt 文件的根目录（可包含嵌套子文件夹）
-    input_directory = "data"
+    parser.add_argument('input_dir', nargs='?', default="data", help="原始 txt 文件根目录")
     # 预处理后的 txt 文件保存目录（你可以选择是否保留预处理结果）
-    processed_directory = "data_output/output_txt"
+    parser.add_argument('processed_dir', nargs='?', default="data_output/output_txt",
+                        help="预处理后的 txt 文件保存目录")
     # 可视化图片保存的目录（jpg 格式）
-    output_image_directory = "data_output/output_images"
+    parser.add_argument('image_dir', nargs='?', default="data_output/output_images",
+                        help="可视化图片保存目录")
+    parser.add_argument('--no-txt', action='store_true',
+                        help="不写出预处理后的 txt，只生成图片")
+    parser.add_argument('--render', choices=RENDER_MODES, default='scatter',
+                        help="scatter 逐点绘制；raster 先统计成二维直方图再合成图像，适合大点云")
+    add_jobs_argument(parser)
+    add_force_argument(parser)
+    args = parser.parse_args()
 
-    process_directory(input_directory, processed_directory, output_image_directory)
-    print("所有文件处理并可视化完成！")
\ No newline at end of file
+    processed_dir = None if args.no_txt else args.processed_dir
+    process_directory(args.input_dir, processed_dir, args.image_dir, args.jobs, args.force,
+                      args.render)
+    print("所有文件处理并可视化完成！")
+
+
+if __name__ == "__main__":
+    main()